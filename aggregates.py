@@ -0,0 +1,141 @@
+# セット履歴の集計値(メニュー別・部位別 × 日・週・月・全期間)
+# 記録のたびに該当する集計値だけを更新し(1セットあたり一定回数の辞書操作)，
+# 「今週の背中のボリューム」のような問い合わせで履歴全体を走査しないようにする
+# menu.txtでメニューの部位が変わった場合はrebuild()で作り直す
+
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from menu_manager import MenuManager
+from set_log import SetRow
+
+# 集計の単位
+SCOPE_MENU = "menu"
+SCOPE_TARGET = "target"
+# 集計の期間
+PERIOD_DAY = "day"
+PERIOD_WEEK = "week"
+PERIOD_MONTH = "month"
+PERIOD_ALL = "all"
+PERIODS = (PERIOD_DAY, PERIOD_WEEK, PERIOD_MONTH, PERIOD_ALL)
+
+
+@dataclass
+class Aggregate:
+    """1つの集計値(セット数・合計・最大値)を保持するデータクラス"""
+    count: int = 0
+    # ボリューム(A×B)とパラメータごとの合計
+    volume: float = 0.0
+    sum_a: float = 0.0
+    sum_b: float = 0.0
+    # 期間内の最高記録(全期間の場合はその時点までの最高記録)
+    max_a: float = 0.0
+    max_b: float = 0.0
+
+    def add(self, a: float, b: float) -> None:
+        """1セット分を加える"""
+        self.count += 1
+        self.volume += a * b
+        self.sum_a += a
+        self.sum_b += b
+        if a > self.max_a:
+            self.max_a = a
+        if b > self.max_b:
+            self.max_b = b
+
+
+def bucket_keys(timestamp: float) -> Tuple[str, str, str]:
+    """時刻が属する日・週(月曜始まり)・月の区切りを (YYYY-MM-DD, 週の月曜日, YYYY-MM) で返す"""
+    day = date.fromtimestamp(timestamp)
+    monday = day - timedelta(days=day.weekday())
+    return day.isoformat(), monday.isoformat(), day.strftime("%Y-%m")
+
+
+class HistoryAggregates:
+    """メニュー別・部位別の期間ごとの集計値を保持するクラス"""
+    # 区切りの計算結果をキャッシュする時間の単位(秒)．30分単位の時差まで正しく扱える
+    BUCKET_RESOLUTION = 1800
+
+    def __init__(self, menu_manager: Optional[MenuManager] = None):
+        """空の集計値を作成"""
+        self.menu_manager = menu_manager or MenuManager.shared()
+        # (単位, メニュー名または部位, 期間) -> {区切り: 集計値}
+        self.buckets: Dict[Tuple[str, str, str], Dict[str, Aggregate]] = {}
+        # 集計したメニューと，そのときの部位
+        self.targets: Dict[str, str] = {}
+        # 集計したセット数
+        self.rows = 0
+        self._bucket_cache: Dict[int, Tuple[str, str, str]] = {}
+
+    def _buckets_of(self, timestamp: float) -> Tuple[str, str, str]:
+        """時刻が属する区切り(同じ30分の間は計算結果を使い回す)"""
+        slot = int(timestamp // self.BUCKET_RESOLUTION)
+        keys = self._bucket_cache.get(slot)
+        if keys is None:
+            keys = self._bucket_cache[slot] = bucket_keys(timestamp)
+        return keys
+
+    def _target_of(self, menu_name: str) -> str:
+        """メニューの部位(menu.txtから削除されたメニューは空文字)"""
+        target = self.targets.get(menu_name)
+        if target is None:
+            menu = self.menu_manager.get_menu(menu_name)
+            target = self.targets[menu_name] = menu.target if menu else ""
+        return target
+
+    def add(self, timestamp: float, menu_name: str, a: float, b: float) -> None:
+        """1セット分を該当する集計値へ加える"""
+        day, week, month = self._buckets_of(timestamp)
+        target = self._target_of(menu_name)
+        for scope, key in ((SCOPE_MENU, menu_name), (SCOPE_TARGET, target)):
+            for period, bucket in ((PERIOD_DAY, day), (PERIOD_WEEK, week), (PERIOD_MONTH, month), (PERIOD_ALL, "")):
+                series = self.buckets.get((scope, key, period))
+                if series is None:
+                    series = self.buckets[(scope, key, period)] = {}
+                aggregate = series.get(bucket)
+                if aggregate is None:
+                    aggregate = series[bucket] = Aggregate()
+                aggregate.add(a, b)
+        self.rows += 1
+
+    def rebuild(self, rows: Iterable[SetRow]) -> None:
+        """全セットから集計し直す"""
+        self.buckets.clear()
+        self.targets.clear()
+        self.rows = 0
+        for timestamp, menu_name, a, b in rows:
+            self.add(timestamp, menu_name, a, b)
+
+    def targets_changed(self) -> bool:
+        """集計したメニューの部位がmenu.txtと食い違っているか"""
+        for menu_name, target in self.targets.items():
+            menu = self.menu_manager.get_menu(menu_name)
+            if (menu.target if menu else "") != target:
+                return True
+        return False
+
+    def get(self, scope: str, key: str, period: str = PERIOD_ALL, when: Optional[float] = None) -> Aggregate:
+        """指定した時刻(省略時は現在)を含む期間の集計値を返す(記録が無ければ空の集計値)"""
+        if period not in PERIODS:
+            raise ValueError(f"不正な期間です: {period}")
+        series = self.buckets.get((scope, key, period))
+        if not series:
+            return Aggregate()
+        if period == PERIOD_ALL:
+            bucket = ""
+        else:
+            bucket = self._buckets_of(time.time() if when is None else when)[PERIODS.index(period)]
+        return series.get(bucket) or Aggregate()
+
+    def series(self, scope: str, key: str, period: str) -> Dict[str, Aggregate]:
+        """期間の区切りごとの集計値を古い順に返す"""
+        return dict(sorted(self.buckets.get((scope, key, period), {}).items()))
+
+    def menu(self, menu_name: str, period: str = PERIOD_ALL, when: Optional[float] = None) -> Aggregate:
+        """メニューの集計値"""
+        return self.get(SCOPE_MENU, menu_name, period, when)
+
+    def target(self, target: str, period: str = PERIOD_ALL, when: Optional[float] = None) -> Aggregate:
+        """部位の集計値"""
+        return self.get(SCOPE_TARGET, target, period, when)
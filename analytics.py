@@ -0,0 +1,249 @@
+# トレーニング履歴の分析(NumPyによる一括計算)
+# セット履歴を列ごとの配列(時刻・メニュー・パラメータA・パラメータB・ユーザー)に読み込み，
+# 推定1RM・セットごとのボリューム・部位ごとの週間ボリューム・推移の傾きを
+# 1セットずつのPythonループを使わずに計算する
+# 複数のユーザー(履歴)の配列を連結すれば，全員分をまとめて1回で計算できる
+
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+from menu_manager import MenuManager
+from set_log import SetLog, SetRow
+
+DAY = 86400.0
+# 推定1RM・回数として扱うパラメータBの単位
+REP_UNITS = ("回",)
+# 推定1RMの計算式
+FORMULA_EPLEY = "epley"
+FORMULA_BRZYCKI = "brzycki"
+
+
+@dataclass
+class SetColumns:
+    """セット履歴を列ごとの配列で保持するデータクラス"""
+    timestamp: np.ndarray  # float64
+    menu: np.ndarray       # int64(menu_namesの位置)
+    a: np.ndarray          # float64
+    b: np.ndarray          # float64
+    user: np.ndarray       # int64(user_namesの位置)
+    menu_names: List[str]
+    user_names: List[str]
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    @classmethod
+    def from_set_log(cls, set_log: SetLog, user_name: str = "") -> "SetColumns":
+        """セットログの列をそのまま配列へ写す"""
+        # 同じメニュー名が複数のIDで登録されている場合があるため，名前ごとに1つのIDへまとめる
+        menu_names = list(dict.fromkeys(set_log.menu_names))
+        positions = {name: position for position, name in enumerate(menu_names)}
+        remap = np.array([positions[name] for name in set_log.menu_names], dtype=np.int64)
+
+        columns = set_log.columns
+        count = len(set_log)
+        # array.arrayのバッファを参照したままだと追記できなくなるため，コピーしておく
+        menu = np.frombuffer(columns["menu"], dtype=np.uint32, count=count)
+        return cls(
+            timestamp=np.frombuffer(columns["timestamp"], dtype=np.float64, count=count).copy(),
+            menu=remap[menu] if count else np.zeros(0, dtype=np.int64),
+            a=np.frombuffer(columns["a"], dtype=np.float64, count=count).copy(),
+            b=np.frombuffer(columns["b"], dtype=np.float64, count=count).copy(),
+            user=np.zeros(count, dtype=np.int64),
+            menu_names=menu_names,
+            user_names=[user_name]
+        )
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[SetRow], user_name: str = "") -> "SetColumns":
+        """(時刻, メニュー名, A, B) の並びから配列を作成"""
+        rows = list(rows)
+        positions: Dict[str, int] = {}
+        menu = np.fromiter(
+            (positions.setdefault(name, len(positions)) for _, name, _, _ in rows),
+            dtype=np.int64, count=len(rows)
+        )
+        return cls(
+            timestamp=np.fromiter((row[0] for row in rows), dtype=np.float64, count=len(rows)),
+            menu=menu,
+            a=np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows)),
+            b=np.fromiter((row[3] for row in rows), dtype=np.float64, count=len(rows)),
+            user=np.zeros(len(rows), dtype=np.int64),
+            menu_names=list(positions),
+            user_names=[user_name]
+        )
+
+    @classmethod
+    def from_history(cls, history, user_name: str = "") -> "SetColumns":
+        """TrainingHistoryのセット履歴から配列を作成"""
+        set_logs = getattr(history.storage, "set_logs", None)
+        if set_logs is not None:
+            # 封印済みのセグメントとホットなセットログを連結する
+            parts = [cls.from_set_log(set_log, user_name) for set_log in set_logs()]
+            return parts[0] if len(parts) == 1 else cls.concat(parts)
+        return cls.from_rows(history.iter_sets(), user_name)
+
+    @classmethod
+    def concat(cls, parts: Sequence["SetColumns"]) -> "SetColumns":
+        """複数のユーザーの配列を連結する(メニュー名・ユーザー名は通し番号に振り直す)"""
+        menu_positions: Dict[str, int] = {}
+        user_positions: Dict[str, int] = {}
+        menus, users = [], []
+        for part in parts:
+            remap = np.array(
+                [menu_positions.setdefault(name, len(menu_positions)) for name in part.menu_names],
+                dtype=np.int64
+            )
+            user_remap = np.array(
+                [user_positions.setdefault(name, len(user_positions)) for name in part.user_names],
+                dtype=np.int64
+            )
+            menus.append(remap[part.menu] if len(part) else part.menu)
+            users.append(user_remap[part.user] if len(part) else part.user)
+
+        def join(arrays: List[np.ndarray], dtype) -> np.ndarray:
+            return np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtype)
+
+        return cls(
+            timestamp=join([part.timestamp for part in parts], np.float64),
+            menu=join(menus, np.int64),
+            a=join([part.a for part in parts], np.float64),
+            b=join([part.b for part in parts], np.float64),
+            user=join(users, np.int64),
+            menu_names=list(menu_positions),
+            user_names=list(user_positions)
+        )
+
+
+@dataclass
+class WeeklyVolume:
+    """部位ごとの直近7日間のボリュームを日ごとに保持するデータクラス"""
+    user_names: List[str]
+    targets: List[str]
+    # 日の通し番号(エポックからの日数)
+    days: np.ndarray
+    # [ユーザー, 部位, 日] その日を含む直近7日間のボリュームの合計
+    values: np.ndarray
+
+
+def volume(columns: SetColumns) -> np.ndarray:
+    """セットごとのボリューム(A×B)"""
+    return columns.a * columns.b
+
+
+def one_rep_max(weight: np.ndarray, reps: np.ndarray, formula: str = FORMULA_EPLEY) -> np.ndarray:
+    """重量と回数から推定1RMを計算(1回の場合はその重量，計算できない場合はnan)"""
+    weight = np.asarray(weight, dtype=np.float64)
+    reps = np.asarray(reps, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if formula == FORMULA_EPLEY:
+            estimate = weight * (1.0 + reps / 30.0)
+        elif formula == FORMULA_BRZYCKI:
+            # 37回以上では式が成り立たない
+            estimate = np.where(reps < 37, weight * 36.0 / (37.0 - reps), np.nan)
+        else:
+            raise ValueError(f"不正な計算式です: {formula}")
+    estimate = np.where(reps == 1, weight, estimate)
+    return np.where(reps >= 1, estimate, np.nan)
+
+
+def rep_menu_mask(columns: SetColumns, menu_manager: Optional[MenuManager] = None) -> np.ndarray:
+    """セットごとに，パラメータBが回数のメニューかどうか"""
+    menu_manager = menu_manager or MenuManager.shared()
+    is_rep = np.array([
+        bool(menu) and menu.param_b.unit in REP_UNITS
+        for menu in map(menu_manager.get_menu, columns.menu_names)
+    ], dtype=bool)
+    return is_rep[columns.menu] if len(columns) else np.zeros(0, dtype=bool)
+
+
+def estimated_one_rep_max(
+    columns: SetColumns,
+    menu_manager: Optional[MenuManager] = None,
+    formula: str = FORMULA_EPLEY
+) -> np.ndarray:
+    """セットごとの推定1RM(回数のメニュー以外はnan)"""
+    estimate = one_rep_max(columns.a, columns.b, formula)
+    return np.where(rep_menu_mask(columns, menu_manager), estimate, np.nan)
+
+
+def local_days(timestamp: np.ndarray, utc_offset: Optional[float] = None) -> np.ndarray:
+    """時刻を現地時間の日の通し番号にする"""
+    if utc_offset is None:
+        utc_offset = -time.timezone
+    return np.floor((timestamp + utc_offset) / DAY).astype(np.int64)
+
+
+def weekly_volume(
+    columns: SetColumns,
+    menu_manager: Optional[MenuManager] = None,
+    window: int = 7,
+    utc_offset: Optional[float] = None
+) -> WeeklyVolume:
+    """部位(MenuConfig.target)ごとに，各日を含む直近window日間のボリュームを計算"""
+    menu_manager = menu_manager or MenuManager.shared()
+    # メニューの位置から部位の位置への対応表(menu.txtから削除されたメニューは空文字の部位にまとめる)
+    target_positions: Dict[str, int] = {}
+    menu_targets = np.array([
+        target_positions.setdefault(menu.target if menu else "", len(target_positions))
+        for menu in map(menu_manager.get_menu, columns.menu_names)
+    ], dtype=np.int64)
+    targets = list(target_positions)
+    user_count = len(columns.user_names)
+
+    if not len(columns):
+        return WeeklyVolume(
+            columns.user_names, targets, np.zeros(0, dtype=np.int64),
+            np.zeros((user_count, len(targets), 0))
+        )
+
+    days = local_days(columns.timestamp, utc_offset)
+    first_day = int(days.min())
+    day_count = int(days.max()) - first_day + 1
+
+    # (ユーザー, 部位, 日)を1つの番号にして日ごとの合計を求める
+    groups = (columns.user * len(targets) + menu_targets[columns.menu]) * day_count + (days - first_day)
+    daily = np.bincount(groups, weights=volume(columns), minlength=user_count * len(targets) * day_count)
+    daily = daily.reshape(user_count, len(targets), day_count)
+
+    # 累積和の差でwindow日間の合計を求める
+    cumulative = np.cumsum(daily, axis=2)
+    rolling = cumulative.copy()
+    rolling[:, :, window:] -= cumulative[:, :, :-window]
+    return WeeklyVolume(
+        columns.user_names, targets,
+        np.arange(first_day, first_day + day_count, dtype=np.int64),
+        rolling
+    )
+
+
+def trend_slopes(columns: SetColumns, values: Optional[np.ndarray] = None) -> np.ndarray:
+    """ユーザー・メニューごとの値の推移の傾き(1日あたりの変化量)を最小二乗法で計算
+
+    valuesを省略した場合はパラメータAの推移を使う。
+    戻り値は[ユーザー, メニュー]の配列で，2セット未満または同じ時刻だけの場合はnan。
+    """
+    if values is None:
+        values = columns.a
+    user_count = len(columns.user_names)
+    menu_count = len(columns.menu_names)
+    size = user_count * menu_count
+
+    # nan(計算できなかった推定1RMなど)は除く
+    valid = ~np.isnan(values)
+    groups = (columns.user * menu_count + columns.menu)[valid]
+    x = columns.timestamp[valid] / DAY
+    y = values[valid]
+
+    count = np.bincount(groups, minlength=size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 桁落ちを避けるため，グループごとの平均を引いてから積和を求める
+        mean_x = np.bincount(groups, weights=x, minlength=size) / count
+        mean_y = np.bincount(groups, weights=y, minlength=size) / count
+        dx = x - mean_x[groups]
+        dy = y - mean_y[groups]
+        sxx = np.bincount(groups, weights=dx * dx, minlength=size)
+        sxy = np.bincount(groups, weights=dx * dy, minlength=size)
+        slopes = np.where((count >= 2) & (sxx > 0), sxy / sxx, np.nan)
+    return slopes.reshape(user_count, menu_count)
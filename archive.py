@@ -0,0 +1,311 @@
+# 封印済みのセット履歴(月ごとのセグメント)
+# 1セットごとの記録は追記を受け付けるホットなセットログ(set_log.py)へ書き込み，月が変わった後のコンパクションで
+# 前月以前の行を月ごとのセグメントへ移して封印する(JsonStorage._seal())
+# セグメントは時刻順に並べた列をzlib(またはlzma)で圧縮した読み取り専用のファイルで，
+# マニフェスト(manifest.json)にセグメントごとの件数・最小/最大時刻・メニューごとの最高記録を持つ
+# 期間やメニューで絞り込む読み込みはマニフェストで該当しないセグメントを飛ばし，必要なセグメントだけを展開する
+# 現在の最終・最高記録はスナップショットとホットなセットログから求めるため，起動時に読むのはマニフェストだけ
+#
+# マニフェストの置き換えが封印の確定点で，ホットなセットログも同時に新しい世代のディレクトリへ切り替える
+# (置き換える前に落ちた場合は書きかけのセグメントとディレクトリが残るだけで，次の封印で上書きされる)
+# セグメントは1か月につき1つで，ファイル名には封印したときの世代を付ける("YYYY-MM.<世代>")
+# 封印済みの月へさらに封印する場合は，その月のセグメントを新しい世代のファイルへ書き直し，
+# マニフェストを置き換えた後に古いファイルを削除する
+# セグメントは各セットの追記順の位置(JsonStorage.set_position())の列も持ち，同期で前回以降に追記したセットを求められる
+# (位置の列が無いセグメントの位置は0とみなす)
+
+import os
+import json
+import bisect
+import marshal
+import time
+import zlib
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from set_log import SetLog, SetRow
+
+# (時刻, メニュー名, パラメータA, パラメータB, 追記順の位置)
+PositionedRow = Tuple[float, str, float, float, int]
+
+# 圧縮形式 -> 拡張子
+CODECS = {"zlib": ".zlib", "lzma": ".xz"}
+
+
+def month_of(timestamp: float) -> str:
+    """時刻が属する月("YYYY-MM"，ローカル時刻)"""
+    return time.strftime("%Y-%m", time.localtime(timestamp))
+
+
+def month_start(timestamp: Optional[float] = None) -> float:
+    """時刻(省略時は現在)が属する月の初日0時の時刻"""
+    now = time.localtime(timestamp)
+    return time.mktime((now.tm_year, now.tm_mon, 1, 0, 0, 0, 0, 0, -1))
+
+
+def compress(data: bytes, codec: str, level: int) -> bytes:
+    """データを圧縮する"""
+    if codec == "lzma":
+        # lzmaは封印時と展開時にだけ使うため，必要になってから読み込む
+        import lzma
+        return lzma.compress(data, preset=level)
+    return zlib.compress(data, level)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """compress()の逆"""
+    if codec == "lzma":
+        import lzma
+        return lzma.decompress(data)
+    return zlib.decompress(data)
+
+
+@dataclass(frozen=True, slots=True)
+class Segment:
+    """封印済みのセグメント1つ分のマニフェストの項目"""
+    name: str
+    file: str
+    codec: str
+    rows: int
+    min_ts: float
+    max_ts: float
+    # メニュー名 -> (best_a, best_b)
+    bests: Dict[str, Tuple[float, float]]
+    # セットの追記順の位置の最大値
+    max_position: int = 0
+
+    def overlaps(self, since: Optional[float], until: Optional[float]) -> bool:
+        """[since, until)の期間のセットを含みうるか"""
+        return (since is None or self.max_ts >= since) and (until is None or self.min_ts < until)
+
+    def to_json(self) -> Dict:
+        """マニフェストに書き込む形式"""
+        return {
+            "name": self.name,
+            "file": self.file,
+            "codec": self.codec,
+            "rows": self.rows,
+            "min_ts": self.min_ts,
+            "max_ts": self.max_ts,
+            "bests": {menu_name: list(best) for menu_name, best in self.bests.items()},
+            "max_position": self.max_position
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "Segment":
+        """to_json()の逆"""
+        return cls(
+            name=data["name"],
+            file=data["file"],
+            codec=data["codec"],
+            rows=data["rows"],
+            min_ts=data["min_ts"],
+            max_ts=data["max_ts"],
+            bests={menu_name: (best[0], best[1]) for menu_name, best in data["bests"].items()},
+            max_position=data.get("max_position", 0)
+        )
+
+
+class SegmentArchive:
+    """封印済みのセグメントとマニフェストを管理するクラス"""
+    MANIFEST_NAME = "manifest.json"
+    FORMAT_VERSION = 1
+    # 封印時の圧縮形式("zlib" / "lzma")と圧縮レベル
+    CODEC = "zlib"
+    COMPRESS_LEVEL = 6
+
+    def __init__(self, directory: str):
+        """マニフェストを読み込む(セグメント自体は読み込まない)"""
+        self.directory = directory
+        self.segments: List[Segment] = []
+        # ホットなセットログの世代と，封印時にホットなセットログへ残した(スナップショットに反映済みの)行数，
+        # ホットなセットログの先頭の行の追記順の位置
+        self.hot_epoch = 0
+        self.hot_checkpoint = 0
+        self.hot_base = 0
+        self._file_key: Optional[Tuple[int, int]] = None
+        self._load()
+
+    def _manifest_path(self) -> str:
+        """マニフェストのパス"""
+        return os.path.join(self.directory, self.MANIFEST_NAME)
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        """マニフェストの(更新日時, サイズ)．無ければNone"""
+        try:
+            stat = os.stat(self._manifest_path())
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> None:
+        """マニフェストを読み込む"""
+        self._file_key = self._stat()
+        if self._file_key is None:
+            return
+        with open(self._manifest_path(), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != self.FORMAT_VERSION:
+            raise ValueError(f"未対応のマニフェストの形式です: {data.get('version')}")
+        self.segments = [Segment.from_json(segment) for segment in data["segments"]]
+        self.hot_epoch = data["hot_epoch"]
+        self.hot_checkpoint = data["hot_checkpoint"]
+        self.hot_base = data.get("hot_base", 0)
+
+    def has_changes(self) -> bool:
+        """他のプロセスが封印したか"""
+        return self._stat() != self._file_key
+
+    def refresh(self) -> bool:
+        """他のプロセスが封印していればマニフェストを読み直す(読み直した場合はTrue)"""
+        if not self.has_changes():
+            return False
+        self._load()
+        return True
+
+    def row_count(self) -> int:
+        """封印済みのセット数"""
+        return sum(segment.rows for segment in self.segments)
+
+    def select(self, menu_name: Optional[str] = None, since: Optional[float] = None,
+               until: Optional[float] = None) -> List[Segment]:
+        """メニュー・期間に該当するセットを含みうるセグメント(マニフェストだけで判定する)"""
+        return [
+            segment for segment in self.segments
+            if segment.overlaps(since, until) and (menu_name is None or menu_name in segment.bests)
+        ]
+
+    def load(self, segment: Segment) -> SetLog:
+        """セグメントを展開し，時刻順に並んだ読み取り専用のセットログとして返す"""
+        return self._load_segment(segment)[0]
+
+    def _load_segment(self, segment: Segment) -> Tuple[SetLog, array]:
+        """セグメントを展開し，(読み取り専用のセットログ, 各行の追記順の位置)を返す"""
+        with open(os.path.join(self.directory, segment.file), "rb") as f:
+            menu_names, *data = marshal.loads(decompress(f.read(), segment.codec))
+        columns = {}
+        for (name, code), chunk in zip(SetLog.COLUMNS, data):
+            column = columns[name] = array(code)
+            column.frombytes(chunk)
+        set_log = SetLog.from_columns(columns, menu_names)
+        positions = array("q")
+        if len(data) > len(SetLog.COLUMNS):
+            positions.frombytes(data[len(SetLog.COLUMNS)])
+        else:
+            positions.extend([0] * len(set_log))
+        return set_log, positions
+
+    def iter_sets(self, menu_name: Optional[str] = None, since: Optional[float] = None,
+                  until: Optional[float] = None) -> Iterator[SetRow]:
+        """封印済みのセットのうち，メニュー・期間([since, until))に該当するものを時刻順に返す"""
+        for segment in self.select(menu_name, since, until):
+            set_log = self.load(segment)
+            timestamps = set_log.columns["timestamp"]
+            # セグメント内は時刻順のため，期間の端は二分探索で求める
+            start = 0 if since is None else bisect.bisect_left(timestamps, since)
+            stop = len(timestamps) if until is None else bisect.bisect_left(timestamps, until)
+            yield from set_log.rows(start, menu_name, stop)
+
+    def iter_sets_after(self, position: int) -> Iterator[SetRow]:
+        """封印済みのセットのうち，追記順の位置がposition以降のものを返す"""
+        for segment in self.segments:
+            if segment.max_position < position:
+                continue
+            set_log, positions = self._load_segment(segment)
+            for index, row_position in enumerate(positions):
+                if row_position >= position:
+                    yield set_log.row(index)
+
+    def _write_segment(self, name: str, epoch: int, rows: List[PositionedRow]) -> Segment:
+        """1つのセグメントをepochの世代のファイルへ書き込む(時刻順に並べて圧縮する)"""
+        rows.sort(key=lambda row: row[0])
+        set_log = SetLog(None)
+        positions = array("q")
+        bests: Dict[str, Tuple[float, float]] = {}
+        for timestamp, menu_name, a, b, position in rows:
+            set_log.append(timestamp, menu_name, a, b)
+            positions.append(position)
+            best_a, best_b = bests.get(menu_name, (0.0, 0.0))
+            bests[menu_name] = (max(best_a, a), max(best_b, b))
+
+        data = marshal.dumps(
+            [set_log.menu_names] + [set_log.columns[column].tobytes() for column, _ in SetLog.COLUMNS] + [positions.tobytes()]
+        )
+        file_name = f"{name}.{epoch}{CODECS[self.CODEC]}"
+        path = os.path.join(self.directory, file_name)
+        tmp_path = path + ".tmp"
+        # 前回の封印が途中で落ちた場合の書きかけ(読み取り専用)を消しておく
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with open(tmp_path, "wb") as f:
+            f.write(compress(data, self.CODEC, self.COMPRESS_LEVEL))
+            f.flush()
+            os.fsync(f.fileno())
+        # 封印後は書き換えない
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, path)
+        return Segment(
+            name=name,
+            file=file_name,
+            codec=self.CODEC,
+            rows=len(rows),
+            min_ts=rows[0][0],
+            max_ts=rows[-1][0],
+            bests=bests,
+            max_position=max(positions)
+        )
+
+    def seal(self, rows: Iterable[PositionedRow], hot_epoch: int, hot_checkpoint: int, hot_base: int) -> List[Segment]:
+        """追記順の位置を添えたセットを月ごとのセグメントに封印し，ホットなセットログの世代と合わせてマニフェストを置き換える
+
+        ホットなセットログ(hot_epochの世代．先頭の行の位置はhot_base)は呼び出し側が先に書き込んでおく。
+        封印済みの月のセットは既存のセグメントとまとめて書き直し，1か月につき1つのセグメントにする。
+        """
+        by_month: Dict[str, List[PositionedRow]] = {}
+        for row in rows:
+            by_month.setdefault(month_of(row[0]), []).append(row)
+        existing = {segment.name: segment for segment in self.segments}
+
+        os.makedirs(self.directory, exist_ok=True)
+        sealed, replaced = [], []
+        for month in sorted(by_month):
+            month_rows = by_month[month]
+            segment = existing.get(month)
+            if segment is not None:
+                set_log, positions = self._load_segment(segment)
+                month_rows.extend(row + (position,) for row, position in zip(set_log.rows(), positions))
+                replaced.append(segment)
+            # 既存のファイルは読み込み中の他のプロセスがいるため上書きせず，新しい世代のファイルへ書き込む
+            sealed.append(self._write_segment(month, hot_epoch, month_rows))
+
+        replaced_files = {segment.file for segment in replaced}
+        segments = sorted(
+            [segment for segment in self.segments if segment.file not in replaced_files] + sealed,
+            key=lambda segment: segment.min_ts
+        )
+        data = {
+            "version": self.FORMAT_VERSION,
+            "hot_epoch": hot_epoch,
+            "hot_checkpoint": hot_checkpoint,
+            "hot_base": hot_base,
+            "segments": [segment.to_json() for segment in segments]
+        }
+        tmp_path = self._manifest_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path())
+        self.segments = segments
+        self.hot_epoch = hot_epoch
+        self.hot_checkpoint = hot_checkpoint
+        self.hot_base = hot_base
+        self._file_key = self._stat()
+
+        # 書き直した月の古いセグメントを削除する(削除できなくてもマニフェストに無いため読まれない)
+        for file_name in replaced_files:
+            try:
+                os.remove(os.path.join(self.directory, file_name))
+            except OSError:
+                pass
+        return sealed
@@ -0,0 +1,166 @@
+# analytics.py(NumPyによる一括計算)と，1セットずつ計算する素のPythonの実装を比較するベンチマーク
+# 複数のユーザーの履歴を乱数で作成し，推定1RM・ボリューム・週間ボリューム・推移の傾きの
+# 計算時間を比べ，結果が一致することも確認する
+#
+# 使い方:
+#   python benchmarks/analytics_bench.py                        # 100ユーザー×2000セット
+#   python benchmarks/analytics_bench.py --users 1000 --sets 1000
+
+import argparse
+import contextlib
+import io
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [os.path.join(HERE, "stubs"), ROOT]
+
+import numpy as np  # noqa: E402
+import analytics  # noqa: E402
+from menu_manager import MenuManager  # noqa: E402
+
+TARGETS = ["胸", "背中", "肩", "脚", "腹", "腕", "有酸素"]
+MENU_COUNT = 50
+
+
+def make_menu_file(path):
+    """ベンチマーク用のmenu.txtを作成(有酸素のメニューは回数以外の単位)"""
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(MENU_COUNT):
+            target = TARGETS[i % len(TARGETS)]
+            if target == "有酸素":
+                f.write(f"メニュー{i:03d},{target},km,0.1,km/h,0.1,50,20\n")
+            else:
+                f.write(f"メニュー{i:03d},{target},kg,2.5,回,1,150,50\n")
+
+
+def make_columns(user_count, set_count):
+    """ユーザーごとの履歴を作成して連結する"""
+    rng = np.random.default_rng(0)
+    start = time.time() - 365 * analytics.DAY
+    parts = []
+    for user in range(user_count):
+        timestamp = np.sort(start + rng.random(set_count) * 365 * analytics.DAY)
+        parts.append(analytics.SetColumns(
+            timestamp=timestamp,
+            menu=rng.integers(0, MENU_COUNT, set_count),
+            a=rng.integers(1, 60, set_count) * 2.5,
+            b=rng.integers(1, 30, set_count).astype(np.float64),
+            user=np.zeros(set_count, dtype=np.int64),
+            menu_names=[f"メニュー{i:03d}" for i in range(MENU_COUNT)],
+            user_names=[f"user{user}"]
+        ))
+    return analytics.SetColumns.concat(parts)
+
+
+def reference(rows, menu_manager, utc_offset):
+    """1セットずつループで計算する実装(rowsは(ユーザー, 時刻, メニュー名, A, B)の並び)"""
+    volumes = []
+    estimates = []
+    daily = defaultdict(float)
+    series = defaultdict(list)
+    for user, timestamp, menu_name, a, b in rows:
+        menu = menu_manager.get_menu(menu_name)
+        volumes.append(a * b)
+        if menu and menu.param_b.unit in analytics.REP_UNITS and b >= 1:
+            estimates.append(a if b == 1 else a * (1 + b / 30))
+        else:
+            estimates.append(math.nan)
+        day = math.floor((timestamp + utc_offset) / analytics.DAY)
+        daily[(user, menu.target if menu else "", day)] += a * b
+        series[(user, menu_name)].append((timestamp / analytics.DAY, a))
+
+    # 各日を含む直近7日間の合計
+    weekly = {}
+    for user, target, day in daily:
+        for offset in range(7):
+            key = (user, target, day + offset)
+            weekly[key] = weekly.get(key, 0.0) + daily[(user, target, day)]
+
+    slopes = {}
+    for key, points in series.items():
+        if len(points) < 2:
+            continue
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        sxx = sum((x - mean_x) ** 2 for x, _ in points)
+        sxy = sum((x - mean_x) * (y - mean_y) for x, y in points)
+        if sxx > 0:
+            slopes[key] = sxy / sxx
+    return volumes, estimates, weekly, slopes
+
+
+def vectorized(columns, menu_manager, utc_offset):
+    """analytics.pyで一括計算"""
+    return (
+        analytics.volume(columns),
+        analytics.estimated_one_rep_max(columns, menu_manager),
+        analytics.weekly_volume(columns, menu_manager, utc_offset=utc_offset),
+        analytics.trend_slopes(columns)
+    )
+
+
+def check(columns, expected, actual):
+    """2つの実装の結果が一致するか確認"""
+    volumes, estimates, weekly, slopes = expected
+    np.testing.assert_allclose(actual[0], volumes)
+    np.testing.assert_allclose(actual[1], estimates)
+
+    result = actual[2]
+    for (user, target, day), value in weekly.items():
+        index = day - result.days[0]
+        if index < len(result.days):
+            got = result.values[user, result.targets.index(target), index]
+            assert math.isclose(got, value, rel_tol=1e-9, abs_tol=1e-6), (user, target, day, got, value)
+
+    for (user, menu_name), value in slopes.items():
+        got = actual[3][user, columns.menu_names.index(menu_name)]
+        assert math.isclose(got, value, rel_tol=1e-6, abs_tol=1e-9), (user, menu_name, got, value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析処理のベンチマーク")
+    parser.add_argument("--users", type=int, default=100, help="ユーザー数")
+    parser.add_argument("--sets", type=int, default=2000, help="ユーザーごとのセット数")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        make_menu_file(os.path.join(directory, MenuManager.FILE_PATH))
+        os.chdir(directory)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                menu_manager = MenuManager()
+        finally:
+            os.chdir(cwd)
+
+    columns = make_columns(args.users, args.sets)
+    utc_offset = -time.timezone
+    rows = list(zip(
+        columns.user.tolist(), columns.timestamp.tolist(),
+        [columns.menu_names[menu] for menu in columns.menu.tolist()],
+        columns.a.tolist(), columns.b.tolist()
+    ))
+
+    start = time.perf_counter()
+    expected = reference(rows, menu_manager, utc_offset)
+    python_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = vectorized(columns, menu_manager, utc_offset)
+    numpy_time = time.perf_counter() - start
+
+    check(columns, expected, actual)
+    print(f"{args.users}ユーザー × {args.sets}セット = {len(columns)}セット")
+    print(f"{'素のPython':<12} {python_time * 1000:>10.1f} ms")
+    print(f"{'NumPy':<12} {numpy_time * 1000:>10.1f} ms  ({python_time / numpy_time:.1f}倍)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
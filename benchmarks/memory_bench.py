@@ -0,0 +1,153 @@
+# メニュー設定・トレーニング記録のメモリ使用量を計測するベンチマーク
+# 以前の表現(__dict__を持つ変更可能なデータクラスを1メニューごとに作成)と，
+# 現在の表現(__slots__・frozenのデータクラスで，同じ内容のパラメータ設定を共有)を
+# tracemallocで比べ，1メニューあたりの使用量を表示する
+# あわせて，メニュー選択時の記録の取得(辞書を作るget_last_training()とコピーしないget_record())で
+# 呼び出しごとに確保されるメモリも比べる
+#
+# 使い方:
+#   python benchmarks/memory_bench.py                  # 10000メニュー
+#   python benchmarks/memory_bench.py --menus 100000
+
+import argparse
+import contextlib
+import gc
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [os.path.join(HERE, "stubs"), ROOT]
+
+from menu_manager import MenuManager  # noqa: E402
+from history import TrainingHistory  # noqa: E402
+from storage import MemoryStorage, TrainingRecord  # noqa: E402
+
+TARGETS = ["胸", "背中", "肩", "脚", "腹", "腕", "有酸素"]
+CALLS = 1000
+
+
+@dataclass
+class LegacyParameterConfig:
+    """以前のパラメータ設定(__dict__を持つ変更可能なデータクラス)"""
+    unit: str
+    step: float
+    max: float = 200.0
+
+
+@dataclass
+class LegacyMenuConfig:
+    """以前のメニュー設定"""
+    target: str
+    param_a: LegacyParameterConfig
+    param_b: LegacyParameterConfig
+
+
+@dataclass
+class LegacyTrainingRecord:
+    """以前のトレーニング記録"""
+    last_a: float
+    last_b: float
+    best_a: float
+    best_b: float
+    last_ts: float = 0.0
+
+
+def make_lines(menu_count):
+    """ベンチマーク用のmenu.txtの各行"""
+    lines = []
+    for i in range(menu_count):
+        target = TARGETS[i % len(TARGETS)]
+        step = "2.5" if i % 3 == 0 else "5"
+        lines.append(f"メニュー{i:05d},{target},kg,{step},回,1,150,50")
+    return lines
+
+
+def legacy_parse(lines):
+    """以前のmenu_manager.pyと同じ方法で解析する"""
+    menus = {}
+    for line in lines:
+        parts = line.strip().split(",")
+        param_a = LegacyParameterConfig(unit=parts[2], step=float(parts[3]))
+        param_b = LegacyParameterConfig(unit=parts[4], step=float(parts[5]))
+        param_a.max = float(parts[6])
+        param_b.max = float(parts[7])
+        menus[parts[0]] = LegacyMenuConfig(target=parts[1], param_a=param_a, param_b=param_b)
+    return menus
+
+
+def measure(func):
+    """funcが返したオブジェクトを保持したまま，確保されているメモリ(バイト)を返す"""
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def measure_peak(func):
+    """funcの実行中に確保されたメモリの最大値(バイト)を返す"""
+    gc.collect()
+    tracemalloc.start()
+    func()
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size
+
+
+def report(label, before, after, count):
+    """以前と現在の使用量を1件あたりで表示"""
+    print(f"{label:<20} {before / count:>8.1f} B → {after / count:>8.1f} B  ({after / before:.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="メモリ使用量のベンチマーク")
+    parser.add_argument("--menus", type=int, default=10000, help="メニュー数")
+    args = parser.parse_args()
+
+    lines = make_lines(args.menus)
+    names = [line.split(",", 1)[0] for line in lines]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, MenuManager.FILE_PATH), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.chdir(directory)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                menu_manager = MenuManager()
+                history = TrainingHistory(menu_manager, storage=MemoryStorage())
+        finally:
+            os.chdir(cwd)
+
+    print(f"{args.menus}メニュー")
+    # メニュー設定(メニュー名の文字列と一覧の辞書を含む)
+    before = measure(lambda: legacy_parse(lines))
+    after = measure(lambda: menu_manager._parse_menus(lines))
+    report("メニュー設定", before, after, args.menus)
+
+    # 全メニューの記録
+    now = time.time()
+    before = measure(lambda: {name: LegacyTrainingRecord(50.0, 10.0, 60.0, 12.0, now) for name in names})
+    after = measure(lambda: {name: TrainingRecord(50.0, 10.0, 60.0, 12.0, now) for name in names})
+    report("トレーニング記録", before, after, args.menus)
+
+    # メニュー選択時の記録の取得(呼び出しごとに確保されるメモリ)
+    storage = history.storage
+    storage.add_sets([(now, name, 50.0, 10.0) for name in names[:CALLS]])
+    selected = names[:CALLS]
+    before = measure_peak(lambda: [history.get_last_training(name) for name in selected])
+    after = measure_peak(lambda: [history.get_record(name) for name in selected])
+    report("記録の取得", before, after, CALLS)
+    history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
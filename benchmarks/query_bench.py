@@ -0,0 +1,123 @@
+# set_index.py(時点・期間の問い合わせ用インデックス)と，セット履歴を毎回走査する実装を比較するベンチマーク
+# 2年分のセット履歴を乱数で作成し，「ある日時の時点での最高記録」「期間内の集計値(最大値・合計)」
+# 「直近24か月の月ごとの集計値」の1回あたりの時間を比べ，結果が一致することも確認する
+# (走査する実装は遅いため，少ない回数だけ計測する)
+#
+# 使い方:
+#   python benchmarks/query_bench.py                            # 50メニュー・200万セット
+#   python benchmarks/query_bench.py --menus 10 --sets 5000000 --queries 100000
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [os.path.join(HERE, "stubs"), ROOT]
+
+from set_index import SetIndex, month_starts  # noqa: E402
+
+DAY = 86400.0
+SPAN = 730 * DAY
+
+
+def make_rows(menu_count, set_count):
+    """2年分のセット履歴を時刻順に作成"""
+    rng = random.Random(0)
+    start = time.time() - SPAN
+    step = SPAN / set_count
+    return [
+        (start + i * step, f"メニュー{rng.randrange(menu_count):03d}", rng.randrange(1, 60) * 2.5, float(rng.randrange(1, 30)))
+        for i in range(set_count)
+    ]
+
+
+def scan_best_as_of(rows, menu_name, when):
+    """走査で求める時点の最高記録"""
+    best = None
+    for timestamp, name, a, b in rows:
+        if name == menu_name and timestamp <= when:
+            best = (a, b) if best is None else (max(best[0], a), max(best[1], b))
+    return best
+
+
+def scan_stats(rows, menu_name, since, until):
+    """走査で求める期間の(セット数, ボリューム, 最大A, 最大B)"""
+    count, volume, max_a, max_b = 0, 0.0, 0.0, 0.0
+    for timestamp, name, a, b in rows:
+        if name == menu_name and since <= timestamp < until:
+            count += 1
+            volume += a * b
+            max_a = max(max_a, a)
+            max_b = max(max_b, b)
+    return count, volume, max_a, max_b
+
+
+def per_call(func, args_list):
+    """引数ごとにfuncを呼び出し，1回あたりの中央値(マイクロ秒)と結果を返す"""
+    samples, results = [], []
+    for args in args_list:
+        start = time.perf_counter()
+        results.append(func(*args))
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="時点・期間の問い合わせのベンチマーク")
+    parser.add_argument("--menus", type=int, default=50, help="メニュー数")
+    parser.add_argument("--sets", type=int, default=2000000, help="セット数")
+    parser.add_argument("--queries", type=int, default=10000, help="インデックスへの問い合わせ回数")
+    parser.add_argument("--scans", type=int, default=3, help="走査する実装の計測回数")
+    args = parser.parse_args()
+
+    rows = make_rows(args.menus, args.sets)
+    first, last = rows[0][0], rows[-1][0]
+    rng = random.Random(1)
+
+    def random_menu():
+        return f"メニュー{rng.randrange(args.menus):03d}"
+
+    def random_range():
+        since = rng.uniform(first, last)
+        return since, since + rng.uniform(0, 90 * DAY)
+
+    start = time.perf_counter()
+    index = SetIndex()
+    index.rebuild(rows)
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for series in index.menus.values():
+        series.build()
+    build_time = time.perf_counter() - start
+
+    point_args = [(random_menu(), rng.uniform(first, last)) for _ in range(args.queries)]
+    range_args = [(random_menu(), *random_range()) for _ in range(args.queries)]
+    monthly_args = [(random_menu(), month_starts(24, last)) for _ in range(args.queries // 100 or 1)]
+
+    point_time, point_results = per_call(index.best_as_of, point_args)
+    range_time, range_results = per_call(index.stats, range_args)
+    monthly_time, _ = per_call(index.period_stats, monthly_args)
+
+    scan_point_time, scan_point_results = per_call(lambda *a: scan_best_as_of(rows, *a), point_args[:args.scans])
+    scan_range_time, scan_range_results = per_call(lambda *a: scan_stats(rows, *a), range_args[:args.scans])
+
+    assert point_results[:args.scans] == scan_point_results
+    for aggregate, (count, volume, max_a, max_b) in zip(range_results, scan_range_results):
+        assert (aggregate.count, aggregate.max_a, aggregate.max_b) == (count, max_a, max_b)
+        assert abs(aggregate.volume - volume) <= 1e-6 * max(1.0, volume)
+
+    print(f"{args.menus}メニュー・{args.sets}セット(2年分)")
+    print(f"インデックスの作成: 振り分け {load_time * 1000:.0f} ms + 木・累積和 {build_time * 1000:.0f} ms")
+    print(f"{'問い合わせ':<16} {'インデックス':>12} {'走査':>14}")
+    print(f"{'時点の最高記録':<16} {point_time:>9.1f} µs {scan_point_time:>11.0f} µs  ({scan_point_time / point_time:.0f}倍)")
+    print(f"{'期間の集計値':<16} {range_time:>9.1f} µs {scan_range_time:>11.0f} µs  ({scan_range_time / range_time:.0f}倍)")
+    print(f"{'24か月の月ごと':<16} {monthly_time:>9.1f} µs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
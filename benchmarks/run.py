@@ -0,0 +1,176 @@
+# 素のPython(Linux等)で実行できるベンチマーク
+# Pythonistaのui/keyboard/consoleモジュールはbenchmarks/stubsの代替を使う
+# 起動・メニュー選択・スライダー操作・回転時の配置・記録ボタンの処理時間をメニュー数・履歴件数ごとに計測し，
+# 保存済みのベースラインと比較して遅くなった項目を報告する
+#
+# 使い方:
+#   python benchmarks/run.py                  # 計測してベースラインと比較
+#   python benchmarks/run.py --save-baseline  # 計測結果をベースラインとして保存
+#   python benchmarks/run.py --quick          # 小さい条件だけ計測
+#   python benchmarks/run.py --save-baseline --only layout_rotate  # 指定した操作の項目だけを保存
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [os.path.join(HERE, "stubs"), ROOT]
+
+from menu_manager import MenuManager  # noqa: E402
+from history import TrainingHistory  # noqa: E402
+from storage import JsonStorage  # noqa: E402
+from set_log import SetLog  # noqa: E402
+import gui  # noqa: E402
+
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+TARGETS = ["胸", "背中", "肩", "脚", "腹", "腕", "有酸素"]
+CATALOG_SIZES = (10, 1000, 10000)
+HISTORY_SIZES = (0, 10000)
+
+
+def make_workspace(directory, menu_count, set_count):
+    """メニュー数・セット数を指定して作業ディレクトリを作成"""
+    with open(os.path.join(directory, MenuManager.FILE_PATH), "w", encoding="utf-8") as f:
+        for i in range(menu_count):
+            target = TARGETS[i % len(TARGETS)]
+            step = "2.5" if i % 3 == 0 else "5"
+            f.write(f"メニュー{i:05d},{target},kg,{step},回,1,150,50\n")
+
+    if set_count:
+        rng = random.Random(menu_count)
+        set_log = SetLog(os.path.join(directory, JsonStorage.SET_LOG_DIR))
+        start = time.time() - set_count * 60
+        for i in range(set_count):
+            menu = f"メニュー{rng.randrange(menu_count):05d}"
+            set_log.append(start + i * 60, menu, rng.randrange(1, 60) * 2.5, rng.randrange(1, 30))
+        set_log.flush()
+
+
+def measure(func, repeat):
+    """funcをrepeat回実行し，1回あたりの中央値(マイクロ秒)を返す"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+def new_app():
+    """共有インスタンスを破棄してから画面を作成(コールドスタート)"""
+    MenuManager._shared = None
+    return gui.TrainingApp()
+
+
+def run_case(menu_count, set_count, repeat):
+    """1つの条件で各操作を計測"""
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        make_workspace(directory, menu_count, set_count)
+        os.chdir(directory)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                # 初回はスナップショットとメニューキャッシュを作るため計測しない
+                app = new_app()
+                app.history.compact()
+                app.history.close()
+
+                def cold_start():
+                    new_app().history.close()
+                results["cold_start"] = measure(cold_start, max(3, repeat // 10))
+
+                app = new_app()
+                rng = random.Random(0)
+                rows = [(section, row) for section, (_, positions) in enumerate(app.menu_data.sections)
+                        for row in range(len(positions))]
+
+                def select():
+                    app.tableview_did_select(app.menu_table, *rng.choice(rows))
+                results["tableview_did_select"] = measure(select, repeat)
+
+                def slide():
+                    app.param_a_slider.value = rng.random()
+                    app.update_param_a(app.param_a_slider)
+                results["slider_update"] = measure(slide, repeat)
+
+                # 回転(縦・横の切り替え)のたびに配置し直す
+                sizes = [(390, 300), (844, 300)]
+                def relayout():
+                    sizes.reverse()
+                    app.width, app.height = sizes[0]
+                    app.layout()
+                results["layout_rotate"] = measure(relayout, repeat)
+
+                app.menu_table.selected_row = rows[0]
+                app.tableview_did_select(app.menu_table, *rows[0])
+                app.increase_param_a(None)
+                app.increase_param_b(None)
+                results["output_record"] = measure(lambda: app.output_record(None), repeat)
+                app.history.close()
+        finally:
+            os.chdir(cwd)
+    return {f"{name}[menus={menu_count},sets={set_count}]": value for name, value in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="T-Menu Managerのベンチマーク")
+    parser.add_argument("--save-baseline", action="store_true", help="計測結果をベースラインとして保存")
+    parser.add_argument("--threshold", type=float, default=1.5, help="ベースラインの何倍で劣化とみなすか")
+    parser.add_argument("--repeat", type=int, default=200, help="各操作の繰り返し回数")
+    parser.add_argument("--quick", action="store_true", help="小さい条件だけ計測")
+    parser.add_argument("--only", action="append", metavar="OPERATION",
+                        help="指定した操作(layout_rotateなど)の項目だけを比較・保存(複数指定可)")
+    args = parser.parse_args()
+
+    catalog_sizes = CATALOG_SIZES[:1] if args.quick else CATALOG_SIZES
+    history_sizes = HISTORY_SIZES[:1] if args.quick else HISTORY_SIZES
+
+    results = {}
+    for menu_count in catalog_sizes:
+        for set_count in history_sizes:
+            results.update(run_case(menu_count, set_count, args.repeat))
+    if args.only:
+        results = {name: value for name, value in results.items() if name.split("[")[0] in args.only}
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'項目':<50} {'計測(µs)':>12} {'基準(µs)':>12} {'比':>6}")
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base:
+            ratio = value / base
+            mark = " ⚠️" if ratio > args.threshold else ""
+            print(f"{name:<50} {value:>12.1f} {base:>12.1f} {ratio:>6.2f}{mark}")
+            if ratio > args.threshold:
+                regressions.append(name)
+        else:
+            print(f"{name:<50} {value:>12.1f} {'-':>12} {'-':>6}")
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"\nベースラインを保存しました: {BASELINE_PATH}")
+        return 0
+
+    if regressions:
+        print(f"\n[警告] {len(regressions)}項目がベースラインより{args.threshold}倍以上遅くなりました。")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# 起動から最初の操作可能な画面までの時間を計測するベンチマーク
+# 順に読み込む起動(メニュー一覧 → 履歴 → 画面)と，メニュー一覧と履歴を並行して読み込み，
+# 履歴が届く前に画面を描画する起動(startup.py)を比べる
+# モジュールの読み込みも起動時間に含めるため，1回ごとに新しいプロセスで計測する
+# (最初の1回はスナップショットとメニューキャッシュを作るため計測しない)
+#
+# 使い方:
+#   python benchmarks/startup_bench.py                          # 1000メニュー・10000セット
+#   python benchmarks/startup_bench.py --menus 10000 --sets 100000 --repeat 20
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+START = time.perf_counter()
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+MODES = ("sequential", "parallel")
+
+
+def child(mode):
+    """このプロセスで画面を作成し，各時点までの時間(ミリ秒)をJSONで出力する"""
+    sys.path[:0] = [os.path.join(HERE, "stubs"), ROOT]
+    with contextlib.redirect_stdout(io.StringIO()):
+        import gui
+        imported = time.perf_counter()
+        gui.TrainingApp.PARALLEL_STARTUP = mode == "parallel"
+        app = gui.TrainingApp()
+        first_frame = time.perf_counter()
+        app.history.refresh()
+        history_ready = time.perf_counter()
+        app.history.close()
+    print(json.dumps({
+        "import": (imported - START) * 1e3,
+        "first_frame": (first_frame - START) * 1e3,
+        "history_ready": (history_ready - START) * 1e3
+    }))
+
+
+def run_child(directory, mode):
+    """新しいプロセスで1回起動し，計測結果を返す"""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode],
+        cwd=directory, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時間のベンチマーク")
+    parser.add_argument("--menus", type=int, default=1000, help="メニュー数")
+    parser.add_argument("--sets", type=int, default=10000, help="履歴のセット数")
+    parser.add_argument("--repeat", type=int, default=10, help="各方式の起動回数")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return 0
+
+    sys.path[:0] = [os.path.join(HERE, "stubs"), ROOT]
+    from run import make_workspace
+
+    with tempfile.TemporaryDirectory() as directory:
+        make_workspace(directory, args.menus, args.sets)
+        run_child(directory, "sequential")
+
+        samples = {mode: [] for mode in MODES}
+        # 方式を交互に起動し，ファイルキャッシュなどの影響を揃える
+        for _ in range(args.repeat):
+            for mode in MODES:
+                samples[mode].append(run_child(directory, mode))
+
+    print(f"{args.menus}メニュー・{args.sets}セット(中央値，プロセス起動からのミリ秒)")
+    print(f"{'方式':<12} {'読み込み':>10} {'最初の画面':>10} {'履歴の反映':>10}")
+    for mode in MODES:
+        columns = [statistics.median(sample[key] for sample in samples[mode])
+                   for key in ("import", "first_frame", "history_ready")]
+        print(f"{mode:<12} " + " ".join(f"{value:>10.1f}" for value in columns))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
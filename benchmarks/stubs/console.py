@@ -0,0 +1,5 @@
+# ベンチマーク用のPythonista consoleモジュールの代替
+
+
+def hud_alert(message, icon='success', duration=1.0):
+    pass
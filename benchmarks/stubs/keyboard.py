@@ -0,0 +1,15 @@
+# ベンチマーク用のPythonista keyboardモジュールの代替
+
+inserted = []
+
+
+def is_keyboard():
+    return True
+
+
+def insert_text(text):
+    inserted.append(text)
+
+
+def set_view(view, mode=None):
+    pass
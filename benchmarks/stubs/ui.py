@@ -0,0 +1,99 @@
+# ベンチマーク用のPythonista uiモジュールの代替
+# 属性の設定・参照だけを受け付け，描画は行わない
+
+ALIGN_LEFT = 0
+ALIGN_CENTER = 1
+ALIGN_RIGHT = 2
+AUTOCAPITALIZE_NONE = 0
+
+
+class View:
+    """ui.Viewの代替"""
+    # サブクラスが__init__を呼ばない場合に備えてクラス属性で初期値を持つ
+    x = y = 0
+    width = height = 100
+
+    def __init__(self, *args, frame=(0, 0, 100, 100), **kwargs):
+        self.frame = frame
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    @property
+    def frame(self):
+        return (self.x, self.y, self.width, self.height)
+
+    @frame.setter
+    def frame(self, frame):
+        self.x, self.y, self.width, self.height = frame
+
+    def add_subview(self, view):
+        self.__dict__.setdefault("subviews", []).append(view)
+
+    def present(self, *args, **kwargs):
+        pass
+
+
+class Label(View):
+    """ui.Labelの代替"""
+
+
+class Button(View):
+    """ui.Buttonの代替"""
+
+
+class Slider(View):
+    """ui.Sliderの代替"""
+
+    def __init__(self, *args, **kwargs):
+        self.value = 0.0
+        super().__init__(*args, **kwargs)
+
+
+class TextField(View):
+    """ui.TextFieldの代替"""
+
+    def __init__(self, *args, **kwargs):
+        self.text = ""
+        super().__init__(*args, **kwargs)
+
+
+class TableView(View):
+    """ui.TableViewの代替"""
+
+    def __init__(self, *args, **kwargs):
+        self.selected_row = None
+        self.data_source = None
+        self.delegate = None
+        super().__init__(*args, **kwargs)
+
+    def reload(self):
+        pass
+
+    reload_data = reload
+
+
+class TableViewCell(View):
+    """ui.TableViewCellの代替"""
+
+    def __init__(self, *args, **kwargs):
+        self.text_label = Label()
+        super().__init__(*args, **kwargs)
+
+
+class ListDataSource:
+    """ui.ListDataSourceの代替"""
+
+    def __init__(self, items):
+        self.items = items
+
+
+def delay(func, seconds):
+    func()
+
+
+def in_background(func):
+    return func
+
+
+def on_main_thread(func):
+    return func
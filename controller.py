@@ -0,0 +1,265 @@
+# UIに依存しないトレーニング記録の操作ロジック
+# メニュー選択・パラメータ操作・記録可否の判定・記録の出力をまとめる
+# gui.pyのTrainingAppはこのクラスを呼び出して画面へ反映するだけにする
+# セッション中は記録を履歴へ書き込まずにTrainingSessionへ溜め，終了時にまとめて書き込む
+# 履歴は読み込み中のFutureでも受け取れる(起動時に画面を先に描画するため．startup.py)
+# プロフィールを切り替えた場合は履歴を差し替え，選択中のメニューの記録を読み込み直す(profiles.py)
+# セッションのステージングファイルはプロフィールごとに持ち，切り替えた先の終了していないセッションを再開する
+
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import List, Optional, Union
+import tracing
+from menu_manager import MenuChange, MenuManager
+from history import TrainingHistory
+from parameter_scale import ParameterScale
+from session import SessionSet, TrainingSession
+
+
+@dataclass
+class RecordResult:
+    """記録ボタンを押した結果を保持するデータクラス"""
+    menu_name: str
+    param_a: float
+    param_b: float
+    text: str
+    is_new_record: bool
+
+
+class TrainingController:
+    """メニュー選択から記録までの操作を扱うクラス"""
+    # セッション中のキーボードへの出力の単位("exercise" / "session")
+    SESSION_OUTPUT = TrainingSession.OUTPUT_EXERCISE
+
+    def __init__(self, menu_manager: Optional[MenuManager] = None,
+                 history: Union[TrainingHistory, "Future[TrainingHistory]", None] = None,
+                 staging_path: Optional[str] = None):
+        """メニューと履歴(読み込み中のFutureでもよい)，セッションのステージングファイルを設定"""
+        with tracing.span("MenuManager"):
+            self.menu_manager = menu_manager or MenuManager.shared()
+        if history is None:
+            with tracing.span("TrainingHistory"):
+                history = TrainingHistory(self.menu_manager)
+        self._history = history
+        self.menu_name: Optional[str] = None
+        self.param_a_scale: Optional[ParameterScale] = None
+        self.param_b_scale: Optional[ParameterScale] = None
+        self.best_a = 0.0
+        self.best_b = 0.0
+        # メニューを選択した後に利用者がパラメータを変更したか(履歴の読み込みが終わったときに上書きしないため)
+        self.adjusted = False
+        # 前回終了していないセッションがあれば再開する
+        self.staging_path = staging_path
+        self.session: Optional[TrainingSession] = TrainingSession.resume(staging_path)
+
+    @property
+    def history(self) -> TrainingHistory:
+        """トレーニング履歴(読み込み中の場合は読み込みが終わるまで待つ)"""
+        if isinstance(self._history, Future):
+            self._history = self._history.result()
+        return self._history
+
+    @property
+    def history_loaded(self) -> bool:
+        """履歴の読み込みが終わっているか"""
+        return not isinstance(self._history, Future) or self._history.done()
+
+    def switch_history(self, history: TrainingHistory, staging_path: Optional[str] = None) -> bool:
+        """履歴(プロフィール)とセッションのステージングファイルを切り替え，選択中のメニューの記録を読み込み直す
+
+        セッション中のセットは開始時の履歴へ書き込むため，セッション中は切り替えずにFalseを返す。
+        切り替えた先に終了していないセッションがあれば再開する。
+        """
+        if self.session is not None:
+            return False
+        self._history = history
+        self.staging_path = staging_path
+        self.session = TrainingSession.resume(staging_path)
+        if self.menu_name:
+            self.select_menu(self.menu_name)
+        return True
+
+    def select_menu(self, menu_name: str) -> bool:
+        """メニューを選択し，前回の記録と最高記録を読み込む(履歴の読み込み中は記録なしとして扱う)"""
+        menu = self.menu_manager.get_menu(menu_name)
+        if not menu:
+            return False
+
+        self.menu_name = self.menu_manager.find_menu_by_tag_or_name(menu_name)
+        # 目盛りはメニュー選択時に一度だけ作成する
+        self.param_a_scale = ParameterScale(menu.param_a)
+        self.param_b_scale = ParameterScale(menu.param_b)
+        self.adjusted = False
+        self._load_record()
+        return True
+
+    def apply_loaded_history(self) -> bool:
+        """履歴の読み込みが終わった後に，選択中のメニューの前回の記録と最高記録を反映する(反映した場合はTrue)
+
+        読み込み中に利用者がパラメータを変更していた場合は，その値を残して最高記録だけを反映する。
+        """
+        if self.menu_name is None or self.param_a_scale is None or self.param_b_scale is None:
+            return False
+        self._load_record(set_values=not self.adjusted)
+        return True
+
+    def _load_record(self, set_values: bool = True) -> None:
+        """選択中のメニューの最高記録と，set_valuesがTrueの場合は前回の値を目盛りへ読み込む"""
+        record = None
+        if self.history_loaded:
+            with tracing.span("get_record"):
+                record = self.history.get_record(self.menu_name)
+        if record:
+            if set_values:
+                self.param_a_scale.set_value(record.last_a)
+                self.param_b_scale.set_value(record.last_b)
+            self.best_a = record.best_a
+            self.best_b = record.best_b
+        else:
+            self.best_a = 0.0
+            self.best_b = 0.0
+
+        # セッション中でまだ履歴へ書き込んでいないセットも反映する
+        if self.session is not None:
+            for session_set in self.session.sets[self.session.committed:]:
+                if session_set.menu_name != self.menu_name:
+                    continue
+                if set_values:
+                    self.param_a_scale.set_value(session_set.param_a)
+                    self.param_b_scale.set_value(session_set.param_b)
+                self.best_a = max(self.best_a, session_set.param_a)
+                self.best_b = max(self.best_b, session_set.param_b)
+
+    def apply_menu_changes(self, changes: List[MenuChange]) -> bool:
+        """menu.txtの再読み込みで変化したメニューを反映し，選択中のメニューが変化した場合はTrueを返す"""
+        # ターゲットが変わった場合は部位別の集計値を作り直す
+        if any(change.target_changed for change in changes):
+            self.history.invalidate_aggregates()
+
+        for change in changes:
+            if change.name != self.menu_name:
+                continue
+            if change.kind == MenuChange.REMOVE:
+                self.menu_name = None
+                self.param_a_scale = None
+                self.param_b_scale = None
+                return True
+            # 単位・ステップ・最大値が変わった場合は目盛りを作り直し，値は最も近い目盛りに合わせる
+            for param_type, config in (('a', change.menu.param_a), ('b', change.menu.param_b)):
+                scale = ParameterScale(config)
+                scale.set_value(self.scale(param_type).value)
+                setattr(self, f"param_{param_type}_scale", scale)
+            return True
+        return False
+
+    def scale(self, param_type: str) -> ParameterScale:
+        """パラメータ('a'/'b')の目盛りを返す"""
+        return getattr(self, f"param_{param_type}_scale")
+
+    def set_fraction(self, param_type: str, fraction: float) -> None:
+        """スライダーの位置からパラメータを設定"""
+        self.scale(param_type).set_fraction(fraction)
+        self.adjusted = True
+
+    def increase(self, param_type: str) -> None:
+        """パラメータを1ステップ増やす"""
+        self.scale(param_type).increase()
+        self.adjusted = True
+
+    def decrease(self, param_type: str) -> None:
+        """パラメータを1ステップ減らす"""
+        self.scale(param_type).decrease()
+        self.adjusted = True
+
+    def is_record_breaking(self, param_type: str) -> bool:
+        """パラメータが最高記録を超えているか"""
+        return self.scale(param_type).value > getattr(self, f"best_{param_type}")
+
+    def can_record(self) -> bool:
+        """記録できる状態か(パラメータが0で，かつステップが0でない場合は記録できない)"""
+        if self.param_a_scale is None or self.param_b_scale is None:
+            return False
+        return self.param_a_scale.can_record() and self.param_b_scale.can_record()
+
+    def menu_output_text(self, display_name: str) -> str:
+        """種目名として出力するテキスト"""
+        return f"- {display_name}\n"
+
+    def record(self) -> Optional[RecordResult]:
+        """現在のパラメータを記録し，出力するテキストを返す(記録できない場合はNone)"""
+        if self.menu_name is None or not self.can_record():
+            return None
+
+        param_a = self.param_a_scale.value
+        param_b = self.param_b_scale.value
+
+        # 最高記録を更新
+        is_record_a = param_a > self.best_a
+        is_record_b = param_b > self.best_b
+        if is_record_a:
+            self.best_a = param_a
+        if is_record_b:
+            self.best_b = param_b
+
+        text = f"  - {param_a} {self.param_a_scale.unit}, {param_b} {self.param_b_scale.unit}\n"
+        if self.session is not None:
+            # セッション中は溜めておき，終了時にまとめて書き込む
+            with tracing.span("session.add"):
+                self.session.add(SessionSet(
+                    timestamp=time.time(),
+                    menu_name=self.menu_name,
+                    display_name=self.menu_manager.index.display_of(self.menu_name),
+                    param_a=param_a,
+                    param_b=param_b,
+                    text=text
+                ))
+        else:
+            # 履歴の更新
+            with tracing.span("update_history"):
+                self.history.update_history(self.menu_name, param_a, param_b)
+
+        return RecordResult(
+            menu_name=self.menu_name,
+            param_a=param_a,
+            param_b=param_b,
+            text=text,
+            is_new_record=is_record_a or is_record_b
+        )
+
+    def start_session(self, output: Optional[str] = None) -> None:
+        """セッションを開始"""
+        if self.session is None:
+            self.session = TrainingSession(output or self.SESSION_OUTPUT, self.staging_path)
+
+    def session_text(self) -> str:
+        """セッション中に出力できるようになったテキスト(別の種目を記録したときの前の種目のブロック)"""
+        if self.session is None:
+            return ""
+        return self.session.take_text(self.menu_name)
+
+    @tracing.traced("TrainingController.commit_session")
+    def commit_session(self) -> int:
+        """セッション中の未書き込みのセットを履歴へまとめて書き込み，その件数を返す"""
+        if self.session is None:
+            return 0
+        rows = self.session.uncommitted_rows()
+        if not rows:
+            return 0
+        # 書き込んだ後，書き込み済みの印を付ける前に落ちた場合は次回に同じセットを再度書き込もうとする
+        # その場合だけ記録済みのセット(時刻とメニューが同じもの)を除き，通常は履歴を調べずに書き込む
+        deduplicate = self.session.interrupted_commit()
+        self.session.mark_committing()
+        self.history.add_sets(rows, deduplicate=deduplicate)
+        self.session.mark_committed()
+        return len(rows)
+
+    def end_session(self) -> str:
+        """セッションを終了し，残りのテキストを返す(履歴へも書き込む)"""
+        if self.session is None:
+            return ""
+        text = self.session.take_text(final=True)
+        self.commit_session()
+        self.session.discard()
+        self.session = None
+        return text
@@ -0,0 +1,58 @@
+# プロセス間のファイルロック
+# Pythonistaの本体アプリとキーボード拡張が同じ履歴ファイルを同時に扱うときの排他に使う
+# 同じプロセス内では入れ子で取得できる(最初の取得時だけOSのロックを取る)
+
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windowsなど(fcntlが無い環境ではプロセス内の排他のみ)
+    fcntl = None
+
+
+class FileLock:
+    """ロックファイルを使った排他ロック"""
+
+    def __init__(self, path: str):
+        """ロックファイルのパスを設定"""
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self) -> None:
+        """ロックを取得(他のプロセスが保持している間は待つ)"""
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except Exception:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self) -> None:
+        """ロックを解放"""
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
@@ -1,13 +1,88 @@
 import ui
 import console
 import keyboard
-from menu_manager import MenuManager
-from history import TrainingHistory
+import tracing
+from controller import TrainingController
+from layout import LayoutEngine
+from profiles import ProfileManager
+from session import TrainingSession
+from startup import StartupPipeline
+
+
+class MenuDataSource:
+    """メニュー一覧をターゲット(部位)ごとのセクションに分け，表示する行だけセルを生成するデータソース"""
+    def __init__(self, index):
+        """メニューのインデックスからデータソースを作成"""
+        self.index = index
+        self.font = ('Helvetica', 10.5)
+        # (ターゲット, メニュー番号の一覧) のリスト
+        self.sections = []
+        self.set_filter(None)
+
+    def set_filter(self, positions):
+        """表示するメニュー番号を設定(Noneの場合は全メニュー)"""
+        if positions is None:
+            self.sections = list(self.index.target_positions.items())
+            return
+        
+        grouped = {}
+        for position in positions:
+            grouped.setdefault(self.index.targets[position], []).append(position)
+        # セクションの並びは全メニュー表示時と揃える
+        self.sections = [(target, grouped[target]) for target in self.index.target_positions if target in grouped]
+
+    def row_count(self):
+        """表示中のメニュー数"""
+        return sum(len(positions) for _, positions in self.sections)
+
+    def find(self, menu_name):
+        """メニューが表示されている (セクション, 行)(表示されていなければNone)"""
+        position = self.index.position_of(menu_name)
+        for section, (_, positions) in enumerate(self.sections):
+            if position in positions:
+                return (section, positions.index(position))
+        return None
+
+    def menu_name(self, section, row):
+        """指定した行のメニュー名"""
+        return self.index.names[self.sections[section][1][row]]
+
+    def display_name(self, section, row):
+        """指定した行のタグ付きメニュー名"""
+        return self.index.display(self.sections[section][1][row])
+
+    def tableview_number_of_sections(self, tableview):
+        """セクション数(表示中のターゲット数)"""
+        return len(self.sections)
+
+    def tableview_number_of_rows(self, tableview, section):
+        """セクション内の行数"""
+        return len(self.sections[section][1])
+
+    def tableview_title_for_header(self, tableview, section):
+        """セクションの見出し(ターゲット)"""
+        return self.sections[section][0]
+
+    def tableview_cell_for_row(self, tableview, section, row):
+        """表示される行のセルを生成"""
+        # 文字列は表示される行の分だけ生成する
+        cell = ui.TableViewCell()
+        cell.text_label.text = self.menu_name(section, row)
+        cell.text_label.font = self.font
+        return cell
+
 
 class TrainingApp(ui.View):
+    # 履歴を画面の作成後にワーカースレッドで読み込み，履歴が届く前に画面を描画する(Falseの場合は順に読み込む)
+    PARALLEL_STARTUP = True
+    # プロフィールの一覧の末尾に表示する，新しいプロフィールを作る項目
+    NEW_PROFILE = "＋ 新しいプロフィール"
+
+    @tracing.traced("TrainingApp.__init__")
     def __init__(self):
-        self.menu_manager = MenuManager()
-        self.history = TrainingHistory()
+        pipeline = StartupPipeline() if self.PARALLEL_STARTUP else None
+        # 画面の大きさごとの部品の配置
+        self.layout_engine = LayoutEngine()
         
         # カラー設定
         self.background_color = '#E8F5E9'
@@ -15,17 +90,33 @@ class TrainingApp(ui.View):
         self.record_button_active_color = '#7B1FA2'
         self.record_button_inactive_color = '#BDBDBD'
         
-        # メニュー選択部分の初期化
-        self._init_menu_selection()
-        
-        # パラメータ入力部分の初期化
-        self._init_parameter_inputs()
+        with tracing.span("widgets"):
+            # パラメータ入力部分の初期化
+            self._init_parameter_inputs()
+            
+            # 操作ロジックはUIに依存しないコントローラーに任せる
+            # 履歴は選択中のプロフィールのもので，開いた履歴はself.profilesが保持する
+            if pipeline is None:
+                self.profiles = ProfileManager()
+                self.profile_name = self.profiles.active
+                with tracing.span("TrainingHistory"):
+                    history = self.profiles.open(self.profile_name)
+                self.controller = TrainingController(history=history, staging_path=self._staging_path())
+            else:
+                self.profiles = pipeline.profiles
+                self.profile_name = pipeline.profile
+                self.controller = TrainingController(pipeline.menu_manager, pipeline.history, self._staging_path())
+            self.menu_manager = self.controller.menu_manager
+            
+            # メニュー選択部分の初期化
+            self._init_menu_selection()
+            
+            # 出力ボタンの初期化
+            self._init_output_buttons()
         
-        # 出力ボタンの初期化
-        self._init_output_buttons()
-        
-        # 初期選択の設定
-        self._select_first_menu()
+        # 初期選択の設定(履歴の読み込み中はパラメータを0として表示する)
+        with tracing.span("_select_first_menu"):
+            self._select_first_menu()
         
         # ビューの基本設定
         self.flex = 'WH'
@@ -33,6 +124,40 @@ class TrainingApp(ui.View):
         
         # テーブルビューの設定
         self._configure_table_view()
+        
+        # menu.txtが編集されたら画面を作り直さずに反映する
+        self.menu_manager.add_listener(self._on_menus_changed)
+        
+        # 画面を作り終えてから履歴を読み込み始め，届いたら前回の記録と最高記録を反映する
+        if pipeline is not None:
+            pipeline.history.add_done_callback(ui.on_main_thread(self._on_history_loaded))
+            pipeline.load_history()
+        tracing.instant("first_frame")
+
+    def _staging_path(self):
+        """選択中のプロフィールのセッションのステージングファイル"""
+        return self.profiles.path_of(self.profile_name, TrainingSession.STAGING_PATH)
+
+    @property
+    def history(self):
+        """トレーニング履歴(読み込み中の場合は読み込みが終わるまで待つ)"""
+        return self.controller.history
+
+    @tracing.traced("TrainingApp._on_history_loaded")
+    def _on_history_loaded(self, future):
+        """履歴の読み込みが終わったら，選択中のメニューの前回の記録と最高記録を反映する
+
+        読み込み中にスライダーやボタンで値を変更していた場合は，その値を残して最高記録だけを反映する。
+        """
+        error = future.exception()
+        if error is not None:
+            # 保存先の設定の誤り(メモリ予算モードとjsonの組み合わせなど)も画面に表示する
+            print(f"[エラー] 履歴を読み込めませんでした: {error}")
+            console.hud_alert(f"⚠️ 履歴を読み込めませんでした: {error}", 'error', 5.0)
+            return
+        if self.controller.apply_loaded_history():
+            self._update_parameter_label('a')
+            self._update_parameter_label('b')
 
     def _init_menu_selection(self):
         """メニュー選択部分のUI要素を初期化"""
@@ -41,8 +166,18 @@ class TrainingApp(ui.View):
         self.menu_label.text_color = '#1E88E5'
         self.add_subview(self.menu_label)
         
-        self.menu_table = ui.TableView(frame=(10, 40, 350, 150))
-        self.menu_table.data_source = ui.ListDataSource(self.menu_manager.get_menu_tagandnames())
+        # 入力に合わせてメニューを絞り込む検索欄
+        self.search_field = ui.TextField(frame=(10, 40, 350, 30))
+        self.search_field.placeholder = "🔍 メニューを検索"
+        self.search_field.font = ('Helvetica', 12)
+        self.search_field.clear_button_mode = 'while_editing'
+        self.search_field.autocapitalization_type = ui.AUTOCAPITALIZE_NONE
+        self.search_field.delegate = self
+        self.add_subview(self.search_field)
+        
+        self.menu_table = ui.TableView(frame=(10, 70, 350, 150))
+        self.menu_data = MenuDataSource(self.menu_manager.index)
+        self.menu_table.data_source = self.menu_data
         self.menu_table.delegate = self
         self.add_subview(self.menu_table)
 
@@ -128,54 +263,82 @@ class TrainingApp(ui.View):
         self.record_output_button.tint_color = 'white'
         self.record_output_button.corner_radius = 15
         self.add_subview(self.record_output_button)
+        
+        # セッションボタン(セッション中は記録をまとめて出力・保存する)
+        self.session_button = ui.Button(frame=(230, 400, 100, 40))
+        self.session_button.action = self.toggle_session
+        self.session_button.font = ('Helvetica-Bold', 15)
+        self.session_button.tint_color = 'white'
+        self.session_button.corner_radius = 15
+        self.add_subview(self.session_button)
+        self._update_session_button()
+        
+        # プロフィールボタン(トレーニングする人の切り替え)
+        self.profile_button = ui.Button(title=f"👤 {self.profile_name}", frame=(10, 450, 320, 32))
+        self.profile_button.action = self.choose_profile
+        self.profile_button.font = ('Helvetica-Bold', 13)
+        self.profile_button.background_color = '#546E7A'
+        self.profile_button.tint_color = 'white'
+        self.profile_button.corner_radius = 15
+        self.add_subview(self.profile_button)
 
     def _select_first_menu(self):
         """最初のメニューを選択"""
-        if self.menu_table.data_source.items:
+        if self.menu_data.row_count():
             self.menu_table.selected_row = (0, 0)
             self.tableview_did_select(self.menu_table, 0, 0)
 
+    def textfield_did_begin_editing(self, textfield):
+        """検索欄を選択したら，入力される前に検索インデックスを作り始める"""
+        StartupPipeline.prepare_search(self.menu_manager)
+
+    @tracing.traced("TrainingApp.textfield_did_change")
+    def textfield_did_change(self, textfield):
+        """検索欄の入力に合わせてメニューを絞り込む"""
+        self.menu_manager.reload()
+        self.menu_data.set_filter(self.menu_manager.index.search_positions(textfield.text))
+        self.menu_table.reload()
+        self._select_first_menu()
+
+    @tracing.traced("TrainingApp._on_menus_changed")
+    def _on_menus_changed(self, changes):
+        """menu.txtの変更をテーブルと選択中のメニューのパラメータへ反映"""
+        query = self.search_field.text
+        self.menu_data.set_filter(self.menu_manager.index.search_positions(query) if query else None)
+        self.menu_table.reload()
+        
+        selection_changed = self.controller.apply_menu_changes(changes)
+        selected_row = self.menu_data.find(self.controller.menu_name) if self.controller.menu_name else None
+        if selected_row is None:
+            # 選択中のメニューが削除された(または絞り込みで表示されなくなった)場合は先頭を選択
+            self._select_first_menu()
+            return
+        
+        self.menu_table.selected_row = selected_row
+        if selection_changed:
+            # ステップ・最大値が変わったスライダーとラベルを更新
+            self._update_parameter_label('a')
+            self._update_parameter_label('b')
+
     def _configure_table_view(self):
         """テーブルビューの設定を行う"""
         self.menu_table.row_height = 50
-        self.menu_table.data_source.font = ('Helvetica', 10.5)
+        self.menu_data.font = ('Helvetica', 10.5)
         self.menu_table.background_color = '#FFFFFF'
         self.menu_table.border_width = 1
         self.menu_table.border_color = '#81C784'
         self.menu_table.corner_radius = 10
 
-    def _calculate_parameter_value(self, slider_value, param_min=0, param_max=200, param_step=1):
-        """スライダーの値をパラメータ値に変換"""
-        param_value = param_min + slider_value * (param_max - param_min)
-        if param_step.is_integer():
-            return int(round(param_value))
-        return round(param_value, len(str(param_step).split('.')[1]))
-
-    def _calculate_slider_value(self, param_value, param_min=0, param_max=200):
-        """パラメータ値をスライダー値に変換"""
-        return (param_value - param_min) / (param_max - param_min)
-
     def _update_parameter_label(self, param_type):
         """パラメータのラベルを更新"""
-        param_value = self._calculate_parameter_value(
-            getattr(self, f"param_{param_type}_slider").value,
-            0,
-            getattr(self, f"param_{param_type}_max"),
-            getattr(self, f"param_{param_type}_step")
-        )
-        
-        # stepの値に基づいて表示形式を決定
-        step = getattr(self, f"param_{param_type}_step")
-        if isinstance(step, int):
-            display_value = int(param_value)
-        else:
-            display_value = round(param_value, len(str(step).split('.')[1]))
+        scale = self.controller.scale(param_type)
+        getattr(self, f"param_{param_type}_slider").value = scale.fraction
         
         label = getattr(self, f"param_{param_type}_label")
-        label.text = f"{display_value} {getattr(self, f'param_{param_type}_name')}"
+        label.text = scale.label()
         
         # 最高記録を超えているかチェック
-        if param_value > getattr(self, f"best_{param_type}"):
+        if self.controller.is_record_breaking(param_type):
             label.text_color = self.record_breaking_color
         else:
             label.text_color = '#1A237E'
@@ -184,21 +347,7 @@ class TrainingApp(ui.View):
 
     def _update_record_button_state(self):
         """記録ボタンの状態を更新"""
-        param_a_value = self._calculate_parameter_value(
-            self.param_a_slider.value,
-            0,
-            self.param_a_max,
-            self.param_a_step
-        )
-        param_b_value = self._calculate_parameter_value(
-            self.param_b_slider.value,
-            0,
-            self.param_b_max,
-            self.param_b_step
-        )
-        
-        can_record = not ((param_a_value == 0 and self.param_a_step != 0) or 
-                         (param_b_value == 0 and self.param_b_step != 0))
+        can_record = self.controller.can_record()
         
         self.record_output_button.background_color = (
             self.record_button_active_color if can_record 
@@ -206,136 +355,100 @@ class TrainingApp(ui.View):
         )
         self.record_output_button.enabled = can_record
 
-    def _handle_record_output(self, menu_name, param_a, param_b):
-        """記録出力の処理を行う"""
-        # 最高記録の更新
-        is_record_a = param_a > self.best_a
-        is_record_b = param_b > self.best_b
-        
-        if is_record_a:
-            self.best_a = param_a
-        if is_record_b:
-            self.best_b = param_b
-        
-        # 履歴の更新
-        self.history.update_history(menu_name, param_a, param_b)
-        
-        # 出力テキストの生成と挿入
-        output_text = f"  - {param_a} {self.param_a_name}, {param_b} {self.param_b_name}\n"
-        if keyboard.is_keyboard():
-            keyboard.insert_text(output_text)
-        
-        # 結果メッセージの表示
-        if is_record_a or is_record_b:
-            console.hud_alert("🏆 新記録達成！おめでとう！", 'success')
+    def _update_session_button(self):
+        """セッションボタンの表示を更新"""
+        if self.controller.session is None:
+            self.session_button.title = "⏱ 開始"
+            self.session_button.background_color = '#00897B'
         else:
-            console.hud_alert("🔥 素晴らしい！記録しました！", 'success')
+            self.session_button.title = f"🏁 終了({len(self.controller.session)})"
+            self.session_button.background_color = '#EF6C00'
+
+    def _insert_text(self, text):
+        """キーボードにテキストを挿入"""
+        if text and keyboard.is_keyboard():
+            keyboard.insert_text(text)
 
+    def will_close(self):
+        """ ビューが閉じられる時に未書き込みの履歴を書き込む """
+        # セッション中のセットは履歴へまとめて書き込む(セッション自体は次に開いたときに続ける)
+        self.controller.commit_session()
+        self.menu_manager.remove_listener(self._on_menus_changed)
+        # 読み込み中の場合は読み込みを待ってから，開いている全てのプロフィールの履歴を閉じる
+        self.history.flush()
+        self.profiles.close()
+        if tracing.is_memory_enabled():
+            print(f"[メモリ] {tracing.memory_report()}")
+        if tracing.is_enabled():
+            print(f"[トレース] {tracing.export_chrome_trace()} に書き出しました。")
+
+    @tracing.traced("TrainingApp.layout")
     def layout(self):
-        """ レイアウトを動的に調整 """
-        margin = 10
-        label_height = 30
-        button_size = 35  # 増減ボタンを少し小さく
-        slider_height = 30
-        button_width = 100
-        vertical_spacing = 15  # 垂直方向の間隔を少し縮小
-
-        if self.is_keyboard:
-            scale_factor = 1
-        else:
-            scale_factor = 1.0
-
-        left_width = self.width * 0.4 * scale_factor
-        right_width = self.width * 0.6 * scale_factor
-
-        self.menu_label.frame = (margin, margin, left_width - 2 * margin, label_height)
-        self.menu_table.frame = (margin, margin + label_height, left_width - 2 * margin, self.height - 2 * margin - label_height)
-        
-        # パラメータAの位置を上に移動
-        param_x = left_width + margin
-        param_a_y = margin
-        self.param_a_label.frame = (param_x + (right_width - 2 * margin - self.param_a_slider.width) / 2, param_a_y, self.param_a_slider.width, label_height * 0.8)
-        self.param_a_minus_button.frame = (param_x, param_a_y + label_height, button_size * scale_factor, button_size * scale_factor)
-        self.param_a_slider.frame = (param_x + button_size * scale_factor + margin, param_a_y + label_height, right_width - 4 * margin - 2 * button_size * scale_factor, slider_height * scale_factor)
-        self.param_a_plus_button.frame = (param_x + right_width - 2 * margin - button_size * scale_factor, param_a_y + label_height, button_size * scale_factor, button_size * scale_factor)
-        
-        # パラメータBの位置も上に移動
-        param_b_y = param_a_y + label_height + button_size * scale_factor + margin
-        self.param_b_label.frame = (param_x + (right_width - 2 * margin - self.param_b_slider.width) / 2, param_b_y, self.param_b_slider.width, label_height * 0.8)
-        self.param_b_minus_button.frame = (param_x, param_b_y + label_height, button_size * scale_factor, button_size * scale_factor)
-        self.param_b_slider.frame = (param_x + button_size * scale_factor + margin, param_b_y + label_height, right_width - 4 * margin - 2 * button_size * scale_factor, slider_height * scale_factor)
-        self.param_b_plus_button.frame = (param_x + right_width - 2 * margin - button_size * scale_factor, param_b_y + label_height, button_size * scale_factor, button_size * scale_factor)
-        
-        # 出力ボタンの位置を調整
-        output_y = param_b_y + label_height + button_size * scale_factor + vertical_spacing
-        output_button_height = button_size * 0.8 * scale_factor
-        self.menu_output_button.frame = (param_x, output_y, button_width * scale_factor, output_button_height)
-        self.record_output_button.frame = (param_x + button_width * scale_factor + margin, output_y, button_width * scale_factor, output_button_height)
+        """ レイアウトを動的に調整(大きさごとに計算済みの配置のうち，変わったフレームだけを設定) """
+        changed = self.layout_engine.apply(self, self.width, self.height, self.is_keyboard)
+        if "menu_table" in changed:
+            # テーブルの高さが変わると表示範囲が古いままになるため，読み込み直して選択中の行を表示し直す
+            selected_row = self.menu_data.find(self.controller.menu_name) if self.controller.menu_name else None
+            self.menu_table.reload()
+            if selected_row is not None:
+                self.menu_table.selected_row = selected_row
 
+    @tracing.traced("TrainingApp.tableview_did_select")
     def tableview_did_select(self, tableview, section, row):
         """ メニューが選択された時の処理 """
-        menu_name = self.menu_table.data_source.items[row]
-        menu = self.menu_manager.get_menu(menu_name)
-        self.param_a_name = menu.param_a.unit
-        self.param_b_name = menu.param_b.unit
-        self.param_a_step = menu.param_a.step
-        self.param_b_step = menu.param_b.step
-        self.param_a_max = menu.param_a.max
-        self.param_b_max = menu.param_b.max
-
-        last_training = self.history.get_last_training(menu_name)
-        if last_training:
-            self.param_a_slider.value = self._calculate_slider_value(last_training.get("last_a", 0.0), 0, self.param_a_max)
-            self.param_b_slider.value = self._calculate_slider_value(last_training.get("last_b", 0.0), 0, self.param_b_max)
-            
-            # 最高記録を保存
-            self.best_a = last_training.get("best_a", 0.0)
-            self.best_b = last_training.get("best_b", 0.0)
-        else:
-            self.param_a_slider.value = 0.0
-            self.param_b_slider.value = 0.0
-            self.best_a = 0.0
-            self.best_b = 0.0
+        # 反映で行の位置が変わる可能性があるため，タップした行のメニューは反映する前に求めておく
+        menu_name = self.menu_data.menu_name(section, row)
+        # menu.txtが編集されていれば反映する(更新日時を確認するだけなので軽い)
+        if self.menu_manager.reload():
+            # _on_menus_changed()で反映済み．タップしたメニューが削除された場合は，そこで選択し直した状態を使う
+            if menu_name not in self.menu_manager.menus:
+                return
+            selected_row = self.menu_data.find(menu_name)
+            if selected_row is not None:
+                self.menu_table.selected_row = selected_row
+        self.controller.select_menu(menu_name)
         
         self._update_parameter_label('a')
         self._update_parameter_label('b')
+        tracing.memory_sample()
     
+    @tracing.traced("TrainingApp.update_param_a")
     def update_param_a(self, sender):
         """ スライダーでパラメータAを更新 """
-        param_a_value = round(sender.value * self.param_a_max / self.param_a_step) * self.param_a_step
-        self.param_a_slider.value = self._calculate_slider_value(param_a_value, 0, self.param_a_max)
+        self.controller.set_fraction('a', sender.value)
         self._update_parameter_label('a')
     
+    @tracing.traced("TrainingApp.increase_param_a")
     def increase_param_a(self, sender):
         """ パラメータAを増加 """
-        param_a_value = min(self._calculate_parameter_value(self.param_a_slider.value, 0, self.param_a_max, self.param_a_step) + self.param_a_step, self.param_a_max)  # 200を最大値と仮定
-        self.param_a_slider.value = self._calculate_slider_value(param_a_value, 0, self.param_a_max)
+        self.controller.increase('a')
         self._update_parameter_label('a')
         
+    @tracing.traced("TrainingApp.decrease_param_a")
     def decrease_param_a(self, sender):
         """ パラメータAを減少 """
-        param_a_value = max(self._calculate_parameter_value(self.param_a_slider.value, 0, self.param_a_max, self.param_a_step) - self.param_a_step, 0)  # 0を最小値と仮定
-        self.param_a_slider.value = self._calculate_slider_value(param_a_value, 0, self.param_a_max)
+        self.controller.decrease('a')
         self._update_parameter_label('a')
     
+    @tracing.traced("TrainingApp.update_param_b")
     def update_param_b(self, sender):
         """ スライダーでパラメータBを更新 """
-        param_b_value = round(sender.value * self.param_b_max / self.param_b_step) * self.param_b_step
-        self.param_b_slider.value = self._calculate_slider_value(param_b_value, 0, self.param_b_max)
+        self.controller.set_fraction('b', sender.value)
         self._update_parameter_label('b')
     
+    @tracing.traced("TrainingApp.increase_param_b")
     def increase_param_b(self, sender):
         """ パラメータBを増加 """
-        param_b_value = min(self._calculate_parameter_value(self.param_b_slider.value, 0, self.param_b_max, self.param_b_step) + self.param_b_step, self.param_b_max)  # 200を最大値と仮定
-        self.param_b_slider.value = self._calculate_slider_value(param_b_value, 0, self.param_b_max)
+        self.controller.increase('b')
         self._update_parameter_label('b')
-    
+        
+    @tracing.traced("TrainingApp.decrease_param_b")
     def decrease_param_b(self, sender):
         """ パラメータBを減少 """
-        param_b_value = max(self._calculate_parameter_value(self.param_b_slider.value, 0, self.param_b_max, self.param_b_step) - self.param_b_step, 0)  # 0を最小値と仮定
-        self.param_b_slider.value = self._calculate_slider_value(param_b_value, 0, self.param_b_max)
+        self.controller.decrease('b')
         self._update_parameter_label('b')
     
+    @tracing.traced("TrainingApp.output_menu_name")
     def output_menu_name(self, sender):
         """ 種目名出力ボタンが押された時の処理 """
         selected_row = self.menu_table.selected_row
@@ -343,13 +456,13 @@ class TrainingApp(ui.View):
             console.hud_alert("🔍 メニューを選択してください", 'error')
             return
         
-        menu_name = self.menu_table.data_source.items[selected_row[1]]
-        output_text = f"- {menu_name}\n"
+        output_text = self.controller.menu_output_text(self.menu_data.display_name(*selected_row))
         
         if keyboard.is_keyboard():
             keyboard.insert_text(output_text)
         console.hud_alert("✅ トレーニング種目を設定しました", 'success')
 
+    @tracing.traced("TrainingApp.output_record")
     def output_record(self, sender):
         """ 記録ボタンが押された時の処理 """
         selected_row = self.menu_table.selected_row
@@ -357,44 +470,96 @@ class TrainingApp(ui.View):
             console.hud_alert("🔍 メニューを選択してください", 'error')
             return
         
-        menu_name = self.menu_table.data_source.items[selected_row[1]]
-        param_a = self._calculate_parameter_value(self.param_a_slider.value, 0, self.param_a_max, self.param_a_step)
-        param_b = self._calculate_parameter_value(self.param_b_slider.value, 0, self.param_b_max, self.param_b_step)
-        
         # パラメータが0で、かつステップが0でない場合は記録できない
-        if (param_a == 0 and self.param_a_step != 0) or (param_b == 0 and self.param_b_step != 0):
+        result = self.controller.record()
+        if result is None:
             console.hud_alert("⚠️ パラメータが0の場合は記録できません", 'error')
             return
         
-        # 最高記録を更新
-        is_record_a = param_a > self.best_a
-        is_record_b = param_b > self.best_b
+        if self.controller.session is not None:
+            # セッション中はテキストを溜めておき，次の種目の記録時・セッション終了時に種目ごとのブロックで出力する
+            self._insert_text(self.controller.session_text())
+            self._update_session_button()
+        else:
+            # 出力テキストの挿入
+            self._insert_text(result.text)
         
-        if is_record_a:
-            self.best_a = param_a
-        if is_record_b:
-            self.best_b = param_b
+        # 結果メッセージの表示
+        if result.is_new_record:
+            console.hud_alert("🏆 新記録達成！おめでとう！", 'success')
+        else:
+            console.hud_alert("🔥 素晴らしい！記録しました！", 'success')
+
+
+    @tracing.traced("TrainingApp.toggle_session")
+    def toggle_session(self, sender):
+        """ セッションボタンが押された時の処理 """
+        if self.controller.session is None:
+            self.controller.start_session()
+            console.hud_alert("⏱ セッションを開始しました", 'success')
+        else:
+            count = len(self.controller.session)
+            self._insert_text(self.controller.end_session())
+            console.hud_alert(f"🏁 セッション終了：{count}セットを保存しました", 'success')
+        self._update_session_button()
+
+    @ui.in_background
+    @tracing.traced("TrainingApp.choose_profile")
+    def choose_profile(self, sender):
+        """ プロフィールボタンが押された時の処理(一覧から選ぶか，新しいプロフィールを作成する) """
+        if self.controller.session is not None:
+            console.hud_alert("⚠️ セッション中はプロフィールを切り替えられません", 'error')
+            return
         
-        self._handle_record_output(menu_name, param_a, param_b)
+        import dialogs
+        name = dialogs.list_dialog("👤 プロフィール", self.profiles.names() + [self.NEW_PROFILE])
+        if name is None:
+            return
+        if name == self.NEW_PROFILE:
+            try:
+                name = self.profiles.create(console.input_alert("👤 新しいプロフィール", "名前を入力してください"))
+            except KeyboardInterrupt:
+                return
+            except ValueError as error:
+                console.hud_alert(f"⚠️ {error}", 'error')
+                return
+        
+        # 最近使ったプロフィールは開いたままのため，ファイルを読み直さずに切り替わる
+        try:
+            history = self.profiles.activate(name)
+        except ValueError as error:
+            console.hud_alert(f"⚠️ {error}", 'error', 5.0)
+            return
+        self._switch_profile(name, history)
+
+    @ui.on_main_thread
+    def _switch_profile(self, name, history):
+        """切り替えたプロフィールの履歴を画面へ反映する"""
+        if not self.controller.switch_history(history, self.profiles.path_of(name, TrainingSession.STAGING_PATH)):
+            console.hud_alert("⚠️ セッション中はプロフィールを切り替えられません", 'error')
+            return
+        self.profile_name = name
+        self.profile_button.title = f"👤 {name}"
+        self._update_session_button()
+        if self.controller.menu_name:
+            self._update_parameter_label('a')
+            self._update_parameter_label('b')
+        console.hud_alert(f"👤 {name} に切り替えました", 'success')
 
     
 def main():
-    view = TrainingApp()
+    with tracing.span("main"):
+        _show(TrainingApp())
+
+
+def _show(view):
+    """ビューを表示(キーボードの場合は表示範囲を更新する)"""
     if keyboard.is_keyboard():
-        keyboard.set_view(view, 'expanded')
-        # キーボード表示後にテーブルの一番下を選択してから元に戻す
-        # キーボード表示時にテーブルビューの高さが変わるため、一度一番下までスクロールして
-        # テーブルの表示範囲を更新する必要がある。その後、選択を元に戻すことで、
-        # テーブルビューが正しく表示される。
-        if view.menu_table.data_source.items:
-            last_row = len(view.menu_table.data_source.items) - 1
-            view.menu_table.selected_row = (0, last_row)
-            view.tableview_did_select(view.menu_table, 0, last_row)
-            # 少し遅延を入れてから元の選択に戻す
-            def restore_selection():
-                view.menu_table.selected_row = (0, 0)
-                view.tableview_did_select(view.menu_table, 0, 0)
-            ui.delay(restore_selection, 0.1)
+        with tracing.span("keyboard.set_view"):
+            keyboard.set_view(view, 'expanded')
+        # キーボード表示時にテーブルビューの高さが変わるため，表示後の大きさで配置する
+        # (テーブルの高さが変わった場合はlayout()で表示範囲を更新して選択中の行を表示し直す)
+        view.layout()
     else:
         view.present("sheet")
 if __name__ == "__main__":
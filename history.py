@@ -1,72 +1,112 @@
 # 過去のトレーニングデータを管理
 # 過去の重量・回数を保存，更新
 # 過去のトレーニングデータを表示
-# データはJSON形式で保存
+# 保存形式はstorage.pyのバックエンド(既定はJSON)に任せ，このクラスはメニュー名の確認と書き込みのタイミングを扱う
+# ファイルへの書き込みはHistoryWriterがバックグラウンドでまとめて行う
+# メニュー別・部位別の期間ごとの集計値と，時点・期間の問い合わせ用インデックス(set_index.py)は，
+# 初めて参照したときに作成し，以降は記録のたびに更新する
+# 起動を速くするため，保存先(storage)と集計(aggregates・set_index)のモジュールは初めて使うときに読み込む
 
-import os
-import json
-from dataclasses import dataclass
-from typing import Dict, Optional
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
 from menu_manager import MenuManager
+from set_log import SetRow
+from writer import HistoryWriter
+
+if TYPE_CHECKING:
+    from aggregates import Aggregate, HistoryAggregates
+    from set_index import SetIndex
+    from storage import HistoryStorage, TrainingRecord
+
+
+def __getattr__(name: str) -> Any:
+    """TrainingRecordは以前からhistoryモジュールにあったため，ここからも読み込めるようにする"""
+    if name == "TrainingRecord":
+        from storage import TrainingRecord
+        return TrainingRecord
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-@dataclass
-class TrainingRecord:
-    """トレーニング記録を保持するデータクラス"""
-    last_a: float
-    last_b: float
-    best_a: float
-    best_b: float
 
 class TrainingHistory:
     """トレーニング履歴を管理するクラス"""
-    FILE_PATH = "history_data.json"
+    # 保存先("json" / "sqlite" / "indexed" / "memory")
+    BACKEND = "json"
+    # 書き込みのタイミング("set" / "interval" / "exit")
+    DURABILITY = HistoryWriter.DURABILITY_INTERVAL
+    FLUSH_INTERVAL_MS = 500
+    # メモリ予算モードで記録をキャッシュする量の上限(バイト)．Noneの場合は保存先の全記録をメモリに持つ
+    # (記録をメニュー単位で読み込める保存先("sqlite" / "indexed")が必要．"json"と組み合わせると開く時にValueError)
+    MEMORY_BUDGET: Optional[int] = None
 
-    def __init__(self):
+    def __init__(self, menu_manager: Optional[MenuManager] = None, storage: Optional["HistoryStorage"] = None):
         """トレーニング履歴をロード"""
-        self.history: Dict[str, TrainingRecord] = self._load_history()
-        self.menu_manager = MenuManager()
-
-    def _load_history(self) -> Dict[str, TrainingRecord]:
-        """過去のトレーニングデータを読み込む"""
-        if not os.path.exists(self.FILE_PATH):
-            return {}
-
-        try:
-            with open(self.FILE_PATH, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return {
-                    menu_name: TrainingRecord(
-                        last_a=record["last_a"],
-                        last_b=record["last_b"],
-                        best_a=record["best_a"],
-                        best_b=record["best_b"]
-                    )
-                    for menu_name, record in data.items()
-                }
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"[警告] 履歴データの読み込みに失敗しました: {e}")
-            return {}
+        if storage is None:
+            from storage import open_storage
+            storage = open_storage(self.BACKEND, self.MEMORY_BUDGET)
+        self.storage = storage
+        # メニューは呼び出し元と共有し，menu.txtを二重に読み込まない
+        self.menu_manager = menu_manager or MenuManager.shared()
+        self._aggregates: Optional["HistoryAggregates"] = None
+        self._index: Optional["SetIndex"] = None
+
+        self.writer = HistoryWriter(
+            self.storage.flush,
+            durability=self.DURABILITY,
+            interval_ms=self.FLUSH_INTERVAL_MS
+        )
+
+    def refresh(self) -> bool:
+        """他のプロセスによる変更があれば取り込む(変更を取り込んだ場合はTrue)"""
+        return self.storage.refresh()
+
+    @property
+    def aggregates(self) -> "HistoryAggregates":
+        """メニュー別・部位別の期間ごとの集計値"""
+        self.refresh()
+        # 他のプロセスが記録したセットを取り込んでいた場合は集計し直す
+        if self._aggregates is None or self._aggregates.rows != self.storage.set_count():
+            self.rebuild_aggregates()
+        return self._aggregates
+
+    def invalidate_aggregates(self) -> None:
+        """集計値を破棄し，次に参照したときに作り直す(menu.txtでメニューの部位を変更した場合など)"""
+        self._aggregates = None
+
+    def rebuild_aggregates(self) -> None:
+        """全セットから集計値を作り直す(menu.txtでメニューの部位を変更した場合など)"""
+        from aggregates import HistoryAggregates
+        aggregates = HistoryAggregates(self.menu_manager)
+        aggregates.rebuild(self.storage.iter_sets())
+        self._aggregates = aggregates
+
+    @property
+    def index(self) -> "SetIndex":
+        """メニューごとの時点・期間の問い合わせ用インデックス"""
+        self.refresh()
+        # 他のプロセスが記録したセットを取り込んでいた場合は作り直す
+        if self._index is None or self._index.rows != self.storage.set_count():
+            from set_index import SetIndex
+            index = SetIndex()
+            index.rebuild(self.storage.iter_sets())
+            self._index = index
+        return self._index
+
+    def flush(self) -> None:
+        """未書き込みの履歴をその場で書き込む"""
+        self.writer.flush()
+
+    def close(self) -> None:
+        """書き込みスレッドを停止し，未書き込みの履歴を書き込んで保存先を閉じる"""
+        self.writer.close()
+        self.storage.close()
+
+    def compact(self) -> None:
+        """保存先を整理する(JSONではセットログとジャーナルをスナップショットへ畳み込む)"""
+        self.storage.compact()
 
     def save_history(self) -> None:
         """トレーニングデータを保存"""
-        try:
-            with open(self.FILE_PATH, "w", encoding="utf-8") as f:
-                json.dump(
-                    {
-                        menu_name: {
-                            "last_a": record.last_a,
-                            "last_b": record.last_b,
-                            "best_a": record.best_a,
-                            "best_b": record.best_b
-                        }
-                        for menu_name, record in self.history.items()
-                    },
-                    f,
-                    ensure_ascii=False,
-                    indent=2
-                )
-        except Exception as e:
-            print(f"[エラー] 履歴データの保存に失敗しました: {e}")
+        self.compact()
 
     def update_history(self, menu_name: str, last_a: float, last_b: float) -> None:
         """トレーニングデータを更新"""
@@ -77,31 +117,74 @@ class TrainingHistory:
         if not menu_name:
             return
 
-        # 現在の記録を取得
-        current_record = self.history.get(menu_name, TrainingRecord(0, 0, 0, 0))
-        
-        # 最高記録を更新
-        best_a = max(current_record.best_a, last_a)
-        best_b = max(current_record.best_b, last_b)
-        
-        # 記録を更新
-        self.history[menu_name] = TrainingRecord(
-            last_a=last_a,
-            last_b=last_b,
-            best_a=best_a,
-            best_b=best_b
-        )
-        
-        self.save_history()
-        print(f"[更新] {menu_name}: ({last_a}, {last_b}) を保存しました。最高記録: ({best_a}, {best_b})")
+        # セットを記録し，最終・最高記録へ反映
+        timestamp = time.time()
+        record = self.storage.add_set(timestamp, menu_name, last_a, last_b)
+        if self._aggregates is not None:
+            self._aggregates.add(timestamp, menu_name, last_a, last_b)
+        if self._index is not None:
+            self._index.add(timestamp, menu_name, last_a, last_b)
 
-    def get_last_training(self, menu_name: str) -> Optional[Dict[str, float]]:
-        """最後のトレーニングデータを取得"""
+        self.writer.submit()
+        print(f"[更新] {menu_name}: ({last_a}, {last_b}) を保存しました。最高記録: ({record.best_a}, {record.best_b})")
+
+    def add_sets(self, rows: List[SetRow], deduplicate: bool = True) -> int:
+        """確認済みのセット(メニュー名は正式名)をまとめて記録し，1回で書き込む(一括取り込み用)
+
+        deduplicateがTrueの場合は，記録済みのセット(時刻とメニューが同じもの)は記録し直さない
+        (セッションの書き込み直後に落ちて同じセットを再度書き込む場合や，同期で受け取ったセットなど)。
+        記録したセット数を返す。
+        """
+        if deduplicate:
+            rows = self._unrecorded(rows)
+        if not rows:
+            return 0
+        self.storage.add_sets(rows)
+        for timestamp, menu_name, a, b in rows:
+            if self._aggregates is not None:
+                self._aggregates.add(timestamp, menu_name, a, b)
+            if self._index is not None:
+                self._index.add(timestamp, menu_name, a, b)
+        self.writer.flush()
+        return len(rows)
+
+    def _unrecorded(self, rows: List[SetRow]) -> List[SetRow]:
+        """セットのうち，まだ記録されていないもの(時刻とメニューで判定する)"""
+        if not rows:
+            return rows
+        # 履歴は走査せず，インデックスの時刻の列を二分探索する(同じ呼び出しの中の重複は集合で除く)
+        index = self.index
+        seen = set()
+        unrecorded = []
+        for row in rows:
+            key = (row[0], row[1])
+            if key not in seen and not index.contains(*key):
+                seen.add(key)
+                unrecorded.append(row)
+        return unrecorded
+
+    def merge_records(self, records: Dict[str, "TrainingRecord"]) -> None:
+        """他の端末などの記録を統合し，その場で書き込む(bestは最大値，lastは新しい時刻の方)"""
+        if not records:
+            return
+        self.storage.import_records(records)
+        self.writer.flush()
+
+    def get_record(self, menu_name: str) -> Optional["TrainingRecord"]:
+        """メニューの記録を取得(保存先の記録をコピーせずに返す．記録が無ければNone)"""
         menu_name = self.menu_manager.find_menu_by_tag_or_name(menu_name)
         if not menu_name:
             return None
 
-        record = self.history.get(menu_name)
+        self.refresh()
+        return self.storage.get(menu_name)
+
+    def get_last_training(self, menu_name: str) -> Optional[Dict[str, float]]:
+        """最後のトレーニングデータを辞書で取得(呼び出すたびに辞書を作るため，get_record()を推奨)"""
+        if not self.menu_manager.find_menu_by_tag_or_name(menu_name):
+            return None
+
+        record = self.get_record(menu_name)
         if not record:
             return {"last_a": 0, "last_b": 0}
 
@@ -112,23 +195,57 @@ class TrainingHistory:
             "best_b": record.best_b
         }
 
+    def best_as_of(self, menu_name: str, when: float) -> Optional[Tuple[float, float]]:
+        """指定した時刻(を含む)までのメニューの最高記録 (best_a, best_b)．それまでに記録が無ければNone"""
+        menu_name = self.menu_manager.find_menu_by_tag_or_name(menu_name)
+        if not menu_name:
+            return None
+        return self.index.best_as_of(menu_name, when)
+
+    def range_stats(self, menu_name: str, since: Optional[float] = None,
+                    until: Optional[float] = None) -> "Aggregate":
+        """期間[since, until)のメニューのセット数・合計・最大値"""
+        from aggregates import Aggregate
+        menu_name = self.menu_manager.find_menu_by_tag_or_name(menu_name)
+        if not menu_name:
+            return Aggregate()
+        return self.index.stats(menu_name, since, until)
+
+    def monthly_stats(self, menu_name: str, months: int = 24, when: Optional[float] = None) -> Dict[str, "Aggregate"]:
+        """指定した時刻(省略時は現在)の月までのmonthsか月分の，月("YYYY-MM")ごとのメニューの集計値を古い順に返す"""
+        from set_index import month_starts
+        boundaries = month_starts(months, when)
+        stats = self.index.period_stats(self.menu_manager.find_menu_by_tag_or_name(menu_name) or "", boundaries)
+        return {time.strftime("%Y-%m", time.localtime(start)): aggregate for start, aggregate in zip(boundaries, stats)}
+
+    def iter_sets(self, menu_name: Optional[str] = None, since: Optional[float] = None,
+                  until: Optional[float] = None) -> Iterator[SetRow]:
+        """記録されたセットを (時刻, メニュー名, A, B) の形で順に返す
+
+        メニューと期間[since, until)で絞り込める(封印済みのセグメントは該当するものだけを読み込む)。
+        """
+        if menu_name is not None:
+            menu_name = self.menu_manager.find_menu_by_tag_or_name(menu_name)
+            if not menu_name:
+                return iter(())
+        return self.storage.iter_sets(menu_name, since, until)
+
     def remove_history(self, menu_name: str) -> None:
         """指定したメニューの履歴を削除"""
         menu_name = self.menu_manager.find_menu_by_tag_or_name(menu_name)
         if not menu_name:
             return
 
-        if menu_name in self.history:
-            del self.history[menu_name]
-            self.save_history()
+        if self.storage.remove(menu_name):
+            self.writer.submit()
             print(f"[削除] {menu_name} の履歴を削除しました。")
         else:
             print(f"[エラー] {menu_name} の履歴は存在しません。")
 
     def clear_history(self) -> None:
         """全トレーニング履歴を削除"""
-        self.history.clear()
-        self.save_history()
+        self.storage.clear()
+        self.compact()
         print("[リセット] 全トレーニング履歴を削除しました。")
 
     def _check_menu(self, menu_name: str) -> bool:
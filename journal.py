@@ -0,0 +1,112 @@
+# 履歴データの追記型ジャーナル
+# 更新1件につき1行(JSON)を追記する
+# スナップショットへの畳み込み(コンパクション)後は新しい内容へ置き換える
+# 読み込んだ位置を覚えておき，他のプロセスが追記した分だけを読み直せるようにする
+
+import os
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class HistoryJournal:
+    """追記専用のジャーナルファイルを管理するクラス"""
+
+    def __init__(self, path: str):
+        """ジャーナルファイルのパスを設定"""
+        self.path = path
+        self.count = 0
+        # 読み込み(書き込み)済みの位置と，その時点のファイルの識別子
+        self.offset = 0
+        self._identity: Optional[Tuple[int, int]] = None
+
+    def _stat(self) -> Optional[os.stat_result]:
+        """ジャーナルファイルの情報を返す(存在しなければNone)"""
+        try:
+            return os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+    def _read_from(self, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        """offsetバイト目以降のエントリと，読み終えた位置を返す"""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+
+        # 改行で終わっていない末尾の行は書き込み途中とみなして読まない
+        end = data.rfind(b"\n") + 1
+        entries = []
+        for line_num, line in enumerate(data[:end].splitlines(), 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line.decode("utf-8")))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                # 書き込み途中でクラッシュした行は読み飛ばす
+                print(f"[警告] ジャーナル {line_num}行目: 不正な行を読み飛ばしました。")
+        return entries, offset + end
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        """エントリを1行追記する"""
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with open(self.path, "ab") as f:
+            f.write((line + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            self.offset = f.tell()
+            stat = os.fstat(f.fileno())
+        self._identity = (stat.st_dev, stat.st_ino)
+        self.count += 1
+
+    def replay(self) -> List[Dict[str, Any]]:
+        """記録されたエントリを先頭から順に返す"""
+        stat = self._stat()
+        if stat is None:
+            self.count = self.offset = 0
+            self._identity = None
+            return []
+
+        entries, self.offset = self._read_from(0)
+        self._identity = (stat.st_dev, stat.st_ino)
+        self.count = len(entries)
+        return entries
+
+    def has_changes(self) -> bool:
+        """最後に読み書きした後に他のプロセスが変更したか"""
+        stat = self._stat()
+        if stat is None:
+            return self._identity is not None
+        return (stat.st_dev, stat.st_ino) != self._identity or stat.st_size != self.offset
+
+    def read_new(self) -> Optional[List[Dict[str, Any]]]:
+        """他のプロセスが追記したエントリを返す(ファイルが置き換えられていた場合はNone)"""
+        stat = self._stat()
+        if stat is None:
+            return None if self._identity is not None else []
+        if (stat.st_dev, stat.st_ino) != self._identity or stat.st_size < self.offset:
+            return None
+        if stat.st_size == self.offset:
+            return []
+
+        entries, self.offset = self._read_from(self.offset)
+        self.count += len(entries)
+        return entries
+
+    def truncate(self) -> None:
+        """ジャーナルを空にする"""
+        self.rewrite([])
+
+    def rewrite(self, entries: List[Dict[str, Any]]) -> None:
+        """ジャーナルを指定したエントリだけの内容に置き換える"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for entry in entries:
+                line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+                f.write((line + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            self.offset = f.tell()
+        os.replace(tmp_path, self.path)
+        stat = os.stat(self.path)
+        self._identity = (stat.st_dev, stat.st_ino)
+        self.count = len(entries)
@@ -0,0 +1,102 @@
+# TrainingAppの画面部品の配置(フレームの計画)
+# 配置は画面の(幅, 高さ, キーボードかどうか)だけで決まるため，部品ごとのフレームを一度に計算して
+# 大きさごとにキャッシュし，回転やキーボードの展開・折りたたみで同じ大きさに戻ったときは計算し直さない
+# 適用時は前回適用したフレームと比べ，変わった部品だけにフレームを設定する
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+# (x, y, 幅, 高さ)
+Frame = Tuple[float, float, float, float]
+# 部品の属性名 -> フレーム
+FramePlan = Dict[str, Frame]
+
+MARGIN = 10
+LABEL_HEIGHT = 30
+BUTTON_SIZE = 35  # 増減ボタンを少し小さく
+SLIDER_HEIGHT = 30
+BUTTON_WIDTH = 100
+VERTICAL_SPACING = 15  # 垂直方向の間隔を少し縮小
+# 左側(メニュー選択)の幅の割合
+LEFT_RATIO = 0.4
+
+
+def plan_frames(width: float, height: float, is_keyboard: bool) -> FramePlan:
+    """画面の大きさから全部品のフレームを計算する"""
+    if is_keyboard:
+        scale_factor = 1
+    else:
+        scale_factor = 1.0
+    margin = MARGIN
+    label_height = LABEL_HEIGHT
+    button_size = BUTTON_SIZE * scale_factor
+
+    left_width = width * LEFT_RATIO * scale_factor
+    right_width = width * (1 - LEFT_RATIO) * scale_factor
+    plan: FramePlan = {
+        "menu_label": (margin, margin, left_width - 2 * margin, label_height),
+        "search_field": (margin, margin + label_height, left_width - 2 * margin, label_height),
+        "menu_table": (margin, margin + 2 * label_height + margin / 2, left_width - 2 * margin, height - 2.5 * margin - 2 * label_height),
+    }
+
+    # パラメータA・Bのラベル・増減ボタン・スライダー(ラベルはスライダーと同じ幅で中央に置く)
+    param_x = left_width + margin
+    slider_width = right_width - 4 * margin - 2 * button_size
+    label_x = param_x + (right_width - 2 * margin - slider_width) / 2
+    param_y = margin
+    for param_type in ("a", "b"):
+        control_y = param_y + label_height
+        plan[f"param_{param_type}_label"] = (label_x, param_y, slider_width, label_height * 0.8)
+        plan[f"param_{param_type}_minus_button"] = (param_x, control_y, button_size, button_size)
+        plan[f"param_{param_type}_slider"] = (param_x + button_size + margin, control_y, slider_width, SLIDER_HEIGHT * scale_factor)
+        plan[f"param_{param_type}_plus_button"] = (param_x + right_width - 2 * margin - button_size, control_y, button_size, button_size)
+        param_y = control_y + button_size + margin
+
+    # 出力ボタン(3つのボタンが右側に収まるように幅を調整)
+    output_y = param_y - margin + VERTICAL_SPACING
+    output_button_height = BUTTON_SIZE * 0.8 * scale_factor
+    button_width = min(BUTTON_WIDTH, (right_width - 4 * margin) / 3) * scale_factor
+    for index, name in enumerate(("menu_output_button", "record_output_button", "session_button")):
+        plan[name] = (param_x + index * (button_width + margin), output_y, button_width, output_button_height)
+
+    # プロフィールボタン(出力ボタンの下に，3つのボタンと同じ幅で置く)
+    plan["profile_button"] = (param_x, output_y + output_button_height + margin, 3 * button_width + 2 * margin, output_button_height)
+    return plan
+
+
+class LayoutEngine:
+    """フレームの計画を大きさごとにキャッシュし，変わった部品だけに適用するクラス"""
+    # キャッシュする計画の数(縦・横とキーボードの展開・折りたたみの組み合わせ程度)
+    CACHE_SIZE = 8
+
+    def __init__(self):
+        """空のキャッシュを作成"""
+        self._plans: "OrderedDict[Tuple[float, float, bool], FramePlan]" = OrderedDict()
+        # 最後に適用したフレーム
+        self._applied: FramePlan = {}
+
+    def plan(self, width: float, height: float, is_keyboard: bool) -> FramePlan:
+        """大きさに対応する計画を返す(キャッシュに無ければ計算する)"""
+        key = (width, height, is_keyboard)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plans[key] = plan_frames(width, height, is_keyboard)
+            if len(self._plans) > self.CACHE_SIZE:
+                self._plans.popitem(last=False)
+        else:
+            self._plans.move_to_end(key)
+        return plan
+
+    def apply(self, view: Any, width: float, height: float, is_keyboard: bool) -> List[str]:
+        """計画のうち前回と変わったフレームだけを部品に設定し，設定した部品の属性名を返す"""
+        changed = []
+        for name, frame in self.plan(width, height, is_keyboard).items():
+            if self._applied.get(name) != frame:
+                getattr(view, name).frame = frame
+                self._applied[name] = frame
+                changed.append(name)
+        return changed
+
+    def invalidate(self) -> None:
+        """次の適用で全部品にフレームを設定し直す"""
+        self._applied.clear()
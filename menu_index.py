@@ -0,0 +1,161 @@
+# メニュー検索用のインデックス
+# 表示文字列「(ターゲット) 名前」→名前，ターゲット→名前一覧，文字n-gram→メニュー番号を事前に構築する
+# 入力中の絞り込みは直前の結果を再利用して行う
+# menu.txtの再読み込み時はadd()/remove()で変化したメニューだけを更新する
+# (削除したメニューの番号は欠番として残し，追加したメニューは末尾の番号になる)
+# n-gramの転置リストは検索にしか使わないため，起動時には作らず最初の検索(またはprepare_search())で作る
+
+import threading
+from typing import Dict, List, Optional, Set
+
+
+class MenuIndex:
+    """メニュー名・ターゲットの検索インデックス"""
+    # n-gramの長さ(日本語の短いメニュー名を想定して2文字)
+    NGRAM = 2
+
+    def __init__(self, menus: Dict):
+        """メニュー一覧からインデックスを構築"""
+        # メニューの並び順(menu.txtの記載順)を番号として使う
+        self.names: List[str] = list(menus.keys())
+        self.targets: List[str] = [menu.target for menu in menus.values()]
+        self.displays: List[str] = [f"({target}) {name}" for name, target in zip(self.names, self.targets)]
+        self.display_to_name: Dict[str, str] = dict(zip(self.displays, self.names))
+        self.target_to_names: Dict[str, List[str]] = {}
+        for name, target in zip(self.names, self.targets):
+            self.target_to_names.setdefault(target, []).append(name)
+        # ターゲットごとのメニュー番号(出現順)
+        self.target_positions: Dict[str, List[int]] = {}
+        for position, target in enumerate(self.targets):
+            self.target_positions.setdefault(target, []).append(position)
+
+        # 検索は大文字・小文字を区別しない
+        self._keys: List[str] = [display.lower() for display in self.displays]
+        # n-gram→メニュー番号(作成前はNone．起動時の読み込みスレッドと画面から同時に作られないようロックする)
+        self._grams: Optional[Dict[str, Set[int]]] = None
+        self._grams_lock = threading.Lock()
+
+        # メニュー名→番号(display_of()などで初めて使うときに作成する)
+        self._positions: Optional[Dict[str, int]] = None
+        # 削除されたメニューの番号
+        self._removed: Set[int] = set()
+
+        # 直前の検索(入力中の絞り込みに使う)
+        self._last_query: Optional[str] = None
+        self._last_result: List[int] = []
+
+    def _split(self, text: str) -> Set[str]:
+        """文字列を1文字と2文字のn-gramに分解"""
+        grams = set(text)
+        grams.update(text[i:i + self.NGRAM] for i in range(len(text) - self.NGRAM + 1))
+        return grams
+
+    def prepare_search(self) -> Dict[str, Set[int]]:
+        """n-gramの転置リストを作成して返す(作成済みならそれを返す)"""
+        with self._grams_lock:
+            if self._grams is None:
+                grams: Dict[str, Set[int]] = {}
+                for position, key in enumerate(self._keys):
+                    for gram in self._split(key):
+                        grams.setdefault(gram, set()).add(position)
+                self._grams = grams
+            return self._grams
+
+    def display(self, position: int) -> str:
+        """メニュー番号に対応する表示文字列を返す"""
+        return self.displays[position]
+
+    def _position_map(self) -> Dict[str, int]:
+        """メニュー名→番号の対応表"""
+        if self._positions is None:
+            self._positions = {
+                name: position for position, name in enumerate(self.names) if position not in self._removed
+            }
+        return self._positions
+
+    def position_of(self, name: str) -> Optional[int]:
+        """メニュー名に対応する番号を返す(存在しなければNone)"""
+        return self._position_map().get(name)
+
+    def display_of(self, name: str) -> str:
+        """メニュー名に対応する表示文字列を返す"""
+        return self.displays[self._position_map()[name]]
+
+    def add(self, name: str, target: str) -> int:
+        """メニューを末尾の番号で追加し，その番号を返す"""
+        position = len(self.names)
+        display = f"({target}) {name}"
+        self.names.append(name)
+        self.targets.append(target)
+        self.displays.append(display)
+        self.display_to_name[display] = name
+        self.target_to_names.setdefault(target, []).append(name)
+        self.target_positions.setdefault(target, []).append(position)
+        self._keys.append(display.lower())
+        with self._grams_lock:
+            # 転置リストが未作成なら，作成時に追加したメニューも含まれる
+            if self._grams is not None:
+                for gram in self._split(self._keys[position]):
+                    self._grams.setdefault(gram, set()).add(position)
+        self._position_map()[name] = position
+        self._last_query = None
+        return position
+
+    def remove(self, name: str) -> None:
+        """メニューを削除する(番号は欠番になる)"""
+        position = self._position_map().pop(name, None)
+        if position is None:
+            return
+        target = self.targets[position]
+        self.display_to_name.pop(self.displays[position], None)
+        self.target_to_names[target].remove(name)
+        self.target_positions[target].remove(position)
+        # メニューが無くなったターゲットは一覧から外す
+        if not self.target_positions[target]:
+            del self.target_positions[target]
+            del self.target_to_names[target]
+        with self._grams_lock:
+            if self._grams is not None:
+                for gram in self._split(self._keys[position]):
+                    self._grams[gram].discard(position)
+            self._keys[position] = ""
+        self._removed.add(position)
+        self._last_query = None
+
+    def search(self, query: str) -> List[str]:
+        """部分一致するメニューの表示文字列を並び順で返す"""
+        return [self.displays[position] for position in self.search_positions(query)]
+
+    def search_positions(self, query: str) -> List[int]:
+        """部分一致するメニューの番号を並び順で返す"""
+        query = query.strip().lower()
+        if not query:
+            return [position for position in range(len(self.names)) if position not in self._removed]
+
+        if self._last_query is not None and self._last_query in query:
+            # 直前の検索語を含む入力なら，直前の結果の中だけを調べればよい
+            candidates = self._last_result
+        else:
+            candidates = self._candidates(query)
+
+        result = [position for position in candidates if query in self._keys[position]]
+        self._last_query, self._last_result = query, result
+        return result
+
+    def _candidates(self, query: str) -> List[int]:
+        """n-gramの転置リストから候補となるメニュー番号を求める"""
+        if len(query) < self.NGRAM:
+            grams = [query]
+        else:
+            grams = [query[i:i + self.NGRAM] for i in range(len(query) - self.NGRAM + 1)]
+
+        index = self.prepare_search()
+        postings = [index.get(gram) for gram in grams]
+        if not all(postings):
+            return []
+        # 件数の少ない転置リストから順に絞り込む
+        postings.sort(key=len)
+        positions = set(postings[0])
+        for posting in postings[1:]:
+            positions &= posting
+        return sorted(positions)
@@ -1,80 +1,283 @@
 import os
-from typing import Dict, List, Optional, Tuple, Union
+import sys
+import hashlib
+import marshal
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple, Union
 from dataclasses import dataclass
+import tracing
+from menu_index import MenuIndex
 
-@dataclass
+# 設定は変更できない(frozen)ため，同じ内容の設定は1つのインスタンスを共有する
+# __slots__により1インスタンスあたりの__dict__も持たない
+
+@dataclass(frozen=True, slots=True)
 class ParameterConfig:
     """パラメータの設定を保持するデータクラス"""
     unit: str
     step: float
     max: float = 200.0
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class MenuConfig:
     """メニューの設定を保持するデータクラス"""
     target: str
     param_a: ParameterConfig
     param_b: ParameterConfig
 
+@dataclass(frozen=True, slots=True)
+class MenuChange:
+    """menu.txtの再読み込みで変化したメニューを保持するデータクラス"""
+    kind: str
+    name: str
+    # 変更後・変更前の設定(追加の場合はpreviousが，削除の場合はmenuがNone)
+    menu: Optional[MenuConfig] = None
+    previous: Optional[MenuConfig] = None
+
+    ADD = "add"
+    REMOVE = "remove"
+    MODIFY = "modify"
+
+    @property
+    def target_changed(self) -> bool:
+        """ターゲット(部位)が変わったか(追加・削除を含む)"""
+        return self.menu is None or self.previous is None or self.menu.target != self.previous.target
+
 class MenuManager:
     """メニュー管理クラス"""
     FILE_PATH = "menu.txt"
+    # 解析済みのメニューを保存するキャッシュ(menu.txtの更新日時・サイズ・ハッシュが一致する間だけ使う)
+    CACHE_PATH = "menu.txt.cache"
+    CACHE_VERSION = 1
+
+    _shared: Optional["MenuManager"] = None
 
     def __init__(self):
         """メニュー管理クラスの初期化"""
-        self.menus: Dict[str, MenuConfig] = self._load_menus()
+        # 再読み込みで差分を取るための，読み込み時のmenu.txtの(更新日時, サイズ)と各行
+        self._file_key: Optional[Tuple[int, int]] = None
+        self._lines: List[str] = []
+        self._listeners: List[Callable[[List[MenuChange]], None]] = []
+        # 同じ内容のパラメータ設定を共有するための表
+        self._parameters: Dict[ParameterConfig, ParameterConfig] = {}
+        with tracing.span("MenuManager._load_menus"):
+            self.menus: Dict[str, MenuConfig] = self._load_menus()
+        with tracing.span("MenuIndex", menus=len(self.menus)):
+            self.index = MenuIndex(self.menus)
+
+    @classmethod
+    def shared(cls) -> "MenuManager":
+        """アプリ全体で共有するインスタンスを返す"""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
 
     def _load_menus(self) -> Dict[str, MenuConfig]:
-        """menu.txtからメニューを読み込む"""
-        menus: Dict[str, MenuConfig] = {}
-        
+        """menu.txtからメニューを読み込む(キャッシュが有効ならそちらを使う)"""
         if not os.path.exists(self.FILE_PATH):
             print(f"[警告] {self.FILE_PATH} が存在しません。")
-            return menus
+            return {}
 
         try:
-            with open(self.FILE_PATH, "r", encoding="utf-8") as f:
-                for line_num, line in enumerate(f, 1):
-                    try:
-                        parts = line.strip().split(",")
-                        if len(parts) not in [6, 8]:
-                            print(f"[警告] {line_num}行目: 不正なフォーマットです。")
-                            continue
-
-                        name = parts[0]
-                        target = parts[1]
-                        param_a = ParameterConfig(
-                            unit=parts[2],
-                            step=float(parts[3])
-                        )
-                        param_b = ParameterConfig(
-                            unit=parts[4],
-                            step=float(parts[5])
-                        )
-
-                        # 最大値が指定されている場合
-                        if len(parts) == 8:
-                            param_a.max = float(parts[6])
-                            param_b.max = float(parts[7])
-                        else:
-                            param_a.max = 200
-                            param_b.max = 200
-                            
-                        menus[name] = MenuConfig(
-                            target=target,
-                            param_a=param_a,
-                            param_b=param_b
-                        )
-
-                    except (ValueError, IndexError) as e:
-                        print(f"[警告] {line_num}行目: データの解析に失敗しました - {e}")
-                        continue
-
+            stat = os.stat(self.FILE_PATH)
+            with open(self.FILE_PATH, "rb") as f:
+                content = f.read()
         except Exception as e:
             print(f"[エラー] ファイルの読み込みに失敗しました - {e}")
+            return {}
+
+        try:
+            lines = content.decode("utf-8").splitlines()
+        except UnicodeDecodeError as e:
+            print(f"[エラー] ファイルの読み込みに失敗しました - {e}")
+            return {}
+        self._file_key = (stat.st_mtime_ns, stat.st_size)
+        self._lines = lines
+
+        key = (self.CACHE_VERSION, stat.st_mtime_ns, stat.st_size, hashlib.sha1(content).hexdigest())
+        menus = self._load_cache(key)
+        if menus is not None:
+            tracing.instant("menu_cache.hit")
+            return menus
+        tracing.instant("menu_cache.miss")
+
+        menus = self._parse_menus(lines)
 
+        self._save_cache(key, menus)
         return menus
 
+    def _load_cache(self, key: Tuple) -> Optional[Dict[str, MenuConfig]]:
+        """キャッシュが有効であれば読み込む"""
+        try:
+            with open(self.CACHE_PATH, "rb") as f:
+                cache_key, rows = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if cache_key != key:
+            return None
+
+        return {
+            name: MenuConfig(
+                target=sys.intern(target),
+                param_a=self._parameter(unit_a, step_a, max_a),
+                param_b=self._parameter(unit_b, step_b, max_b)
+            )
+            for name, target, unit_a, step_a, max_a, unit_b, step_b, max_b in rows
+        }
+
+    def _parameter(self, unit: str, step: float, max: float) -> ParameterConfig:
+        """パラメータ設定を作成する(同じ内容の設定が既にあればそれを返す)"""
+        config = ParameterConfig(unit=sys.intern(unit), step=step, max=max)
+        return self._parameters.setdefault(config, config)
+
+    def _save_cache(self, key: Tuple, menus: Dict[str, MenuConfig]) -> None:
+        """解析済みのメニューをキャッシュへ保存"""
+        rows = [
+            (
+                name, menu.target,
+                menu.param_a.unit, menu.param_a.step, menu.param_a.max,
+                menu.param_b.unit, menu.param_b.step, menu.param_b.max
+            )
+            for name, menu in menus.items()
+        ]
+        tmp_path = self.CACHE_PATH + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                marshal.dump((key, rows), f)
+            os.replace(tmp_path, self.CACHE_PATH)
+        except OSError as e:
+            # キャッシュは無くても動作するため警告のみ
+            print(f"[警告] メニューキャッシュの保存に失敗しました - {e}")
+
+    def _parse_menus(self, lines: List[str]) -> Dict[str, MenuConfig]:
+        """menu.txtの各行を解析する"""
+        menus: Dict[str, MenuConfig] = {}
+
+        for line_num, line in enumerate(lines, 1):
+            parsed = self._parse_line(line, line_num)
+            if parsed:
+                menus[parsed[0]] = parsed[1]
+
+        return menus
+
+    def _parse_line(self, line: str, line_num: int) -> Optional[Tuple[str, MenuConfig]]:
+        """menu.txtの1行を解析し，(メニュー名, 設定)を返す(不正な行はNone)"""
+        try:
+            parts = line.strip().split(",")
+            if len(parts) not in [6, 8]:
+                print(f"[警告] {line_num}行目: 不正なフォーマットです。")
+                return None
+
+            name = parts[0]
+            target = sys.intern(parts[1])
+
+            # 最大値が指定されている場合
+            if len(parts) == 8:
+                max_a = float(parts[6])
+                max_b = float(parts[7])
+            else:
+                max_a = 200
+                max_b = 200
+
+            return name, MenuConfig(
+                target=target,
+                param_a=self._parameter(parts[2], float(parts[3]), max_a),
+                param_b=self._parameter(parts[4], float(parts[5]), max_b)
+            )
+
+        except (ValueError, IndexError) as e:
+            print(f"[警告] {line_num}行目: データの解析に失敗しました - {e}")
+            return None
+
+    def add_listener(self, listener: Callable[[List[MenuChange]], None]) -> None:
+        """再読み込みでメニューが変化したときに呼ぶ関数を登録"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[List[MenuChange]], None]) -> None:
+        """登録した関数を解除"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    @tracing.traced("MenuManager.reload")
+    def reload(self) -> List[MenuChange]:
+        """menu.txtが更新されていれば変更された行だけを解析して反映し，変化したメニューを返す
+
+        更新日時とサイズが変わっていなければファイルは読まない。
+        追加されたメニューは一覧の末尾に加わる(menu.txt上の位置は次回の起動時に反映される)。
+        """
+        try:
+            stat = os.stat(self.FILE_PATH)
+        except FileNotFoundError:
+            return []
+        if (stat.st_mtime_ns, stat.st_size) == self._file_key:
+            return []
+
+        try:
+            with open(self.FILE_PATH, "rb") as f:
+                lines = f.read().decode("utf-8").splitlines()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"[エラー] ファイルの読み込みに失敗しました - {e}")
+            return []
+        self._file_key = (stat.st_mtime_ns, stat.st_size)
+
+        # 追加・削除された行(同じ内容の行は変化なしとみなす)
+        old_counts = Counter(line.strip() for line in self._lines)
+        new_counts = Counter(line.strip() for line in lines)
+        changed_lines = (old_counts - new_counts) + (new_counts - old_counts)
+        self._lines = lines
+        changed_names = {line.split(",", 1)[0] for line in changed_lines if line}
+        if not changed_names:
+            return []
+
+        # 変化したメニュー名の，新しいmenu.txtでの最後の行だけを解析する(同じ名前の行は後の行が優先)
+        last_lines: Dict[str, Tuple[int, str]] = {}
+        for line_num, line in enumerate(lines, 1):
+            name = line.strip().split(",", 1)[0]
+            if name in changed_names:
+                last_lines[name] = (line_num, line)
+        parsed = {}
+        for name, (line_num, line) in last_lines.items():
+            result = self._parse_line(line, line_num)
+            if result and result[0] == name:
+                parsed[name] = result[1]
+
+        changes: List[MenuChange] = []
+        for name in changed_names:
+            previous = self.menus.get(name)
+            menu = parsed.get(name)
+            if menu == previous:
+                continue
+            if previous is None:
+                changes.append(MenuChange(MenuChange.ADD, name, menu=menu))
+            elif menu is None:
+                changes.append(MenuChange(MenuChange.REMOVE, name, previous=previous))
+            else:
+                changes.append(MenuChange(MenuChange.MODIFY, name, menu=menu, previous=previous))
+
+        self._apply_changes(changes)
+        if changes:
+            print(f"[情報] {self.FILE_PATH} の変更を反映しました({len(changes)}件)。")
+            for listener in list(self._listeners):
+                listener(changes)
+        return changes
+
+    def _apply_changes(self, changes: List[MenuChange]) -> None:
+        """変化したメニューだけをメニュー一覧とインデックスへ反映"""
+        for change in changes:
+            if change.kind == MenuChange.REMOVE:
+                del self.menus[change.name]
+                self.index.remove(change.name)
+            elif change.kind == MenuChange.ADD:
+                self.menus[change.name] = change.menu
+                self.index.add(change.name, change.menu.target)
+            else:
+                self.menus[change.name] = change.menu
+                # 検索インデックスはメニュー名とターゲットだけを持つ
+                if change.target_changed:
+                    self.index.remove(change.name)
+                    self.index.add(change.name, change.menu.target)
+
     def get_menu(self, menu_input: str) -> Optional[MenuConfig]:
         """指定したメニューの情報を取得"""
         name = self.find_menu_by_tag_or_name(menu_input)
@@ -90,7 +293,15 @@ class MenuManager:
 
     def get_menu_tagandnames(self) -> List[str]:
         """全メニュー名とタグを取得"""
-        return [f"({menu.target}) {name}" for name, menu in self.menus.items()]
+        return list(self.index.displays)
+
+    def get_menu_names_by_target(self, target: str) -> List[str]:
+        """指定したターゲットのメニュー名を取得"""
+        return list(self.index.target_to_names.get(target, []))
+
+    def search_menus(self, query: str) -> List[str]:
+        """名前・タグに部分一致するメニュー(タグ付きの名前)を取得"""
+        return self.index.search(query)
 
     def find_menu_by_tag_or_name(self, input_str: str) -> Optional[str]:
         """タグまたは名前でメニューを検索し、名前を返す"""
@@ -102,15 +313,7 @@ class MenuManager:
             return input_str
 
         # タグ付きの名前での検索
-        if input_str.startswith("(") and ")" in input_str:
-            try:
-                _, name = input_str[1:].split(") ", 1)
-                if name in self.menus:
-                    return name
-            except ValueError:
-                pass
-
-        return None
+        return self.index.display_to_name.get(input_str)
 
     @staticmethod
     def check_menu_file() -> Tuple[bool, str]:
@@ -0,0 +1,86 @@
+# JSON形式の履歴をSQLiteデータベース(またはハッシュ表付きの履歴ファイル)へ移行するツール
+# 複数のhistory_data.jsonをまとめて1つのトランザクションで取り込む(SQLiteの場合，途中で失敗すると何も書き込まない)
+# 同じディレクトリにジャーナル・セットログがあれば，それらを反映した記録と全セットを取り込む
+# 同じメニューの記録が複数あれば，bestは最大値，lastは新しい時刻の方を残す
+#
+# 使い方:
+#   python migrate.py history_data.json [他のhistory_data.json ...] [--db history_data.sqlite3]
+#   python migrate.py history_data.json --backend indexed [--db history_data.idx]
+
+import argparse
+import os
+import sys
+from typing import Dict, List, Tuple
+from set_log import SetRow
+from storage import IndexedStorage, JsonStorage, SqliteStorage, TrainingRecord, merge_record
+
+# 移行先のバックエンド(どちらもimport_records()で記録とセットをまとめて取り込む)
+TARGETS = {
+    "sqlite": SqliteStorage,
+    "indexed": IndexedStorage,
+}
+
+
+def load_json_history(path: str) -> Tuple[Dict[str, TrainingRecord], List[SetRow]]:
+    """JSON形式の履歴(スナップショット・ジャーナル・セットログ)を読み込む"""
+    directory = os.path.dirname(path)
+    base = os.path.splitext(path)[0]
+    storage = JsonStorage(
+        file_path=path,
+        journal_path=base + ".journal",
+        set_log_dir=os.path.join(directory, JsonStorage.SET_LOG_DIR),
+        lock_path=base + ".lock",
+        archive_dir=os.path.join(directory, JsonStorage.ARCHIVE_DIR)
+    )
+    return storage.records(), list(storage.iter_sets())
+
+
+def migrate(paths: List[str], db_path: str, backend: str = "sqlite") -> Tuple[int, int]:
+    """JSON形式の履歴を移行先へ取り込み，(メニュー数, セット数)を返す"""
+    records: Dict[str, TrainingRecord] = {}
+    sets: List[SetRow] = []
+    for path in paths:
+        file_records, file_sets = load_json_history(path)
+        for menu_name, record in file_records.items():
+            records[menu_name] = merge_record(records.get(menu_name), record)
+        sets.extend(file_sets)
+    # 複数のファイルのセットは時刻順に並べ直す
+    sets.sort(key=lambda row: row[0])
+
+    if backend == "indexed":
+        # セットログは移行先のファイルと同じディレクトリに作る
+        directory = os.path.dirname(db_path)
+        storage = IndexedStorage(
+            db_path,
+            set_log_dir=os.path.join(directory, IndexedStorage.SET_LOG_DIR),
+            lock_path=db_path + ".lock"
+        )
+    else:
+        storage = TARGETS[backend](db_path)
+    try:
+        storage.import_records(records, sets)
+    finally:
+        storage.close()
+    return len(records), len(sets)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="JSON形式の履歴をSQLite・ハッシュ表付きの履歴ファイルへ移行")
+    parser.add_argument("paths", nargs="+", help="history_data.jsonのパス")
+    parser.add_argument("--backend", choices=tuple(TARGETS), default="sqlite", help="移行先の形式")
+    parser.add_argument("--db", help="移行先のファイル(省略時は形式ごとの既定のファイル)")
+    args = parser.parse_args()
+    db_path = args.db or TARGETS[args.backend].FILE_PATH
+
+    missing = [path for path in args.paths if not os.path.exists(path)]
+    if missing:
+        print(f"[エラー] ファイルが見つかりません: {', '.join(missing)}")
+        return 1
+
+    menu_count, set_count = migrate(args.paths, db_path, args.backend)
+    print(f"[移行] {menu_count}メニュー・{set_count}セットを {db_path} へ取り込みました。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
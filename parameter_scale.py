@@ -0,0 +1,68 @@
+# パラメータの値を目盛り(ステップの整数倍)で扱うモデル
+# 値は目盛り番号(整数)で保持し，小数点以下の桁数や表示形式はメニュー選択時に一度だけ求める
+# スライダーや+/-ボタンの操作は整数の計算だけで済み，2.5kgや0.1kmのような刻みでも誤差が溜まらない
+
+from menu_manager import ParameterConfig
+
+
+class ParameterScale:
+    """1つのパラメータの目盛りと現在値を保持するクラス"""
+
+    def __init__(self, config: ParameterConfig):
+        """パラメータ設定から目盛りを作成"""
+        self.unit = config.unit
+        self.step = config.step
+        self.max = config.max
+        # ステップが0の場合は値を持たない(常に0)
+        self.max_tick = int(config.max / config.step + 1e-9) if config.step else 0
+        self.is_integer = float(config.step).is_integer()
+        # 表示する小数点以下の桁数(例: 2.5 → 1, 0.25 → 2)
+        self.decimals = 0 if self.is_integer else len(repr(float(config.step)).split('.')[1])
+        self._format = "{:.%df} {}" % self.decimals
+        self.tick = 0
+
+    def value_of(self, tick: int):
+        """目盛り番号に対応する値を返す"""
+        if self.is_integer:
+            return int(tick * self.step)
+        return round(tick * self.step, self.decimals)
+
+    @property
+    def value(self):
+        """現在の値"""
+        return self.value_of(self.tick)
+
+    @property
+    def fraction(self) -> float:
+        """スライダー上の位置(0.0〜1.0)"""
+        return self.tick / self.max_tick if self.max_tick else 0.0
+
+    def set_value(self, value: float) -> None:
+        """値を最も近い目盛りに合わせて設定"""
+        self.tick = self._clamp(round(value / self.step) if self.step else 0)
+
+    def set_fraction(self, fraction: float) -> None:
+        """スライダー上の位置から最も近い目盛りに合わせて設定"""
+        self.tick = self._clamp(round(fraction * self.max_tick))
+
+    def increase(self) -> None:
+        """1目盛り増やす"""
+        self.tick = self._clamp(self.tick + 1)
+
+    def decrease(self) -> None:
+        """1目盛り減らす"""
+        self.tick = self._clamp(self.tick - 1)
+
+    def _clamp(self, tick: int) -> int:
+        """目盛り番号を範囲内に収める"""
+        return min(max(tick, 0), self.max_tick)
+
+    def can_record(self) -> bool:
+        """記録できる値か(ステップが0でないのに値が0の場合は記録できない)"""
+        return self.tick != 0 or self.step == 0
+
+    def label(self) -> str:
+        """「値 単位」の表示文字列"""
+        if self.is_integer:
+            return f"{self.value} {self.unit}"
+        return self._format.format(self.tick * self.step, self.unit)
@@ -0,0 +1,119 @@
+# プロフィール(トレーニングする人)ごとのトレーニング履歴
+# 既定のプロフィールは従来どおり作業ディレクトリの履歴を使い，それ以外のプロフィールは
+# profiles/<名前>/ に同じファイル名で保存する(保存先の形式はTrainingHistory.BACKENDに従う)
+# 開いた履歴は最近使った順にCACHE_SIZE件まで保持し，切り替え直したときはファイルを読み直さずにそのまま使う
+# 上限を超えたら最も長く使っていない履歴を閉じる(未書き込みの記録は閉じるときに書き込む)
+# 選択中のプロフィールはファイルに保存し，本体アプリとキーボード拡張で共有する
+# 起動を速くするため，履歴(history)と保存先(storage)のモジュールは初めて履歴を開くときに読み込む
+
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Optional
+from menu_manager import MenuManager
+
+if TYPE_CHECKING:
+    from history import TrainingHistory
+
+
+class ProfileManager:
+    """プロフィールごとの履歴を開き，最近使ったものを保持するクラス"""
+    PROFILE_DIR = "profiles"
+    ACTIVE_PATH = "active_profile.txt"
+    # 作業ディレクトリの履歴を使うプロフィール
+    DEFAULT_PROFILE = "default"
+    # 開いたまま保持する履歴の数(選択中のプロフィールを含む)
+    CACHE_SIZE = 3
+
+    def __init__(self, menu_manager: Optional[MenuManager] = None):
+        """プロフィールの一覧を扱う(履歴はopen()で初めて開く)"""
+        # 省略時は履歴を開くときにMenuManager.shared()を使う(起動時にメニュー一覧の読み込みを待たない)
+        self.menu_manager = menu_manager
+        self._histories: "OrderedDict[str, TrainingHistory]" = OrderedDict()
+        # 起動時の読み込みスレッドと画面から呼ばれる
+        self._lock = threading.RLock()
+
+    def directory_of(self, name: str) -> Optional[str]:
+        """プロフィールの履歴のディレクトリ(既定のプロフィールはNoneで，作業ディレクトリを使う)"""
+        if name == self.DEFAULT_PROFILE:
+            return None
+        return os.path.join(self.PROFILE_DIR, name)
+
+    def path_of(self, name: str, file_name: str) -> str:
+        """プロフィールごとに持つファイル(セッションのステージングファイルなど)のパス"""
+        return os.path.join(self.directory_of(name) or "", file_name)
+
+    def names(self) -> List[str]:
+        """プロフィールの一覧(既定のプロフィールが先頭で，残りは名前順)"""
+        try:
+            entries = os.listdir(self.PROFILE_DIR)
+        except FileNotFoundError:
+            entries = []
+        names = sorted(
+            entry for entry in entries
+            if entry != self.DEFAULT_PROFILE and os.path.isdir(os.path.join(self.PROFILE_DIR, entry))
+        )
+        return [self.DEFAULT_PROFILE] + names
+
+    def create(self, name: str) -> str:
+        """プロフィールを作成し，その名前を返す(作成済みの場合はそのまま返す)"""
+        name = name.strip()
+        if not name or name.startswith(".") or "/" in name or os.sep in name:
+            raise ValueError(f"不正なプロフィール名です: {name}")
+        directory = self.directory_of(name)
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        return name
+
+    @property
+    def active(self) -> str:
+        """選択中のプロフィール(未選択または削除済みの場合は既定のプロフィール)"""
+        try:
+            with open(self.ACTIVE_PATH, "r", encoding="utf-8") as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return self.DEFAULT_PROFILE
+        directory = self.directory_of(name) if name else None
+        if directory is None or not os.path.isdir(directory):
+            return self.DEFAULT_PROFILE
+        return name
+
+    def activate(self, name: str) -> "TrainingHistory":
+        """プロフィールを選択し，その履歴を返す"""
+        history = self.open(name)
+        tmp_path = self.ACTIVE_PATH + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(name + "\n")
+        os.replace(tmp_path, self.ACTIVE_PATH)
+        return history
+
+    def open(self, name: str) -> "TrainingHistory":
+        """プロフィールの履歴を返す(保持していなければ開き，上限を超えた分は閉じる)"""
+        with self._lock:
+            history = self._histories.get(name)
+            if history is not None:
+                self._histories.move_to_end(name)
+                return history
+            if name not in self.names():
+                raise ValueError(f"プロフィールが見つかりません: {name}")
+
+            from history import TrainingHistory
+            from storage import open_storage
+            storage = open_storage(TrainingHistory.BACKEND, TrainingHistory.MEMORY_BUDGET, self.directory_of(name))
+            history = self._histories[name] = TrainingHistory(self.menu_manager or MenuManager.shared(), storage)
+            while len(self._histories) > self.CACHE_SIZE:
+                _, evicted = self._histories.popitem(last=False)
+                evicted.close()
+            return history
+
+    def loaded(self) -> List[str]:
+        """開いている履歴のプロフィール(最近使った順)"""
+        with self._lock:
+            return list(reversed(self._histories))
+
+    def close(self) -> None:
+        """開いている全ての履歴を閉じる(未書き込みの記録を書き込む)"""
+        with self._lock:
+            while self._histories:
+                _, history = self._histories.popitem()
+                history.close()
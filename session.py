@@ -0,0 +1,174 @@
+# トレーニングのセッション(1回分のワークアウト)
+# セッション中はセットをメモリに溜め，キーボードへの出力は種目ごと(またはセッションごと)に
+# Markdownのブロックとして1回で挿入し，履歴への書き込みもまとめて1回で行う
+# 溜めている間にアプリが落ちても失わないよう，セットは追記型のステージングファイルにも書いておき，
+# 次に起動したときにそこから再開する
+#
+# ステージングファイルの形式(1行1操作のJSON):
+#   {"op": "start", "output": "exercise"}         セッション開始(出力の単位)
+#   {"op": "set", "timestamp": ..., "menu": ..., "display": ..., "a": ..., "b": ..., "text": ...}
+#   {"op": "emitted", "count": n}                  先頭からn件をキーボードへ出力済み
+#   {"op": "committing", "count": n}               先頭からn件を履歴へ書き込み中(書き込み後に"committed"が続く)
+#   {"op": "committed", "count": n}                先頭からn件を履歴へ書き込み済み
+
+import os
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from set_log import SetRow
+
+
+@dataclass
+class SessionSet:
+    """セッション中に記録した1セットを保持するデータクラス"""
+    timestamp: float
+    menu_name: str
+    display_name: str
+    param_a: float
+    param_b: float
+    # キーボードへ出力する行
+    text: str
+
+
+class TrainingSession:
+    """セッション中のセットを溜めておき，まとめて出力・書き込みするクラス"""
+    STAGING_PATH = "session_staging.jsonl"
+    # キーボードへの出力の単位
+    OUTPUT_EXERCISE = "exercise"  # 別の種目を記録したときに，前の種目のブロックを出力
+    OUTPUT_SESSION = "session"    # セッション終了時に全種目をまとめて出力
+    OUTPUTS = (OUTPUT_EXERCISE, OUTPUT_SESSION)
+
+    def __init__(self, output: str = OUTPUT_EXERCISE, staging_path: Optional[str] = None, resume: bool = False):
+        """セッションを開始(resumeがTrueの場合はステージングファイルから再開)"""
+        if output not in self.OUTPUTS:
+            raise ValueError(f"不正な出力の単位です: {output}")
+        self.output = output
+        self.staging_path = staging_path or self.STAGING_PATH
+        self.sets: List[SessionSet] = []
+        # キーボードへ出力済み・履歴へ書き込み済みのセット数
+        self.emitted = 0
+        self.committed = 0
+        # 履歴へ書き込み始めたセット数(書き込み済みより多い場合は，書き込みの途中で落ちた可能性がある)
+        self.committing = 0
+        if resume:
+            self._load()
+        else:
+            self._append({"op": "start", "output": output}, mode="wb")
+
+    @classmethod
+    def resume(cls, staging_path: Optional[str] = None) -> Optional["TrainingSession"]:
+        """前回終了していないセッションがあれば再開する"""
+        if not os.path.exists(staging_path or cls.STAGING_PATH):
+            return None
+        return cls(staging_path=staging_path, resume=True)
+
+    def _append(self, entry: Dict[str, Any], mode: str = "ab") -> None:
+        """ステージングファイルへ1行追記する"""
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with open(self.staging_path, mode) as f:
+            f.write((line + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _load(self) -> None:
+        """ステージングファイルからセッションを復元"""
+        with open(self.staging_path, "rb") as f:
+            lines = f.read().split(b"\n")
+        for line in lines:
+            try:
+                entry = json.loads(line.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                # 空行と，書き込み途中で落ちた行は読み飛ばす
+                continue
+            op = entry.get("op")
+            if op == "start":
+                self.output = entry.get("output", self.OUTPUT_EXERCISE)
+            elif op == "set":
+                self.sets.append(SessionSet(
+                    timestamp=entry["timestamp"],
+                    menu_name=entry["menu"],
+                    display_name=entry["display"],
+                    param_a=entry["a"],
+                    param_b=entry["b"],
+                    text=entry["text"]
+                ))
+            elif op == "emitted":
+                self.emitted = entry["count"]
+            elif op == "committing":
+                self.committing = entry["count"]
+            elif op == "committed":
+                self.committed = entry["count"]
+
+    def __len__(self) -> int:
+        """記録したセット数"""
+        return len(self.sets)
+
+    def add(self, session_set: SessionSet) -> None:
+        """1セットを記録する"""
+        self._append({
+            "op": "set",
+            "timestamp": session_set.timestamp,
+            "menu": session_set.menu_name,
+            "display": session_set.display_name,
+            "a": session_set.param_a,
+            "b": session_set.param_b,
+            "text": session_set.text
+        })
+        self.sets.append(session_set)
+
+    def take_text(self, current_menu: Optional[str] = None, final: bool = False) -> str:
+        """まだ出力していないセットをMarkdownのブロックにして返す
+
+        種目ごとの出力では，記録中の種目(current_menu)のブロックは別の種目を記録するまで残しておく。
+        finalがTrueの場合は残りをすべて返す。
+        """
+        if self.output == self.OUTPUT_SESSION and not final:
+            return ""
+
+        stop = len(self.sets)
+        if not final:
+            # 末尾の記録中の種目の続きは，まだ終わっていないので出力しない
+            while stop > self.emitted and self.sets[stop - 1].menu_name == current_menu:
+                stop -= 1
+        if stop <= self.emitted:
+            return ""
+
+        lines = []
+        previous = None
+        for session_set in self.sets[self.emitted:stop]:
+            # 同じ種目が続く間は見出しを1回だけ出す
+            if session_set.menu_name != previous:
+                lines.append(f"- {session_set.display_name}\n")
+                previous = session_set.menu_name
+            lines.append(session_set.text)
+        self.emitted = stop
+        self._append({"op": "emitted", "count": stop})
+        return "".join(lines)
+
+    def uncommitted_rows(self) -> List[SetRow]:
+        """まだ履歴へ書き込んでいないセット"""
+        return [
+            (session_set.timestamp, session_set.menu_name, session_set.param_a, session_set.param_b)
+            for session_set in self.sets[self.committed:]
+        ]
+
+    def interrupted_commit(self) -> bool:
+        """前回の履歴への書き込みが，書き込み済みの印を付ける前に中断されたか"""
+        return self.committing > self.committed
+
+    def mark_committing(self) -> None:
+        """全セットを履歴へ書き込み中にする(書き込みの直前に呼ぶ)"""
+        self.committing = len(self.sets)
+        self._append({"op": "committing", "count": self.committing})
+
+    def mark_committed(self) -> None:
+        """全セットを履歴へ書き込み済みにする"""
+        self.committed = len(self.sets)
+        self._append({"op": "committed", "count": self.committed})
+
+    def discard(self) -> None:
+        """ステージングファイルを削除する(セッション終了時)"""
+        try:
+            os.remove(self.staging_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,235 @@
+# セット履歴の時点・期間の問い合わせ用インデックス
+# メニューごとにセットを時刻順に並べ，時刻の列・A・Bの最大値のセグメント木・A・B・ボリュームの累積和を持つ
+# 「ある日時の時点での最高記録」「期間内の最大値・合計」を，履歴を走査せずにO(log n)で求める
+# (期間の端は時刻の列の二分探索，合計は累積和の差，最大値はセグメント木の区間の問い合わせ)
+# 記録のたびに末尾へ追加して更新し(O(log n))，時刻が前後するセット(他の端末からの取り込みなど)が
+# 混ざった場合だけ，次の問い合わせでそのメニューを並べ直して作り直す
+
+import bisect
+import operator
+import time
+from array import array
+from itertools import accumulate, islice
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from aggregates import Aggregate
+from set_log import SetRow
+
+
+def month_starts(count: int, when: Optional[float] = None) -> List[float]:
+    """時刻(省略時は現在)が属する月を最後とするcountか月分の月初と，その翌月の月初の時刻を古い順に返す(count + 1個)"""
+    now = time.localtime(when)
+    starts = []
+    for offset in range(count, -1, -1):
+        year, month = divmod(now.tm_year * 12 + now.tm_mon - offset, 12)
+        starts.append(time.mktime((year, month + 1, 1, 0, 0, 0, 0, 0, -1)))
+    return starts
+
+
+class MaxTree:
+    """最大値のセグメント木
+
+    最下段は値の列そのもので，その上の段にBLOCK個ずつの最大値を持ち，さらに上の段は下の段の2つずつの最大値を持つ
+    (段の長さが奇数の場合は末尾をそのまま上げる)。最下段の2つずつを比べる段を省き，作成を速くする。
+    """
+    # 最下段の1ブロックの値の数(区間の端のブロックはスライスの最大値で求める)
+    BLOCK = 16
+
+    def __init__(self, values: array):
+        """値の列から木を作る(値の列は最下段としてそのまま使う)"""
+        block = self.BLOCK
+        self.levels: List[array] = [values, array("d", (max(values[i:i + block]) for i in range(0, len(values), block)))]
+        level = self.levels[1]
+        while len(level) > 1:
+            upper = array("d", map(max, level[0::2], level[1::2]))
+            if len(level) % 2:
+                upper.append(level[-1])
+            self.levels.append(upper)
+            level = upper
+
+    def append(self, value: float) -> None:
+        """末尾に値を追加し，上の段を更新する(O(log n))"""
+        levels = self.levels
+        levels[0].append(value)
+        index = (len(levels[0]) - 1) // self.BLOCK
+        if index < len(levels[1]):
+            levels[1][index] = max(levels[1][index], value)
+        else:
+            levels[1].append(value)
+        depth = 2
+        while len(levels[depth - 1]) > 1:
+            if depth == len(levels):
+                levels.append(array("d"))
+            lower, parent = levels[depth - 1], index >> 1
+            value = max(lower[2 * parent:2 * parent + 2])
+            if parent < len(levels[depth]):
+                levels[depth][parent] = value
+            else:
+                levels[depth].append(value)
+            index, depth = parent, depth + 1
+
+    def query(self, start: int, stop: int) -> float:
+        """[start, stop)の最大値(空の区間は0)"""
+        values, block = self.levels[0], self.BLOCK
+        # 端のブロックに収まらない部分だけを木でたどる
+        first, last = -(-start // block), stop // block
+        if first >= last:
+            return max(values[start:stop], default=0.0)
+        result = max(values[start:first * block], default=0.0)
+        result = max(result, max(values[last * block:stop], default=0.0))
+        start, stop = first, last
+        for level in self.levels[1:]:
+            if start >= stop:
+                break
+            if start & 1:
+                result = max(result, level[start])
+                start += 1
+            if stop & 1:
+                stop -= 1
+                result = max(result, level[stop])
+            start >>= 1
+            stop >>= 1
+        return result
+
+
+class MenuSeries:
+    """1メニュー分のセットを時刻順に保持するクラス"""
+
+    def __init__(self, timestamps: Optional[array] = None, a: Optional[array] = None, b: Optional[array] = None):
+        """時刻・A・Bの列から作成(省略時は空)"""
+        self.timestamps = array("d") if timestamps is None else timestamps
+        self.a = array("d") if a is None else a
+        self.b = array("d") if b is None else b
+        # 時刻順に並んでいるか(並んでいなければ次の問い合わせで作り直す)
+        self.ordered = all(map(operator.le, self.timestamps, islice(self.timestamps, 1, None)))
+        self._built = False
+
+    def __len__(self) -> int:
+        """セット数"""
+        return len(self.timestamps)
+
+    def add(self, timestamp: float, a: float, b: float) -> None:
+        """1セット分を加える"""
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            self.ordered = False
+        self.timestamps.append(timestamp)
+        if self._built and self.ordered:
+            self.a_tree.append(a)
+            self.b_tree.append(b)
+            self.sum_a.append(self.sum_a[-1] + a)
+            self.sum_b.append(self.sum_b[-1] + b)
+            self.volume.append(self.volume[-1] + a * b)
+        else:
+            self.a.append(a)
+            self.b.append(b)
+            self._built = False
+
+    def build(self) -> None:
+        """時刻順に並べ直し，セグメント木と累積和を作る"""
+        if not self.ordered:
+            order = sorted(range(len(self.timestamps)), key=self.timestamps.__getitem__)
+            self.timestamps = array("d", map(self.timestamps.__getitem__, order))
+            self.a = array("d", map(self.a.__getitem__, order))
+            self.b = array("d", map(self.b.__getitem__, order))
+            self.ordered = True
+        # セグメント木の最下段はa・bの列そのもの(追加すると列にも追加される)
+        self.a_tree = MaxTree(self.a)
+        self.b_tree = MaxTree(self.b)
+        # 先頭に0を置いた累積和([i, j)の合計はsum[j] - sum[i])
+        self.sum_a = array("d", accumulate(self.a, initial=0.0))
+        self.sum_b = array("d", accumulate(self.b, initial=0.0))
+        self.volume = array("d", accumulate(map(operator.mul, self.a, self.b), initial=0.0))
+        self._built = True
+
+    def span(self, since: Optional[float], until: Optional[float]) -> Tuple[int, int]:
+        """期間[since, until)に含まれるセットの位置の範囲"""
+        if not self._built:
+            self.build()
+        start = 0 if since is None else bisect.bisect_left(self.timestamps, since)
+        stop = len(self.timestamps) if until is None else bisect.bisect_left(self.timestamps, until)
+        return start, max(start, stop)
+
+    def contains(self, timestamp: float) -> bool:
+        """その時刻のセットがあるか"""
+        if not self.ordered:
+            self.build()
+        index = bisect.bisect_left(self.timestamps, timestamp)
+        return index < len(self.timestamps) and self.timestamps[index] == timestamp
+
+    def best_as_of(self, when: float) -> Optional[Tuple[float, float]]:
+        """時刻when(を含む)までの最高記録 (best_a, best_b)．それまでにセットが無ければNone"""
+        if not self._built:
+            self.build()
+        stop = bisect.bisect_right(self.timestamps, when)
+        if stop == 0:
+            return None
+        return self.a_tree.query(0, stop), self.b_tree.query(0, stop)
+
+    def stats(self, since: Optional[float] = None, until: Optional[float] = None) -> Aggregate:
+        """期間[since, until)の集計値"""
+        start, stop = self.span(since, until)
+        if start == stop:
+            return Aggregate()
+        return Aggregate(
+            count=stop - start,
+            volume=self.volume[stop] - self.volume[start],
+            sum_a=self.sum_a[stop] - self.sum_a[start],
+            sum_b=self.sum_b[stop] - self.sum_b[start],
+            max_a=self.a_tree.query(start, stop),
+            max_b=self.b_tree.query(start, stop)
+        )
+
+
+class SetIndex:
+    """メニューごとのセットの時点・期間の問い合わせに答えるクラス"""
+
+    def __init__(self):
+        """空のインデックスを作成"""
+        self.menus: Dict[str, MenuSeries] = {}
+        # 登録したセット数
+        self.rows = 0
+
+    def add(self, timestamp: float, menu_name: str, a: float, b: float) -> None:
+        """1セット分を加える"""
+        series = self.menus.get(menu_name)
+        if series is None:
+            series = self.menus[menu_name] = MenuSeries()
+        series.add(timestamp, a, b)
+        self.rows += 1
+
+    def rebuild(self, rows: Iterable[SetRow]) -> None:
+        """全セットから作り直す(セグメント木と累積和はメニューごとに初めて問い合わせたときに作る)"""
+        # メニューごとの列に振り分けてからまとめて作成する
+        columns: Dict[str, Tuple[array, array, array]] = {}
+        count = 0
+        for timestamp, menu_name, a, b in rows:
+            column = columns.get(menu_name)
+            if column is None:
+                column = columns[menu_name] = (array("d"), array("d"), array("d"))
+            column[0].append(timestamp)
+            column[1].append(a)
+            column[2].append(b)
+            count += 1
+        self.menus = {menu_name: MenuSeries(*column) for menu_name, column in columns.items()}
+        self.rows = count
+
+    def contains(self, timestamp: float, menu_name: str) -> bool:
+        """時刻とメニューが同じセットが登録されているか(O(log n))"""
+        series = self.menus.get(menu_name)
+        return series is not None and series.contains(timestamp)
+
+    def best_as_of(self, menu_name: str, when: float) -> Optional[Tuple[float, float]]:
+        """時刻when(を含む)までのメニューの最高記録 (best_a, best_b)．記録が無ければNone"""
+        series = self.menus.get(menu_name)
+        return series.best_as_of(when) if series else None
+
+    def stats(self, menu_name: str, since: Optional[float] = None, until: Optional[float] = None) -> Aggregate:
+        """期間[since, until)のメニューの集計値(セット数・合計・最大値)"""
+        series = self.menus.get(menu_name)
+        return series.stats(since, until) if series else Aggregate()
+
+    def period_stats(self, menu_name: str, boundaries: Sequence[float]) -> List[Aggregate]:
+        """昇順の区切りの時刻で分けた期間ごとのメニューの集計値(len(boundaries) - 1個)"""
+        series = self.menus.get(menu_name)
+        if series is None:
+            return [Aggregate() for _ in boundaries[1:]]
+        return [series.stats(since, until) for since, until in zip(boundaries, boundaries[1:])]
@@ -0,0 +1,253 @@
+# 1セットごとのトレーニング記録(時系列ログ)
+# 列(時刻・メニュー・パラメータA・パラメータB)ごとに固定長のバイナリファイルへ追記する
+# 読み込みはarrayへ直接展開するため，件数が増えてもPythonオブジェクトは生成しない
+# 複数のプロセスが追記する場合は，呼び出し側でファイルロックを取ってから
+# refresh()で他のプロセスの追記分を取り込み，その後にflush()する
+# ディレクトリを持たないセットログ(from_columns())は，封印済みのセグメント(archive.py)を展開した読み取り専用の列として使う
+
+import os
+import threading
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# (時刻, メニュー名, パラメータA, パラメータB)
+SetRow = Tuple[float, str, float, float]
+
+
+class SetLog:
+    """セット単位の記録を列指向で保持するクラス"""
+    # 列名とarrayの型コード
+    COLUMNS = (("timestamp", "d"), ("menu", "I"), ("a", "d"), ("b", "d"))
+    MENU_FILE = "menus.txt"
+
+    def __init__(self, directory: Optional[str]):
+        """ログディレクトリを読み込む(Noneの場合はファイルを持たない)"""
+        self.directory = directory
+        self.columns: Dict[str, array] = {name: array(code) for name, code in self.COLUMNS}
+        self.menu_names: List[str] = []
+        self._menu_ids: Dict[str, int] = {}
+        # ファイルに書き込み済みの行数・メニュー数と，メニュー名ファイルの読み込み位置
+        self._persisted = 0
+        self._persisted_names = 0
+        self._names_offset = 0
+        # 追加と書き込みは別スレッドから呼ばれることがある
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, array], menu_names: List[str]) -> "SetLog":
+        """列の配列とメニュー名一覧から，ファイルを持たないセットログを作る"""
+        set_log = cls(None)
+        set_log.columns = columns
+        for name in menu_names:
+            set_log._register_name(name)
+        set_log._persisted_names = len(menu_names)
+        set_log._persisted = len(set_log)
+        return set_log
+
+    def _column_path(self, name: str) -> str:
+        """列ファイルのパスを返す"""
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _menu_path(self) -> str:
+        """メニュー名ファイルのパスを返す"""
+        return os.path.join(self.directory, self.MENU_FILE)
+
+    def _read_names(self) -> List[str]:
+        """メニュー名ファイルのうち未読の行を読み込む"""
+        try:
+            with open(self._menu_path(), "rb") as f:
+                f.seek(self._names_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        # 改行で終わっていない末尾の行は書き込み途中とみなして読まない
+        end = data.rfind(b"\n") + 1
+        self._names_offset += end
+        return [line.decode("utf-8") for line in data[:end].split(b"\n")[:-1]]
+
+    def _rows_on_disk(self) -> int:
+        """列ファイルに書き込まれている(全列が揃っている)行数"""
+        rows = []
+        for name, column in self.columns.items():
+            try:
+                rows.append(os.path.getsize(self._column_path(name)) // column.itemsize)
+            except FileNotFoundError:
+                return 0
+        return min(rows)
+
+    def _register_name(self, name: str) -> None:
+        """ファイルから読み込んだメニュー名を登録"""
+        # 複数のプロセスが同じ名前を登録した場合は最初のIDを使う(どちらのIDの行も同じ名前になる)
+        self._menu_ids.setdefault(name, len(self.menu_names))
+        self.menu_names.append(name)
+
+    def _load(self) -> None:
+        """列ファイルとメニュー名一覧を読み込む"""
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+
+        for name in self._read_names():
+            self._register_name(name)
+        self._persisted_names = len(self.menu_names)
+
+        rows = self._rows_on_disk()
+        for name, column in self.columns.items():
+            path = self._column_path(name)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                column.fromfile(f, rows)
+            # 追記途中で落ちた場合は列ごとに行数がずれるため，最短の列に揃える
+            if os.path.getsize(path) > rows * column.itemsize:
+                os.truncate(path, rows * column.itemsize)
+        self._persisted = rows
+
+    def __len__(self) -> int:
+        """記録されているセット数を返す"""
+        return len(self.columns["timestamp"])
+
+    @property
+    def persisted(self) -> int:
+        """ファイルに書き込み済みの行数"""
+        return self._persisted
+
+    def menu_id(self, menu_name: str) -> int:
+        """メニュー名に対応するIDを返す(未登録なら登録する)"""
+        menu_id = self._menu_ids.get(menu_name)
+        if menu_id is None:
+            menu_id = len(self.menu_names)
+            self._menu_ids[menu_name] = menu_id
+            self.menu_names.append(menu_name)
+        return menu_id
+
+    def append(self, timestamp: float, menu_name: str, a: float, b: float) -> int:
+        """1セット分の記録を追加し，その行番号を返す"""
+        with self._lock:
+            self.columns["timestamp"].append(timestamp)
+            self.columns["menu"].append(self.menu_id(menu_name))
+            self.columns["a"].append(a)
+            self.columns["b"].append(b)
+            return len(self) - 1
+
+    def row(self, index: int) -> SetRow:
+        """指定した行を返す"""
+        return (
+            self.columns["timestamp"][index],
+            self.menu_names[self.columns["menu"][index]],
+            self.columns["a"][index],
+            self.columns["b"][index]
+        )
+
+    def rows(self, start: int = 0, menu_name: Optional[str] = None, stop: Optional[int] = None) -> Iterator[SetRow]:
+        """start行目以降(stop行目の手前まで)の記録を順に返す(メニューで絞り込み可能)"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if menu_name is None:
+            for index in range(start, stop):
+                yield self.row(index)
+            return
+
+        menu_ids = {menu_id for menu_id, name in enumerate(self.menu_names) if name == menu_name}
+        if not menu_ids:
+            return
+        menu_column = self.columns["menu"]
+        for index in range(start, stop):
+            if menu_column[index] in menu_ids:
+                yield self.row(index)
+
+    def has_changes(self) -> bool:
+        """他のプロセスが追記したか"""
+        if self.directory is None or not os.path.isdir(self.directory):
+            return False
+        try:
+            names_size = os.path.getsize(self._menu_path())
+        except FileNotFoundError:
+            names_size = 0
+        return names_size != self._names_offset or self._rows_on_disk() != self._persisted
+
+    def refresh(self) -> Tuple[int, int]:
+        """他のプロセスが追記したメニュー名と行を読み込み，追加された行の範囲を返す
+
+        未書き込みの行は追加された行の後ろへ移る(行番号がその分ずれる)。
+        """
+        with self._flush_lock:
+            start = self._persisted
+            if self.directory is None or not os.path.isdir(self.directory):
+                return start, start
+
+            foreign_names = self._read_names()
+            count = self._rows_on_disk() - start
+            if count <= 0 and not foreign_names:
+                return start, start
+
+            foreign = {name: array(code) for name, code in self.COLUMNS}
+            if count > 0:
+                for name, column in foreign.items():
+                    with open(self._column_path(name), "rb") as f:
+                        f.seek(start * column.itemsize)
+                        column.fromfile(f, count)
+            else:
+                count = 0
+
+            with self._lock:
+                # 未書き込みの行とメニュー名をいったん外す
+                pending = {name: column[start:] for name, column in self.columns.items()}
+                for column in self.columns.values():
+                    del column[start:]
+                local_names = self.menu_names[self._persisted_names:]
+                first_local_id = self._persisted_names
+                del self.menu_names[first_local_id:]
+                for name in local_names:
+                    if self._menu_ids.get(name, -1) >= first_local_id:
+                        del self._menu_ids[name]
+
+                # 他のプロセスの分を書き込み済みとして追加
+                for name in foreign_names:
+                    self._register_name(name)
+                self._persisted_names = len(self.menu_names)
+                for name, column in self.columns.items():
+                    column.extend(foreign[name])
+                self._persisted += count
+
+                # 未書き込みの行を後ろへ戻す(メニューIDは登録し直す)
+                remap = [self.menu_id(name) for name in local_names]
+                pending["menu"] = array("I", (
+                    remap[menu_id - first_local_id] if menu_id >= first_local_id else menu_id
+                    for menu_id in pending["menu"]
+                ))
+                for name, column in self.columns.items():
+                    column.extend(pending[name])
+
+            return start, start + count
+
+    def flush(self, stop: Optional[int] = None) -> None:
+        """未書き込みの行(stop行目の手前まで)を列ファイルへ追記する"""
+        with self._flush_lock:
+            # 書き込む範囲だけをロック中に確定し，ファイル操作中も追加できるようにする
+            with self._lock:
+                stop = len(self) if stop is None else min(stop, len(self))
+                names = self.menu_names[self._persisted_names:]
+                chunks = {name: column[self._persisted:stop] for name, column in self.columns.items()}
+
+            if not names and stop <= self._persisted:
+                return
+
+            os.makedirs(self.directory, exist_ok=True)
+
+            # 行がメニューIDを参照するため，先にメニュー名を書き込む
+            if names:
+                with open(self._menu_path(), "ab") as f:
+                    f.write("".join(name + "\n" for name in names).encode("utf-8"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._names_offset = f.tell()
+                self._persisted_names += len(names)
+
+            for name, chunk in chunks.items():
+                with open(self._column_path(name), "ab") as f:
+                    chunk.tofile(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._persisted = max(self._persisted, stop)
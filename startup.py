@@ -0,0 +1,75 @@
+# 起動時の読み込みの並行化
+# メニュー一覧(menu.txt)は最初の画面に必要なため呼び出し元のスレッドで読み込み，
+# 履歴は最初の画面を作り終えてからワーカースレッドで読み込み，結果をFutureで受け取る
+# 前回の記録・最高記録の反映は履歴が届いてから行う(gui.py)
+# 読み込みはCPUを使う処理が主でGILを取り合うため，画面の作成と同時に履歴を読み込むと，
+# かえって最初の画面が遅くなる(保存先のモジュール(storage)もワーカースレッドで初めて読み込む)
+# メニュー検索用のn-gramの転置リストは起動時には作らず，検索欄を選択したときにワーカースレッドで作り始める
+# 履歴は選択中のプロフィールのものを開き，開いた履歴はprofilesに保持する(profiles.py)
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional
+import tracing
+from menu_manager import MenuManager
+from profiles import ProfileManager
+
+if TYPE_CHECKING:
+    from history import TrainingHistory
+
+
+class StartupPipeline:
+    """メニュー一覧を読み込み，履歴をワーカースレッドで読み込むクラス"""
+    # 履歴の読み込みと検索インデックスの作成で1スレッド(GILを取り合うため，増やしても速くならない)
+    WORKERS = 1
+
+    # 起動のたびにスレッドを作り直さないよう，スレッドプールはプロセスで共有する
+    # (キーボードは同じプロセスで何度も開かれる．使っていない間のスレッドは待機しているだけ)
+    _executor: Optional[ThreadPoolExecutor] = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self):
+        """メニュー一覧を読み込む(履歴はload_history()で読み込みを始め，historyのFutureで受け取る)"""
+        self.profiles = ProfileManager()
+        # 起動時に開くプロフィール
+        self.profile = self.profiles.active
+        with tracing.span("startup.catalog"):
+            self.menu_manager = MenuManager.shared()
+        self.profiles.menu_manager = self.menu_manager
+        self.history: "Future[TrainingHistory]" = Future()
+
+    @classmethod
+    def executor(cls) -> ThreadPoolExecutor:
+        """共有のスレッドプール(初回に作成する)"""
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=cls.WORKERS, thread_name_prefix="startup")
+            return cls._executor
+
+    def load_history(self) -> "Future[TrainingHistory]":
+        """履歴の読み込みを開始する(最初の画面を作り終えてから呼ぶ)"""
+        self.executor().submit(self._load_history)
+        return self.history
+
+    @classmethod
+    def prepare_search(cls, menu_manager: MenuManager) -> Future:
+        """最初の検索を待たせないよう，検索インデックスをバックグラウンドで作る(検索欄を選択したときに呼ぶ)"""
+        return cls.executor().submit(cls._prepare_search, menu_manager)
+
+    def _load_history(self) -> None:
+        """選択中のプロフィールの履歴を読み込み，結果をhistoryへ設定する"""
+        if not self.history.set_running_or_notify_cancel():
+            return
+        try:
+            with tracing.span("startup.history"):
+                history = self.profiles.open(self.profile)
+        except BaseException as error:
+            self.history.set_exception(error)
+        else:
+            self.history.set_result(history)
+
+    @staticmethod
+    def _prepare_search(menu_manager: MenuManager) -> None:
+        """検索インデックスを作る(作成済みの場合は何もしない)"""
+        with tracing.span("startup.search_index"):
+            menu_manager.index.prepare_search()
@@ -0,0 +1,1556 @@
+# トレーニング履歴の保存先(バックエンド)
+# TrainingHistoryはHistoryStorageのメソッドだけを呼び出し，保存形式には依存しない
+#   JsonStorage   : スナップショット(JSON)＋ジャーナル＋セットログ＋月ごとの封印済みセグメント(既定)
+#   SqliteStorage : SQLiteデータベース(WALモード，メニュー・時刻のインデックス付き)
+#   IndexedStorage: メニュー名のハッシュ表付きのバイナリファイル(mmapで1メニューずつ読み書きする)
+#   MemoryStorage : メモリ上だけに保持する(ファイルを作らない．動作確認用)
+#   CachedStorage : 他のバックエンドの記録をメニュー単位で読み込み，使用量の上限内でキャッシュする(メモリ予算モード)
+# どのバックエンドも最終・最高記録の統合規則は同じ(bestは最大値，lastは更新番号の大きい方．同じなら新しい時刻の方)
+# セットは追記順の位置(set_position())を持ち，封印などで行が移っても変わらない(同期で前回送った位置を覚えるため)
+
+import os
+import sys
+import json
+import math
+import mmap
+import shutil
+import sqlite3
+import struct
+import threading
+import zlib
+import tracing
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import partial
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from archive import SegmentArchive, month_start
+from file_lock import FileLock
+from journal import HistoryJournal
+from set_log import SetLog, SetRow
+
+
+# 記録は変更できない(frozen)ため，保存先が持つインスタンスをコピーせずに呼び出し側へ渡せる
+@dataclass(frozen=True, slots=True)
+class TrainingRecord:
+    """トレーニング記録を保持するデータクラス"""
+    last_a: float
+    last_b: float
+    best_a: float
+    best_b: float
+    # 最終記録の時刻(複数のプロセスの記録を統合するときに新しい方を残すため)
+    last_ts: float = 0.0
+    # 更新番号(セットを反映するたびに1つ進め，統合では大きい方を引き継ぐ論理時計)
+    # 端末間の統合では時刻より優先するため，時計のずれた端末の記録でも，他の端末の記録を受け取った後の更新が残る
+    version: int = 0
+
+
+def merge_set(current: Optional[TrainingRecord], a: float, b: float, timestamp: Optional[float] = None) -> TrainingRecord:
+    """記録に1セット分の更新を反映し，更新番号を1つ進めた記録を返す(lastとbestは同じセットを何度反映しても変わらない)"""
+    if current is None:
+        current = TrainingRecord(0, 0, 0, 0)
+    # 時刻が古いセット(他のプロセスが後から書き込んだもの)ではlastを更新しない
+    is_newer = timestamp is None or timestamp >= current.last_ts
+    return TrainingRecord(
+        last_a=a if is_newer else current.last_a,
+        last_b=b if is_newer else current.last_b,
+        best_a=max(current.best_a, a),
+        best_b=max(current.best_b, b),
+        last_ts=max(current.last_ts, timestamp or 0.0),
+        version=current.version + 1
+    )
+
+
+def merge_record(current: Optional[TrainingRecord], other: TrainingRecord) -> TrainingRecord:
+    """2つの記録を統合した記録を返す(統合する順序によらず同じ結果になる)"""
+    if current is None:
+        return other
+    # 更新番号の大きい方を新しい記録とする．同じ場合は新しい時刻の方，
+    # 時刻も同じ場合は，どちらから統合しても同じになるようA・Bの大きい方を残す
+    is_newer = (other.version, other.last_ts, other.last_a, other.last_b) >= (
+        current.version, current.last_ts, current.last_a, current.last_b
+    )
+    newer = other if is_newer else current
+    return TrainingRecord(
+        last_a=newer.last_a,
+        last_b=newer.last_b,
+        best_a=max(current.best_a, other.best_a),
+        best_b=max(current.best_b, other.best_b),
+        last_ts=newer.last_ts,
+        version=newer.version
+    )
+
+
+def load_snapshot(path: str) -> Dict[str, TrainingRecord]:
+    """スナップショット(history_data.json形式)を読み込む"""
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            return {
+                menu_name: TrainingRecord(
+                    last_a=record["last_a"],
+                    last_b=record["last_b"],
+                    best_a=record["best_a"],
+                    best_b=record["best_b"],
+                    last_ts=record.get("last_ts", 0.0),
+                    version=record.get("version", 0)
+                )
+                for menu_name, record in data.items()
+            }
+    except (json.JSONDecodeError, KeyError) as e:
+        print(f"[警告] 履歴データの読み込みに失敗しました: {e}")
+        return {}
+
+
+def filter_period(rows: Iterable[SetRow], since: Optional[float] = None, until: Optional[float] = None) -> Iterator[SetRow]:
+    """セットのうち[since, until)の期間のものだけを返す(Noneの端は制限しない)"""
+    if since is None and until is None:
+        return iter(rows)
+    return (row for row in rows if (since is None or row[0] >= since) and (until is None or row[0] < until))
+
+
+class HistoryStorage:
+    """履歴の保存先の基底クラス"""
+    # 全メニューの記録を読み込まずに，get()で1メニューずつ読み込めるか(メモリ予算モードで使える)
+    LAZY_LOAD = False
+
+    @classmethod
+    def in_directory(cls, directory: str) -> "HistoryStorage":
+        """既定のファイル名のまま，指定したディレクトリに保存する保存先を開く(プロフィールごとの履歴用)"""
+        return cls()
+
+    def get(self, menu_name: str) -> Optional[TrainingRecord]:
+        """メニューの記録を返す(記録が無ければNone)"""
+        raise NotImplementedError
+
+    def records(self) -> Dict[str, TrainingRecord]:
+        """全メニューの記録を返す"""
+        raise NotImplementedError
+
+    def add_set(self, timestamp: float, menu_name: str, a: float, b: float) -> TrainingRecord:
+        """1セット分の記録を追加し，更新後の記録を返す"""
+        raise NotImplementedError
+
+    def add_sets(self, rows: Iterable[SetRow]) -> None:
+        """複数のセットをまとめて追加する(取り込み用)"""
+        for timestamp, menu_name, a, b in rows:
+            self.add_set(timestamp, menu_name, a, b)
+
+    def remove(self, menu_name: str) -> bool:
+        """メニューの記録を削除する(記録が無ければFalse)"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """全メニューの記録を削除する"""
+        raise NotImplementedError
+
+    def iter_sets(self, menu_name: Optional[str] = None, since: Optional[float] = None,
+                  until: Optional[float] = None) -> Iterator[SetRow]:
+        """記録されたセットを (時刻, メニュー名, A, B) の形で記録順に返す(メニュー・期間[since, until)で絞り込み可能)"""
+        raise NotImplementedError
+
+    def set_count(self) -> int:
+        """記録されているセット数(他のプロセスの分を含む)"""
+        return sum(1 for _ in self.iter_sets())
+
+    def set_position(self) -> int:
+        """書き込み済みのセットの追記順の位置(次に書き込むセットの位置．封印などで行が移っても変わらない)
+
+        既定では記録順に並ぶセットの数(iter_sets()の順序が追記順で変わらない保存先)。
+        """
+        return self.set_count()
+
+    def iter_sets_after(self, position: int) -> Iterator[SetRow]:
+        """set_position()がpositionだった時点より後に追記したセットを返す(未書き込みのセットを含む)
+
+        それより前のセットを再び返すことはあるが(JSONで封印時に新しい世代へ移したセットなど)，漏らすことはない。
+        """
+        return islice(self.iter_sets(), position, None)
+
+    def import_records(self, records: Dict[str, TrainingRecord], sets: Iterable[SetRow] = ()) -> None:
+        """記録とセットをまとめて取り込む(既存の記録とは統合する)"""
+        raise NotImplementedError
+
+    def refresh(self) -> bool:
+        """他のプロセスによる変更があれば取り込む(変更を取り込んだ場合はTrue)"""
+        return False
+
+    def flush(self) -> None:
+        """未書き込みの内容を書き込む(HistoryWriterから呼ばれる)"""
+
+    def compact(self) -> None:
+        """保存先を整理する(既定では書き込むだけ)"""
+        self.flush()
+
+    def close(self) -> None:
+        """保存先を閉じる"""
+        self.flush()
+
+
+class MemoryStorage(HistoryStorage):
+    """メモリ上だけに履歴を保持するバックエンド"""
+
+    def __init__(self):
+        """空の履歴を作成"""
+        self._lock = threading.Lock()
+        self._records: Dict[str, TrainingRecord] = {}
+        self._sets: List[SetRow] = []
+
+    def get(self, menu_name: str) -> Optional[TrainingRecord]:
+        return self._records.get(menu_name)
+
+    def records(self) -> Dict[str, TrainingRecord]:
+        with self._lock:
+            return dict(self._records)
+
+    def add_set(self, timestamp: float, menu_name: str, a: float, b: float) -> TrainingRecord:
+        with self._lock:
+            self._sets.append((timestamp, menu_name, a, b))
+            record = self._records[menu_name] = merge_set(self._records.get(menu_name), a, b, timestamp)
+            return record
+
+    def add_sets(self, rows: Iterable[SetRow]) -> None:
+        with self._lock:
+            for timestamp, menu_name, a, b in rows:
+                self._sets.append((timestamp, menu_name, a, b))
+                self._records[menu_name] = merge_set(self._records.get(menu_name), a, b, timestamp)
+
+    def remove(self, menu_name: str) -> bool:
+        with self._lock:
+            return self._records.pop(menu_name, None) is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+    def iter_sets(self, menu_name: Optional[str] = None, since: Optional[float] = None,
+                  until: Optional[float] = None) -> Iterator[SetRow]:
+        with self._lock:
+            rows = list(self._sets)
+        return filter_period((row for row in rows if menu_name is None or row[1] == menu_name), since, until)
+
+    def set_count(self) -> int:
+        return len(self._sets)
+
+    def import_records(self, records: Dict[str, TrainingRecord], sets: Iterable[SetRow] = ()) -> None:
+        """記録とセットをまとめて取り込む(既存の記録とは統合する)"""
+        with self._lock:
+            self._sets.extend(sets)
+            for menu_name, record in records.items():
+                self._records[menu_name] = merge_record(self._records.get(menu_name), record)
+
+
+class JsonStorage(HistoryStorage):
+    """スナップショット(JSON)・ジャーナル・セットログに履歴を保存するバックエンド
+
+    1セットごとの記録はセットログへ追記し，最終・最高記録はそこから導出する。
+    削除などの操作はジャーナルへ追記し，一定件数ごとにスナップショットへ畳み込む。
+    月が変わった後の畳み込みでは，前月以前のセットを月ごとの圧縮済みのセグメントへ封印し(archive.py)，
+    追記を受け付けるホットなセットログには今月のセットだけを残す。
+    本体アプリとキーボード拡張が同時に開いても記録を失わないよう，書き込みはファイルロック下で行い，
+    他のプロセスが追記したセット・操作だけを読み込んで統合する。
+    """
+    FILE_PATH = "history_data.json"
+    JOURNAL_PATH = "history_data.journal"
+    SET_LOG_DIR = "history_sets"
+    ARCHIVE_DIR = "history_archive"
+    LOCK_PATH = "history_data.lock"
+    # Falseの場合は封印せず，全セットをホットなセットログに持ち続ける
+    SEAL_MONTHS = True
+    # Falseの場合は書き込みのたびにスナップショット全体を書き直す
+    JOURNAL_MODE = True
+    # スナップショット以降のセット数と操作数の合計がこの件数に達したら畳み込む
+    COMPACT_THRESHOLD = 100
+
+    def __init__(
+        self,
+        file_path: Optional[str] = None,
+        journal_path: Optional[str] = None,
+        set_log_dir: Optional[str] = None,
+        lock_path: Optional[str] = None,
+        archive_dir: Optional[str] = None
+    ):
+        """スナップショットを読み込み，それ以降のセットと操作を反映する(封印済みのセグメントはマニフェストだけを読む)"""
+        self.file_path = file_path or self.FILE_PATH
+        self.set_log_dir = set_log_dir or self.SET_LOG_DIR
+        # メモリ上の状態の更新と書き込み対象の確定を排他する
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        # まだジャーナルへ書き込んでいない操作
+        self._pending_ops: List[Dict] = []
+        # 他のプロセスとの排他
+        self.file_lock = FileLock(lock_path or self.LOCK_PATH)
+
+        with self.file_lock:
+            self.archive = SegmentArchive(archive_dir or self.ARCHIVE_DIR)
+            with tracing.span("SetLog"):
+                self.set_log = SetLog(self._hot_dir(self.archive.hot_epoch))
+            self.journal = HistoryJournal(journal_path or self.JOURNAL_PATH)
+            self._load_state()
+
+    @classmethod
+    def in_directory(cls, directory: str) -> "JsonStorage":
+        os.makedirs(directory, exist_ok=True)
+        return cls(
+            file_path=os.path.join(directory, cls.FILE_PATH),
+            journal_path=os.path.join(directory, cls.JOURNAL_PATH),
+            set_log_dir=os.path.join(directory, cls.SET_LOG_DIR),
+            lock_path=os.path.join(directory, cls.LOCK_PATH),
+            archive_dir=os.path.join(directory, cls.ARCHIVE_DIR)
+        )
+
+    def _load_state(self, extra_ops: Iterable[Dict] = ()) -> None:
+        """スナップショットを読み込み，それ以降のセットと操作を反映する"""
+        # スナップショットに反映済みのセット数と，コンパクションの世代
+        self.checkpoint = 0
+        self.generation = 0
+        with tracing.span("TrainingHistory._load_history"):
+            self.history: Dict[str, TrainingRecord] = load_snapshot(self.file_path)
+        with tracing.span("TrainingHistory._replay_journal"):
+            entries = self.journal.replay()
+            checkpoint = next((entry for entry in entries if entry.get("op") == "checkpoint"), {})
+            # ジャーナルが前提とするホットなセットログの世代
+            self._journal_epoch = checkpoint.get("epoch", 0)
+            if self._journal_epoch != self.archive.hot_epoch:
+                # 封印(マニフェストの置き換え)後，ジャーナルを置き換える前に落ちた場合
+                # スナップショットは封印の前に書き込み済みのため，ジャーナルの操作は全て反映されている
+                # (ジャーナルは次の書き込みの前に置き換える)
+                entries = [{
+                    "op": "checkpoint",
+                    "sets": self.archive.hot_checkpoint,
+                    "generation": checkpoint.get("generation", 0)
+                }]
+            self._replay(entries + list(extra_ops), 0)
+
+    def _hot_dir(self, epoch: int) -> str:
+        """ホットなセットログのディレクトリ(封印するたびに新しい世代のディレクトリへ切り替える)"""
+        return self.set_log_dir if epoch == 0 else f"{self.set_log_dir}.{epoch}"
+
+    def _replay(self, entries: Iterable[Dict], row_index: int, stop: Optional[int] = None) -> int:
+        """row_index行目以降のセットと操作を記録順に適用し，反映済みの行数を返す"""
+        for entry in entries:
+            op = entry.get("op")
+            if op == "checkpoint":
+                row_index = self.checkpoint = entry["sets"]
+                self.generation = entry.get("generation", 0)
+                continue
+
+            # 操作より前に記録されたセットを先に反映する
+            row_index = self._fold_sets(row_index, entry.get("seq", row_index))
+            self._apply_op(entry)
+
+        return self._fold_sets(row_index, len(self.set_log) if stop is None else stop)
+
+    def _apply_op(self, entry: Dict) -> None:
+        """ジャーナルの操作1件をメモリ上の記録に反映"""
+        op = entry.get("op")
+        if op == "set":
+            # セットログ導入前の形式(記録順に新しいものとして扱う)
+            self._apply_update(entry["menu"], entry["a"], entry["b"])
+        elif op == "merge":
+            # 他の端末などの記録との統合
+            self.history[entry["menu"]] = merge_record(self.history.get(entry["menu"]), TrainingRecord(*entry["record"]))
+        elif op == "remove":
+            self.history.pop(entry["menu"], None)
+        elif op == "clear":
+            self.history.clear()
+
+    def _fold_sets(self, start: int, stop: int) -> int:
+        """セットログのstart行目からstop行目までを記録に反映"""
+        stop = min(stop, len(self.set_log))
+        for index in range(start, stop):
+            timestamp, menu_name, a, b = self.set_log.row(index)
+            self._apply_update(menu_name, a, b, timestamp)
+        return max(start, stop)
+
+    def _apply_update(self, menu_name: str, last_a: float, last_b: float, timestamp: Optional[float] = None) -> TrainingRecord:
+        """メモリ上の記録に1セット分の更新を反映"""
+        record = self.history[menu_name] = merge_set(self.history.get(menu_name), last_a, last_b, timestamp)
+        return record
+
+    def get(self, menu_name: str) -> Optional[TrainingRecord]:
+        return self.history.get(menu_name)
+
+    def records(self) -> Dict[str, TrainingRecord]:
+        with self._lock:
+            return dict(self.history)
+
+    def add_set(self, timestamp: float, menu_name: str, a: float, b: float) -> TrainingRecord:
+        with self._lock:
+            self.set_log.append(timestamp, menu_name, a, b)
+            return self._apply_update(menu_name, a, b, timestamp)
+
+    def add_sets(self, rows: Iterable[SetRow]) -> None:
+        with self._lock:
+            for timestamp, menu_name, a, b in rows:
+                self.set_log.append(timestamp, menu_name, a, b)
+                self._apply_update(menu_name, a, b, timestamp)
+
+    def remove(self, menu_name: str) -> bool:
+        # セットログ自体は残し，削除より前のセットを最終・最高記録から外す
+        with self._lock:
+            if menu_name not in self.history:
+                return False
+            del self.history[menu_name]
+            self._write_journal({"op": "remove", "menu": menu_name})
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self.history.clear()
+            self._write_journal({"op": "clear"})
+
+    def iter_sets(self, menu_name: Optional[str] = None, since: Optional[float] = None,
+                  until: Optional[float] = None) -> Iterator[SetRow]:
+        # 封印済みのセグメントはマニフェストで該当しないものを飛ばす
+        yield from self.archive.iter_sets(menu_name, since, until)
+        yield from filter_period(self.set_log.rows(menu_name=menu_name), since, until)
+
+    def set_logs(self) -> List[SetLog]:
+        """封印済みのセグメントを展開したセットログとホットなセットログの一覧(分析で列をそのまま使うため)"""
+        return [self.archive.load(segment) for segment in self.archive.segments] + [self.set_log]
+
+    def set_count(self) -> int:
+        return self.archive.row_count() + len(self.set_log)
+
+    def set_position(self) -> int:
+        # ホットなセットログの行の位置は，世代の先頭の位置からの行番号(未書き込みの行は他のプロセスの追記でずれる)
+        with self._lock:
+            return self.archive.hot_base + self.set_log.persisted
+
+    def iter_sets_after(self, position: int) -> Iterator[SetRow]:
+        # 封印済みのセットは位置の列で絞り込み(マニフェストで該当しないセグメントは飛ばす)，ホットなセットログは行番号で求める
+        with self._lock:
+            set_log, hot_base = self.set_log, self.archive.hot_base
+        yield from self.archive.iter_sets_after(position)
+        yield from set_log.rows(max(0, position - hot_base))
+
+    def import_records(self, records: Dict[str, TrainingRecord], sets: Iterable[SetRow] = ()) -> None:
+        with self._lock:
+            for timestamp, menu_name, a, b in sets:
+                self.set_log.append(timestamp, menu_name, a, b)
+                self._apply_update(menu_name, a, b, timestamp)
+            # 記録の統合はジャーナルに残し，スナップショットへの畳み込みまで再適用できるようにする
+            for menu_name, record in records.items():
+                self.history[menu_name] = merge_record(self.history.get(menu_name), record)
+                self._write_journal({
+                    "op": "merge",
+                    "menu": menu_name,
+                    "record": [record.last_a, record.last_b, record.best_a, record.best_b, record.last_ts, record.version]
+                })
+
+    def refresh(self) -> bool:
+        # 変更が無ければファイルの情報を確認するだけで済ませる
+        if not (self.set_log.has_changes() or self.journal.has_changes() or self.archive.has_changes()):
+            return False
+        with self.file_lock:
+            return self._refresh()
+
+    def _refresh(self) -> bool:
+        """他のプロセスが追記したセットと操作だけを読み込んで統合する(file_lockを保持して呼ぶ)"""
+        with self._lock:
+            if self.archive.refresh():
+                # 他のプロセスが封印した場合は，新しい世代のセットログとスナップショットから読み直す
+                print("[情報] 他のプロセスが履歴を封印したため読み直しました。")
+                self._reopen_set_log()
+                self._load_state(self._pending_ops)
+                return True
+
+            start, stop = self.set_log.refresh()
+            # 未書き込みの操作は，他のプロセスのセットより後ろの位置を指すようにずらす
+            for entry in self._pending_ops:
+                if entry["seq"] >= start:
+                    entry["seq"] += stop - start
+
+            entries = self.journal.read_new()
+            if entries is None:
+                # 他のプロセスがコンパクションした場合はスナップショットから読み直す
+                print("[情報] 他のプロセスが履歴を更新したため読み直しました。")
+                self._load_state(self._pending_ops)
+                return True
+
+            self._replay(entries, start, stop)
+            if entries:
+                # 他のプロセスの操作(削除など)より後に記録した未書き込みのセットを反映し直す
+                self._replay(self._pending_ops, self.set_log.persisted)
+            return stop > start or bool(entries)
+
+    def _reopen_set_log(self) -> None:
+        """マニフェストが指す世代のセットログを開き，未書き込みの行を移す(_lockを保持して呼ぶ)"""
+        old = self.set_log
+        self.set_log = SetLog(self._hot_dir(self.archive.hot_epoch))
+        persisted = len(self.set_log)
+        for row in old.rows(old.persisted):
+            self.set_log.append(*row)
+        # 未書き込みの操作は，移した行に対する位置を指すようにずらす
+        for entry in self._pending_ops:
+            entry["seq"] = persisted + max(0, entry["seq"] - old.persisted)
+
+    def _write_journal(self, entry: Dict) -> None:
+        """ジャーナルへの追記を書き込み待ちに加える"""
+        # 操作の直前までに記録されたセット数を添えておく
+        entry["seq"] = len(self.set_log)
+        self._pending_ops.append(entry)
+
+    @tracing.traced("TrainingHistory._flush_pending")
+    def flush(self) -> None:
+        """書き込み待ちのセットと操作をファイルへ反映する"""
+        with self._flush_lock, self.file_lock:
+            # 先に他のプロセスの追記分を取り込み，その後ろへ追記する
+            self._refresh()
+            with self._lock:
+                ops, self._pending_ops = self._pending_ops, []
+                stop = len(self.set_log)
+
+            try:
+                self.set_log.flush(stop)
+                if ops and self._journal_epoch != self.archive.hot_epoch:
+                    # 封印前の世代を指すジャーナルへは追記せず，先に置き換える
+                    self._rewrite_journal(self.checkpoint)
+                for entry in ops:
+                    self.journal.append(entry)
+            except OSError as e:
+                print(f"[エラー] 履歴データの書き込みに失敗しました: {e}")
+                # 書き込めなかった操作は次回に回す(再適用しても結果は変わらない)
+                with self._lock:
+                    self._pending_ops[:0] = ops
+                return
+
+            pending = len(self.set_log) - self.checkpoint + self.journal.count
+            if not self.JOURNAL_MODE or pending >= self.COMPACT_THRESHOLD:
+                self._compact()
+
+    def compact(self) -> None:
+        """セットログとジャーナルをスナップショットへ畳み込む"""
+        with self._flush_lock, self.file_lock:
+            self._refresh()
+            self._compact()
+
+    @tracing.traced("TrainingHistory._compact")
+    def _compact(self) -> None:
+        """コンパクションの本体(_flush_lockとfile_lockを保持し，他のプロセスの変更を取り込んでから呼ぶ)"""
+        # スナップショットとチェックポイントが同じ時点を指すよう，まとめて確定する
+        # 書き込み待ちの操作はスナップショットに含まれるためジャーナルには書かない
+        with self._lock:
+            records = dict(self.history)
+            checkpoint = len(self.set_log)
+            ops, self._pending_ops = self._pending_ops, []
+
+        try:
+            self.set_log.flush(checkpoint)
+        except OSError as e:
+            print(f"[エラー] セットログへの書き込みに失敗しました: {e}")
+            with self._lock:
+                self._pending_ops[:0] = ops
+            return
+
+        # スナップショットの書き込み後，ジャーナルを置き換える前に落ちても
+        # 再適用は同じ結果になる(lastは上書き，bestはmax)ため問題ない
+        try:
+            if not self._write_snapshot(records):
+                raise OSError("スナップショットを書き込めませんでした")
+        except OSError as e:
+            print(f"[エラー] コンパクションに失敗しました: {e}")
+            with self._lock:
+                self._pending_ops[:0] = ops
+            return
+
+        # スナップショットに反映済みのセットのうち，前月以前のものを封印する
+        if self.SEAL_MONTHS:
+            try:
+                sealed_checkpoint = self._seal(checkpoint)
+            except OSError as e:
+                # 封印できなくてもホットなセットログに残るだけなので，畳み込みは続ける
+                print(f"[警告] 履歴の封印に失敗しました: {e}")
+            else:
+                if sealed_checkpoint != checkpoint:
+                    # 行番号が変わったため，ジャーナルを置き換えられなくてもチェックポイントは新しい位置にする
+                    # (ジャーナルは次の書き込みの前に置き換える．次に開いたときはマニフェストの位置を使う)
+                    checkpoint = self.checkpoint = sealed_checkpoint
+
+        try:
+            self._rewrite_journal(checkpoint)
+        except OSError as e:
+            print(f"[エラー] コンパクションに失敗しました: {e}")
+            if self._journal_epoch == self.archive.hot_epoch:
+                with self._lock:
+                    self._pending_ops[:0] = ops
+
+    def _rewrite_journal(self, checkpoint: int) -> None:
+        """ジャーナルをチェックポイント(ホットなセットログの世代とスナップショットに反映済みの行数)だけに置き換える"""
+        generation = self.generation + 1
+        self.journal.rewrite([{
+            "op": "checkpoint",
+            "sets": checkpoint,
+            "generation": generation,
+            "epoch": self.archive.hot_epoch
+        }])
+        self.checkpoint = checkpoint
+        self.generation = generation
+        self._journal_epoch = self.archive.hot_epoch
+
+    @tracing.traced("TrainingHistory._seal")
+    def _seal(self, checkpoint: int) -> int:
+        """先頭からcheckpoint行目までのうち前月以前のセットを封印し，封印後のチェックポイントを返す
+
+        今月のセットは新しい世代のホットなセットログへ移し，マニフェストの置き換えで両方を同時に確定する。
+        _compact()からスナップショットを書き込んだ後に呼ぶ。
+        """
+        boundary = month_start()
+        timestamps = self.set_log.columns["timestamp"]
+        if not checkpoint or min(timestamps[:checkpoint]) >= boundary:
+            return checkpoint
+
+        # 反映済みの行は変わらないため，ロックを取らずに封印する(その間も記録できる)
+        # 封印するセットは追記順の位置も残し，新しい世代の位置はこの世代の反映済みの行の後ろから始める
+        # (新しい世代へ移すセットは，移した時点で追記したものとして新しい位置を振る)
+        base = self.archive.hot_base
+        sealed, kept = [], []
+        for index, row in enumerate(self.set_log.rows(stop=checkpoint)):
+            if row[0] < boundary:
+                sealed.append(row + (base + index,))
+            else:
+                kept.append(row)
+        epoch = self.archive.hot_epoch + 1
+        hot_dir = self._hot_dir(epoch)
+        # 前回の封印が途中で落ちた場合の書きかけのディレクトリは作り直す
+        shutil.rmtree(hot_dir, ignore_errors=True)
+        set_log = SetLog(hot_dir)
+        for row in kept:
+            set_log.append(*row)
+        set_log.flush()
+        self.archive.seal(sealed, epoch, len(kept), base + checkpoint)
+
+        with self._lock:
+            # 封印中に記録された未書き込みの行を新しいセットログへ移す
+            old = self.set_log
+            for row in old.rows(checkpoint):
+                set_log.append(*row)
+            for entry in self._pending_ops:
+                entry["seq"] = len(kept) + max(0, entry["seq"] - checkpoint)
+            self.set_log = set_log
+        shutil.rmtree(old.directory, ignore_errors=True)
+        print(f"[情報] {len(sealed)}セットを月ごとのセグメントへ封印しました。")
+        return len(kept)
+
+    def _write_snapshot(self, records: Dict[str, TrainingRecord]) -> bool:
+        """スナップショットを書き込む"""
+        tmp_path = self.file_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        menu_name: {
+                            "last_a": record.last_a,
+                            "last_b": record.last_b,
+                            "best_a": record.best_a,
+                            "best_b": record.best_b,
+                            "last_ts": record.last_ts,
+                            "version": record.version
+                        }
+                        for menu_name, record in records.items()
+                    },
+                    f,
+                    ensure_ascii=False,
+                    indent=2
+                )
+                f.flush()
+                os.fsync(f.fileno())
+            # 書き込み途中で落ちても元のファイルが壊れないよう置き換える
+            os.replace(tmp_path, self.file_path)
+            return True
+        except Exception as e:
+            print(f"[エラー] 履歴データの保存に失敗しました: {e}")
+            return False
+
+
+class SqliteStorage(HistoryStorage):
+    """SQLiteデータベースに履歴を保存するバックエンド
+
+    最終・最高記録はrecords表(メニュー名が主キー)に，1セットごとの記録はsets表に保存する。
+    記録したセットはメモリに溜め，flush()(HistoryWriterの書き込みスレッド)で1つのトランザクションにまとめて書き込む。
+    それまでの読み込みはデータベースの内容に未書き込みのセットを重ねて返す。
+    読み込みと書き込みは別の接続で行い，WALモードのため書き込み中(他のプロセスを含む)も読み込みは待たされない。
+    SQL文は定数にしておき，パラメータだけを差し替えて実行する
+    (sqlite3モジュールが接続ごとにコンパイル済みの文をキャッシュする)。
+    """
+    FILE_PATH = "history_data.sqlite3"
+    LAZY_LOAD = True
+    # 2: 記録の更新番号(version)
+    SCHEMA_VERSION = 2
+    # 他のプロセスが書き込み中のときに待つ秒数
+    TIMEOUT = 5.0
+    # iter_sets()で一度に読み出す行数
+    ITER_BATCH = 1000
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS records (
+            menu TEXT PRIMARY KEY,
+            last_a REAL NOT NULL,
+            last_b REAL NOT NULL,
+            best_a REAL NOT NULL,
+            best_b REAL NOT NULL,
+            last_ts REAL NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS sets (
+            id INTEGER PRIMARY KEY,
+            timestamp REAL NOT NULL,
+            menu TEXT NOT NULL,
+            a REAL NOT NULL,
+            b REAL NOT NULL
+        )""",
+        # 索引の各行はidを含むため，メニューで絞り込んだ結果は記録順に並んでいる
+        "CREATE INDEX IF NOT EXISTS sets_menu ON sets (menu)",
+        "CREATE INDEX IF NOT EXISTS sets_timestamp ON sets (timestamp)",
+    )
+    # 以前のバージョンのデータベースを更新する文(更新前のバージョン -> 文)
+    MIGRATIONS = {
+        1: ("ALTER TABLE records ADD COLUMN version INTEGER NOT NULL DEFAULT 0",),
+    }
+    SELECT_RECORD = "SELECT last_a, last_b, best_a, best_b, last_ts, version FROM records WHERE menu = ?"
+    SELECT_RECORDS = "SELECT menu, last_a, last_b, best_a, best_b, last_ts, version FROM records"
+    INSERT_SET = "INSERT INTO sets (timestamp, menu, a, b) VALUES (?, ?, ?, ?)"
+    # 1セット分の更新(merge_set())をSQLで表したもの．同じ時刻の場合は後から記録したセットをlastにする
+    # (SETの右辺は更新前の値で評価される)
+    UPSERT_SET = """
+        INSERT INTO records (menu, last_a, last_b, best_a, best_b, last_ts, version) VALUES (?, ?, ?, ?, ?, ?, 1)
+        ON CONFLICT (menu) DO UPDATE SET
+            last_a = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_a ELSE last_a END,
+            last_b = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_b ELSE last_b END,
+            best_a = max(best_a, excluded.best_a),
+            best_b = max(best_b, excluded.best_b),
+            last_ts = max(last_ts, excluded.last_ts),
+            version = version + 1
+    """
+    # 既存の記録との統合規則(merge_record())をSQLで表したもの(bestは最大値，lastは更新番号の大きい方)
+    # 更新番号が同じなら新しい時刻の方，時刻も同じならどちらから統合しても同じになるようA・Bの大きい方を残す
+    IS_NEWER_RECORD = (
+        "(excluded.version, excluded.last_ts, excluded.last_a, excluded.last_b) >= (version, last_ts, last_a, last_b)"
+    )
+    UPSERT_RECORD = f"""
+        INSERT INTO records (menu, last_a, last_b, best_a, best_b, last_ts, version) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (menu) DO UPDATE SET
+            last_a = CASE WHEN {IS_NEWER_RECORD} THEN excluded.last_a ELSE last_a END,
+            last_b = CASE WHEN {IS_NEWER_RECORD} THEN excluded.last_b ELSE last_b END,
+            best_a = max(best_a, excluded.best_a),
+            best_b = max(best_b, excluded.best_b),
+            last_ts = CASE WHEN {IS_NEWER_RECORD} THEN excluded.last_ts ELSE last_ts END,
+            version = max(version, excluded.version)
+    """
+    DELETE_RECORD = "DELETE FROM records WHERE menu = ?"
+    DELETE_RECORDS = "DELETE FROM records"
+    SELECT_SETS = "SELECT timestamp, menu, a, b FROM sets ORDER BY id"
+    SELECT_MENU_SETS = "SELECT timestamp, menu, a, b FROM sets WHERE menu = ? ORDER BY id"
+    # 期間で絞り込む場合(端を指定しないときは無限大を渡す)
+    SELECT_PERIOD_SETS = "SELECT timestamp, menu, a, b FROM sets WHERE timestamp >= ? AND timestamp < ? ORDER BY id"
+    SELECT_MENU_PERIOD_SETS = (
+        "SELECT timestamp, menu, a, b FROM sets WHERE menu = ? AND timestamp >= ? AND timestamp < ? ORDER BY id"
+    )
+    # セットは削除しないため，最大のidがセット数になる(主キーを引くだけで数えずに済む)
+    # idは追記順に振られて変わらないため，そのまま追記順の位置にも使う
+    SELECT_SET_COUNT = "SELECT coalesce(max(id), 0) FROM sets"
+    SELECT_SETS_AFTER = "SELECT timestamp, menu, a, b FROM sets WHERE id > ? ORDER BY id"
+
+    def __init__(self, path: Optional[str] = None):
+        """データベースを開き，必要であれば表を作成する"""
+        self.path = path or self.FILE_PATH
+        # 書き込みの接続(書き込みスレッドから使う)．トランザクションはBEGIN/COMMITで明示する
+        self._write_lock = threading.RLock()
+        self._write_conn = self._connect()
+        self._write_conn.execute("PRAGMA journal_mode = WAL")
+        # WALモードではコミットごとのfsyncを省いても壊れない(電源断時に直前のコミットが失われるだけ)
+        self._write_conn.execute("PRAGMA synchronous = NORMAL")
+        with self._transaction():
+            version = self._write_conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > self.SCHEMA_VERSION:
+                raise RuntimeError(f"未対応のデータベースです(バージョン{version}): {self.path}")
+            if version:
+                for old_version in range(version, self.SCHEMA_VERSION):
+                    for statement in self.MIGRATIONS[old_version]:
+                        self._write_conn.execute(statement)
+            for statement in self.SCHEMA:
+                self._write_conn.execute(statement)
+            self._write_conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        # 他の接続が書き込むと変わる値(書き込みの接続で調べるため，自分の書き込みでは変わらない)
+        self._data_version = self._write_conn.execute("PRAGMA data_version").fetchone()[0]
+
+        # 読み込みの接続と未書き込みのセットは，記録ボタンの処理と書き込みスレッドの間でロックで排他する
+        # (書き込みスレッドは，コミットして未書き込みのセットを取り除くときだけこのロックを取る)
+        self._lock = threading.RLock()
+        self._conn = self._connect()
+        self._pending: List[SetRow] = []
+        # 未書き込みのセットを反映した記録(未書き込みのセットがあるメニューだけ)
+        self._pending_records: Dict[str, TrainingRecord] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        """データベースへ接続する"""
+        return sqlite3.connect(self.path, timeout=self.TIMEOUT, isolation_level=None, check_same_thread=False)
+
+    @classmethod
+    def in_directory(cls, directory: str) -> "SqliteStorage":
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, cls.FILE_PATH))
+
+    def _transaction(self) -> "_Transaction":
+        """書き込みトランザクションを返す(withブロックを抜けるとコミット，例外時はロールバック)"""
+        return _Transaction(self._write_conn, self._write_lock)
+
+    def _write(self, operation: Optional[Callable[[sqlite3.Connection], Any]] = None) -> Any:
+        """未書き込みのセットとoperationを1つのトランザクションで書き込み，operationの結果を返す"""
+        with self._write_lock:
+            conn = self._write_conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                with self._lock:
+                    rows = list(self._pending)
+                if rows:
+                    conn.executemany(self.INSERT_SET, rows)
+                    conn.executemany(self.UPSERT_SET, (
+                        (menu_name, a, b, a, b, timestamp) for timestamp, menu_name, a, b in rows
+                    ))
+                result = operation(conn) if operation is not None else None
+                # コミットと未書き込みのセットの取り除きを同時に行い，読み込みで二重にも欠けても見えないようにする
+                with self._lock:
+                    conn.execute("COMMIT")
+                    del self._pending[:len(rows)]
+                    # 書き込み中に記録されたセットのあるメニューは，その分を反映した記録を残す
+                    remaining = {menu_name for _, menu_name, _, _ in self._pending}
+                    self._pending_records = {
+                        menu_name: record for menu_name, record in self._pending_records.items()
+                        if menu_name in remaining
+                    }
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def _get(self, menu_name: str) -> Optional[TrainingRecord]:
+        """未書き込みのセットを反映した記録(_lockを保持して呼ぶ)"""
+        record = self._pending_records.get(menu_name)
+        if record is not None:
+            return record
+        row = self._conn.execute(self.SELECT_RECORD, (menu_name,)).fetchone()
+        return TrainingRecord(*row) if row else None
+
+    def get(self, menu_name: str) -> Optional[TrainingRecord]:
+        with self._lock:
+            return self._get(menu_name)
+
+    def records(self) -> Dict[str, TrainingRecord]:
+        with self._lock:
+            rows = self._conn.execute(self.SELECT_RECORDS).fetchall()
+            pending = dict(self._pending_records)
+        records = {menu_name: TrainingRecord(*values) for menu_name, *values in rows}
+        records.update(pending)
+        return records
+
+    def add_set(self, timestamp: float, menu_name: str, a: float, b: float) -> TrainingRecord:
+        # 記録ボタンの処理ではメモリに溜めるだけにし，データベースへはflush()で書き込む
+        with self._lock:
+            record = merge_set(self._get(menu_name), a, b, timestamp)
+            self._pending.append((timestamp, menu_name, a, b))
+            self._pending_records[menu_name] = record
+            return record
+
+    def add_sets(self, rows: Iterable[SetRow]) -> None:
+        with self._lock:
+            for timestamp, menu_name, a, b in rows:
+                self._pending.append((timestamp, menu_name, a, b))
+                self._pending_records[menu_name] = merge_set(self._get(menu_name), a, b, timestamp)
+
+    def remove(self, menu_name: str) -> bool:
+        # 未書き込みのセットを先に書き込み，削除より前のセットとして扱う
+        return self._write(lambda conn: conn.execute(self.DELETE_RECORD, (menu_name,)).rowcount > 0)
+
+    def clear(self) -> None:
+        self._write(lambda conn: conn.execute(self.DELETE_RECORDS))
+
+    def iter_sets(self, menu_name: Optional[str] = None, since: Optional[float] = None,
+                  until: Optional[float] = None) -> Iterator[SetRow]:
+        # 件数が多くてもメモリを使い切らないよう，ITER_BATCH件ずつ読み出す
+        # (読み込みのトランザクションは最初の読み出しで始まるため，同時に写した未書き込みのセットと重ならない)
+        with self._lock:
+            pending = [row for row in self._pending if menu_name is None or row[1] == menu_name]
+            if since is not None or until is not None:
+                period = (-math.inf if since is None else since, math.inf if until is None else until)
+                if menu_name is None:
+                    cursor = self._conn.execute(self.SELECT_PERIOD_SETS, period)
+                else:
+                    cursor = self._conn.execute(self.SELECT_MENU_PERIOD_SETS, (menu_name,) + period)
+            elif menu_name is None:
+                cursor = self._conn.execute(self.SELECT_SETS)
+            else:
+                cursor = self._conn.execute(self.SELECT_MENU_SETS, (menu_name,))
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(self.ITER_BATCH)
+            if not rows:
+                break
+            yield from rows
+        yield from filter_period(pending, since, until)
+
+    def set_count(self) -> int:
+        with self._lock:
+            return self._conn.execute(self.SELECT_SET_COUNT).fetchone()[0] + len(self._pending)
+
+    def set_position(self) -> int:
+        with self._lock:
+            return self._conn.execute(self.SELECT_SET_COUNT).fetchone()[0]
+
+    def iter_sets_after(self, position: int) -> Iterator[SetRow]:
+        with self._lock:
+            pending = list(self._pending)
+            rows = self._conn.execute(self.SELECT_SETS_AFTER, (position,)).fetchall()
+        yield from rows
+        yield from pending
+
+    def refresh(self) -> bool:
+        # 読み込みは常にデータベースから行うため，他のプロセスが書き込んだかどうかだけを返す
+        with self._write_lock:
+            version = self._write_conn.execute("PRAGMA data_version").fetchone()[0]
+        changed = version != self._data_version
+        self._data_version = version
+        return changed
+
+    def import_records(self, records: Dict[str, TrainingRecord], sets: Iterable[SetRow] = ()) -> None:
+        """記録とセットを1つのトランザクションでまとめて取り込む(既存の記録とは統合する)"""
+        def operation(conn: sqlite3.Connection) -> None:
+            conn.executemany(self.INSERT_SET, sets)
+            conn.executemany(self.UPSERT_RECORD, (
+                (menu_name, r.last_a, r.last_b, r.best_a, r.best_b, r.last_ts, r.version)
+                for menu_name, r in records.items()
+            ))
+        self._write(operation)
+
+    def flush(self) -> None:
+        """未書き込みのセットを1つのトランザクションで書き込む(失敗した場合は次の書き込みで再び試す)"""
+        with self._lock:
+            if not self._pending:
+                return
+        try:
+            self._write()
+        except sqlite3.Error as e:
+            print(f"[エラー] 履歴データの書き込みに失敗しました: {e}")
+
+    def compact(self) -> None:
+        """WALファイルの内容をデータベースへ書き戻す"""
+        self.flush()
+        with self._write_lock:
+            self._write_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self) -> None:
+        self.flush()
+        with self._write_lock, self._lock:
+            self._conn.close()
+            self._write_conn.close()
+
+
+class _Transaction:
+    """SqliteStorageの書き込みトランザクション"""
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.RLock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.lock.acquire()
+        try:
+            # 読み込みから書き込みへの昇格で他のプロセスと競合しないよう，最初から書き込みロックを取る
+            self.conn.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self.lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, *exc) -> None:
+        try:
+            self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        finally:
+            self.lock.release()
+
+
+class IndexedStorage(HistoryStorage):
+    """先頭にメニュー名→記録の位置のハッシュ表を持つバイナリファイルに最終・最高記録を保存するバックエンド
+
+    ファイルはmmapで開き，get()はハッシュ表を引いてそのメニューの記録だけを読む
+    (起動時に全記録を読み込まないため，記録のあるメニュー数に関係なくすぐに開ける)。
+    記録したセットによる更新はメモリに溜め，flush()(HistoryWriterの書き込みスレッド)でファイルロック下で反映する。
+    それまでの読み込みはファイルの記録に未反映の更新を重ねて返す。
+    記録は固定長のため，その位置をその場で書き換える。他のプロセスはロックを取らずに読むため，
+    記録ごとの書き込み番号を書き込み中は奇数にし，読み込みの前後で番号が変わっていれば読み直す。
+    1セットごとの記録はセットログに保存する(初めて使うときに読み込む)。
+
+    ファイルの構成:
+      ヘッダー   : 識別子・形式のバージョン・スロット数・記録数・使用済みスロット数・末尾の位置・更新回数
+      ハッシュ表 : スロット数 × 記録の位置(0は空き，DELETEDは削除済み)．crc32(メニュー名)から線形探索する
+      記録       : メニュー名の長さ(2バイト)＋メニュー名(UTF-8)＋書き込み番号＋(last_a, last_b, best_a, best_b, last_ts, version)
+    """
+    FILE_PATH = "history_data.idx"
+    SET_LOG_DIR = "history_index_sets"
+    LOCK_PATH = "history_data.idx.lock"
+    LAZY_LOAD = True
+    MAGIC = b"TMHI"
+    FORMAT_VERSION = 1
+    HEADER = struct.Struct("<4sIIIIQQ")
+    SLOT = struct.Struct("<I")
+    NAME_LENGTH = struct.Struct("<H")
+    RECORD = struct.Struct("<Q5dq")
+    SEQUENCE = struct.Struct("<Q")
+    VALUES = struct.Struct("<5dq")
+    # 書き込み番号が奇数のまま(書き込み中に落ちたプロセスがある場合など)読み直す回数．超えたらロックを取って読む
+    READ_RETRIES = 100
+    EMPTY = 0
+    DELETED = 0xFFFFFFFF
+    INITIAL_SLOTS = 64
+    # 使用済み(削除済みを含む)スロットの割合がこれを超えたら，ハッシュ表を2倍にして作り直す
+    MAX_LOAD = 0.5
+
+    def __init__(self, path: Optional[str] = None, set_log_dir: Optional[str] = None, lock_path: Optional[str] = None):
+        """ファイルを開く(無ければ空のファイルを作成する)"""
+        self.path = path or self.FILE_PATH
+        self.set_log_dir = set_log_dir or self.SET_LOG_DIR
+        self._set_log: Optional[SetLog] = None
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        # まだファイルへ反映していない更新(メニュー名, 現在の記録→更新後の記録)と，
+        # それを反映した記録(未反映の更新があるメニューだけ)
+        self._pending: List[Tuple[str, Callable[[Optional[TrainingRecord]], TrainingRecord]]] = []
+        self._pending_records: Dict[str, TrainingRecord] = {}
+        # 他のプロセスとの排他
+        self.file_lock = FileLock(lock_path or self.LOCK_PATH)
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._inode = 0
+        # 最後に確認したファイルの更新回数と，自分の書き込みの間に他のプロセスが書き込んだか
+        self._seen_version = 0
+        self._foreign_write = False
+
+        with self.file_lock:
+            if not os.path.exists(self.path):
+                self._rewrite({}, self.INITIAL_SLOTS)
+            self._open()
+
+    @classmethod
+    def in_directory(cls, directory: str) -> "IndexedStorage":
+        os.makedirs(directory, exist_ok=True)
+        return cls(
+            os.path.join(directory, cls.FILE_PATH),
+            set_log_dir=os.path.join(directory, cls.SET_LOG_DIR),
+            lock_path=os.path.join(directory, cls.LOCK_PATH)
+        )
+
+    @property
+    def set_log(self) -> SetLog:
+        """セットログ(起動を遅くしないよう，初めて使うときに読み込む)"""
+        if self._set_log is None:
+            with self._lock:
+                if self._set_log is None:
+                    self._set_log = SetLog(self.set_log_dir)
+        return self._set_log
+
+    def _open(self) -> None:
+        """ファイルを開き直してmmapする"""
+        self._close_map()
+        self._file = open(self.path, "r+b")
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, version, *_ = self._header()
+        if magic != self.MAGIC or version > self.FORMAT_VERSION:
+            self._close_map()
+            raise RuntimeError(f"未対応の履歴ファイルです: {self.path}")
+        self._seen_version = self._header()[6]
+
+    def _close_map(self) -> None:
+        """mmapとファイルを閉じる"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _header(self) -> Tuple[bytes, int, int, int, int, int, int]:
+        """(識別子, 形式のバージョン, スロット数, 記録数, 使用済みスロット数, 末尾の位置, 更新回数)"""
+        return self.HEADER.unpack_from(self._map, 0)
+
+    def _write_header(self, count: int, used: int, end: int) -> None:
+        """ヘッダーの記録数などを書き換え，更新回数を1つ進める"""
+        _, _, slot_count, _, _, _, version = self._header()
+        if version != self._seen_version:
+            self._foreign_write = True
+        self._seen_version = version + 1
+        self.HEADER.pack_into(self._map, 0, self.MAGIC, self.FORMAT_VERSION, slot_count, count, used, end, version + 1)
+
+    def _slot(self, index: int) -> int:
+        """スロットに入っている記録の位置"""
+        return self.SLOT.unpack_from(self._map, self.HEADER.size + index * self.SLOT.size)[0]
+
+    def _find(self, key: bytes) -> Tuple[Optional[int], Optional[int]]:
+        """メニュー名(UTF-8)の(スロット番号, 記録の位置)を返す
+
+        見つからなければ記録の位置はNoneで，スロット番号は追加するときに使う空きスロット(無ければNone)。
+        """
+        slot_count = self._header()[2]
+        index = zlib.crc32(key) % slot_count
+        free = None
+        for _ in range(slot_count):
+            offset = self._slot(index)
+            if offset == self.EMPTY:
+                return (index if free is None else free), None
+            if offset == self.DELETED:
+                if free is None:
+                    free = index
+            elif offset < len(self._map) and self._name_at(offset) == key:
+                return index, offset
+            index = (index + 1) % slot_count
+        return free, None
+
+    def _name_at(self, offset: int) -> bytes:
+        """記録のメニュー名(UTF-8)"""
+        length = self.NAME_LENGTH.unpack_from(self._map, offset)[0]
+        start = offset + self.NAME_LENGTH.size
+        return self._map[start:start + length]
+
+    def _pack(self, record: TrainingRecord) -> bytes:
+        """記録の数値部分(書き込み番号は0)"""
+        return self.RECORD.pack(
+            0, record.last_a, record.last_b, record.best_a, record.best_b, record.last_ts, record.version
+        )
+
+    def _read_record(self, position: int) -> TrainingRecord:
+        """記録の数値部分を読む(他のプロセスが書き込み中の場合は書き込み終わるまで読み直す)"""
+        for _ in range(self.READ_RETRIES):
+            sequence, *values = self.RECORD.unpack_from(self._map, position)
+            if sequence % 2 == 0 and self.SEQUENCE.unpack_from(self._map, position)[0] == sequence:
+                return TrainingRecord(*values)
+        with self.file_lock:
+            return TrainingRecord(*self.RECORD.unpack_from(self._map, position)[1:])
+
+    def _write_record(self, position: int, record: TrainingRecord) -> None:
+        """記録の数値部分をその場で書き換える(file_lockを保持して呼ぶ)"""
+        # 書き込み中に落ちて奇数のまま残っていても，奇数から始めて偶数で終える
+        sequence = self.SEQUENCE.unpack_from(self._map, position)[0] | 1
+        self.SEQUENCE.pack_into(self._map, position, sequence)
+        self.VALUES.pack_into(
+            self._map, position + self.SEQUENCE.size,
+            record.last_a, record.last_b, record.best_a, record.best_b, record.last_ts, record.version
+        )
+        self.SEQUENCE.pack_into(self._map, position, sequence + 1)
+
+    def _ensure_current(self) -> bool:
+        """他のプロセスがファイルを作り直したか記録を追加していれば開き直す(開き直した場合はTrue)"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if stat.st_ino == self._inode and stat.st_size == len(self._map):
+            return False
+        self._open()
+        return True
+
+    def _read_all(self) -> Dict[str, TrainingRecord]:
+        """全メニューの記録を読み込む"""
+        records = {}
+        for index in range(self._header()[2]):
+            offset = self._slot(index)
+            if offset in (self.EMPTY, self.DELETED):
+                continue
+            key = self._name_at(offset)
+            position = offset + self.NAME_LENGTH.size + len(key)
+            records[key.decode("utf-8")] = self._read_record(position)
+        return records
+
+    def _slots_for(self, count: int) -> int:
+        """count件の記録を入れるスロット数"""
+        slot_count = self.INITIAL_SLOTS
+        while count > slot_count * self.MAX_LOAD:
+            slot_count *= 2
+        return slot_count
+
+    def _rewrite(self, records: Dict[str, TrainingRecord], slot_count: int) -> None:
+        """記録からファイル全体を作り直す(削除済みの記録の領域も詰める．file_lockを保持して呼ぶ)"""
+        version = self._header()[6] + 1 if self._map is not None else 1
+        table = bytearray(slot_count * self.SLOT.size)
+        body = bytearray()
+        base = self.HEADER.size + len(table)
+        for menu_name, record in records.items():
+            key = menu_name.encode("utf-8")
+            index = zlib.crc32(key) % slot_count
+            while self.SLOT.unpack_from(table, index * self.SLOT.size)[0] != self.EMPTY:
+                index = (index + 1) % slot_count
+            self.SLOT.pack_into(table, index * self.SLOT.size, base + len(body))
+            body += self.NAME_LENGTH.pack(len(key)) + key + self._pack(record)
+        header = self.HEADER.pack(
+            self.MAGIC, self.FORMAT_VERSION, slot_count, len(records), len(records), base + len(body), version
+        )
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(table)
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        # 書き込み途中で落ちても元のファイルが壊れないよう置き換える
+        os.replace(tmp_path, self.path)
+
+    def _update(self, menu_name: str, update: Callable[[Optional[TrainingRecord]], TrainingRecord]) -> TrainingRecord:
+        """メニューの記録をupdate(現在の記録)の結果で置き換える(_lockとfile_lockを保持して呼ぶ)"""
+        self._ensure_current()
+        key = menu_name.encode("utf-8")
+        slot, offset = self._find(key)
+        if offset is not None:
+            # 記録は固定長のため，その場で書き換える
+            position = offset + self.NAME_LENGTH.size + len(key)
+            record = update(self._read_record(position))
+            self._write_record(position, record)
+            _, _, _, count, used, end, _ = self._header()
+            self._write_header(count, used, end)
+            return record
+
+        record = update(None)
+        _, _, slot_count, count, used, end, _ = self._header()
+        if slot is None or used + 1 > slot_count * self.MAX_LOAD:
+            records = self._read_all()
+            records[menu_name] = record
+            self._rewrite(records, self._slots_for(len(records)))
+            self._open()
+            return record
+
+        # 末尾に記録を追加してから末尾の位置を進め，最後にスロットから参照する
+        # (途中で落ちても，参照されていない領域が残るだけで既存の記録は壊れない)
+        data = self.NAME_LENGTH.pack(len(key)) + key + self._pack(record)
+        self._file.seek(end)
+        self._file.write(data)
+        self._file.flush()
+        self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        reused = self._slot(slot) == self.DELETED
+        self._write_header(count + 1, used if reused else used + 1, end + len(data))
+        self.SLOT.pack_into(self._map, self.HEADER.size + slot * self.SLOT.size, end)
+        return record
+
+    def _get(self, menu_name: str) -> Optional[TrainingRecord]:
+        """未反映の更新を重ねた記録(_lockを保持して呼ぶ)"""
+        record = self._pending_records.get(menu_name)
+        if record is not None:
+            return record
+        key = menu_name.encode("utf-8")
+        _, offset = self._find(key)
+        if offset is None:
+            return None
+        return self._read_record(offset + self.NAME_LENGTH.size + len(key))
+
+    def get(self, menu_name: str) -> Optional[TrainingRecord]:
+        with self._lock:
+            return self._get(menu_name)
+
+    def records(self) -> Dict[str, TrainingRecord]:
+        with self._lock:
+            records = self._read_all()
+            records.update(self._pending_records)
+            return records
+
+    def _queue(self, menu_name: str, update: Callable[[Optional[TrainingRecord]], TrainingRecord]) -> TrainingRecord:
+        """更新を書き込み待ちに加え，反映後の記録を返す(_lockを保持して呼ぶ)"""
+        record = self._pending_records[menu_name] = update(self._get(menu_name))
+        self._pending.append((menu_name, update))
+        return record
+
+    def _rebuild_pending(self) -> None:
+        """ファイルの記録が変わった後に，未反映の更新を重ねた記録を作り直す(_lockを保持して呼ぶ)"""
+        self._pending_records = {}
+        for menu_name, update in self._pending:
+            self._pending_records[menu_name] = update(self._get(menu_name))
+
+    def add_set(self, timestamp: float, menu_name: str, a: float, b: float) -> TrainingRecord:
+        # 記録ボタンの処理ではメモリに溜めるだけにし，ファイルへはflush()で反映する
+        with self._lock:
+            self.set_log.append(timestamp, menu_name, a, b)
+            return self._queue(menu_name, partial(merge_set, a=a, b=b, timestamp=timestamp))
+
+    def add_sets(self, rows: Iterable[SetRow]) -> None:
+        with self._lock:
+            for timestamp, menu_name, a, b in rows:
+                self.set_log.append(timestamp, menu_name, a, b)
+                self._queue(menu_name, partial(merge_set, a=a, b=b, timestamp=timestamp))
+
+    def remove(self, menu_name: str) -> bool:
+        # セットログ自体は残し，記録だけを削除する
+        # 未反映の更新を先に反映し，削除より前の更新として扱う
+        self.flush()
+        with self.file_lock, self._lock:
+            self._ensure_current()
+            slot, offset = self._find(menu_name.encode("utf-8"))
+            if offset is None:
+                return False
+            _, _, _, count, used, end, _ = self._header()
+            self._write_header(count - 1, used, end)
+            self.SLOT.pack_into(self._map, self.HEADER.size + slot * self.SLOT.size, self.DELETED)
+            self._rebuild_pending()
+            return True
+
+    def clear(self) -> None:
+        self.flush()
+        with self.file_lock, self._lock:
+            self._rewrite({}, self.INITIAL_SLOTS)
+            self._open()
+            self._rebuild_pending()
+
+    def iter_sets(self, menu_name: Optional[str] = None, since: Optional[float] = None,
+                  until: Optional[float] = None) -> Iterator[SetRow]:
+        return filter_period(self.set_log.rows(menu_name=menu_name), since, until)
+
+    def set_logs(self) -> List[SetLog]:
+        """セットを保持するセットログの一覧(分析で列をそのまま使うため)"""
+        return [self.set_log]
+
+    def set_count(self) -> int:
+        return len(self.set_log)
+
+    def set_position(self) -> int:
+        # 未書き込みの行は他のプロセスの追記でずれるため，書き込み済みの行数
+        return self.set_log.persisted
+
+    def iter_sets_after(self, position: int) -> Iterator[SetRow]:
+        return self.set_log.rows(position)
+
+    def refresh(self) -> bool:
+        with self._lock:
+            changed = self._ensure_current() or self._header()[6] != self._seen_version or self._foreign_write
+            self._seen_version = self._header()[6]
+            self._foreign_write = False
+            if changed:
+                self._rebuild_pending()
+        if self._set_log is not None and self._set_log.has_changes():
+            with self.file_lock:
+                self._set_log.refresh()
+            changed = True
+        return changed
+
+    def import_records(self, records: Dict[str, TrainingRecord], sets: Iterable[SetRow] = ()) -> None:
+        """記録とセットをまとめて取り込む(既存の記録とは統合する)"""
+        with self._lock:
+            for timestamp, menu_name, a, b in sets:
+                self.set_log.append(timestamp, menu_name, a, b)
+            for menu_name, record in records.items():
+                self._queue(menu_name, partial(merge_record, other=record))
+
+    def flush(self) -> None:
+        """未書き込みのセットと未反映の更新をファイルへ反映する(書き込めなかった更新は次回に回す)"""
+        with self._flush_lock, self.file_lock:
+            if self._set_log is not None:
+                # 他のプロセスの追記分を取り込んでから，その後ろへ追記する
+                self._set_log.refresh()
+                self._set_log.flush()
+            with self._lock:
+                updates, self._pending = self._pending, []
+            # 記録ボタンの処理を長く止めないよう，1件ずつロックを取って反映する
+            # (反映済みの記録も未反映の記録も，読み込みには反映後の記録が見える)
+            for index, (menu_name, update) in enumerate(updates):
+                try:
+                    with self._lock:
+                        self._update(menu_name, update)
+                except OSError as e:
+                    print(f"[エラー] 履歴データの書き込みに失敗しました: {e}")
+                    with self._lock:
+                        self._pending[:0] = updates[index:]
+                    break
+            with self._lock:
+                # 反映中に更新されたメニューは，その分を重ねた記録を残す
+                remaining = {menu_name for menu_name, _ in self._pending}
+                self._pending_records = {
+                    menu_name: record for menu_name, record in self._pending_records.items()
+                    if menu_name in remaining
+                }
+                self._map.flush()
+
+    def compact(self) -> None:
+        """削除済みの記録の領域を詰め，ハッシュ表を記録数に合わせた大きさで作り直す"""
+        self.flush()
+        with self.file_lock, self._lock:
+            self._ensure_current()
+            records = self._read_all()
+            self._rewrite(records, self._slots_for(len(records)))
+            self._open()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._close_map()
+
+
+class CachedStorage(HistoryStorage):
+    """他のバックエンドの記録をメニュー単位で読み込み，最近使ったものだけをメモリに残すバックエンド
+
+    キャッシュの使用量(バイト数の見積もり)がbudgetを超えたら，最も長く使われていないメニューから捨てる。
+    記録の無いメニューも「記録なし」としてキャッシュし，同じメニューで何度も保存先を引かないようにする。
+    全メニューを扱う操作(records()・iter_sets()など)は保存先へそのまま任せる。
+    """
+    # キャッシュの使用量の上限(バイト)
+    BUDGET = 64 * 1024
+    # キャッシュの1項目(辞書の項目と順序のリンク)の固定の使用量の見積もり(バイト)
+    ENTRY_OVERHEAD = 100
+
+    def __init__(self, storage: HistoryStorage, budget: Optional[int] = None):
+        """保存先とキャッシュの使用量の上限を指定して作成"""
+        if not storage.LAZY_LOAD:
+            raise ValueError(f"{type(storage).__name__}は記録をメニュー単位で読み込めないため，メモリ予算モードでは使えません")
+        self.storage = storage
+        self.budget = self.BUDGET if budget is None else budget
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Optional[TrainingRecord]]" = OrderedDict()
+        # キャッシュの使用量の見積もり(バイト)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _entry_size(self, menu_name: str, record: Optional[TrainingRecord]) -> int:
+        """キャッシュの1項目の使用量の見積もり(バイト)"""
+        size = self.ENTRY_OVERHEAD + sys.getsizeof(menu_name)
+        if record is not None:
+            size += sys.getsizeof(record) + sum(sys.getsizeof(getattr(record, name)) for name in record.__slots__)
+        return size
+
+    def _put(self, menu_name: str, record: Optional[TrainingRecord]) -> None:
+        """キャッシュへ入れ，上限を超えた分を古い順に捨てる"""
+        self._discard(menu_name)
+        self._cache[menu_name] = record
+        self.size += self._entry_size(menu_name, record)
+        while self.size > self.budget and len(self._cache) > 1:
+            evicted_name, evicted = self._cache.popitem(last=False)
+            self.size -= self._entry_size(evicted_name, evicted)
+            self.evictions += 1
+
+    def _discard(self, menu_name: str) -> None:
+        """キャッシュから取り除く"""
+        if menu_name in self._cache:
+            self.size -= self._entry_size(menu_name, self._cache.pop(menu_name))
+
+    def _invalidate(self) -> None:
+        """キャッシュを空にする"""
+        self._cache.clear()
+        self.size = 0
+
+    def get(self, menu_name: str) -> Optional[TrainingRecord]:
+        with self._lock:
+            if menu_name in self._cache:
+                self._cache.move_to_end(menu_name)
+                self.hits += 1
+                return self._cache[menu_name]
+            self.misses += 1
+            record = self.storage.get(menu_name)
+            self._put(menu_name, record)
+            return record
+
+    def records(self) -> Dict[str, TrainingRecord]:
+        return self.storage.records()
+
+    def add_set(self, timestamp: float, menu_name: str, a: float, b: float) -> TrainingRecord:
+        with self._lock:
+            record = self.storage.add_set(timestamp, menu_name, a, b)
+            self._put(menu_name, record)
+            return record
+
+    def add_sets(self, rows: Iterable[SetRow]) -> None:
+        rows = list(rows)
+        with self._lock:
+            self.storage.add_sets(rows)
+            for _, menu_name, _, _ in rows:
+                self._discard(menu_name)
+
+    def remove(self, menu_name: str) -> bool:
+        with self._lock:
+            self._discard(menu_name)
+            return self.storage.remove(menu_name)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._invalidate()
+            self.storage.clear()
+
+    def iter_sets(self, menu_name: Optional[str] = None, since: Optional[float] = None,
+                  until: Optional[float] = None) -> Iterator[SetRow]:
+        return self.storage.iter_sets(menu_name, since, until)
+
+    def set_count(self) -> int:
+        return self.storage.set_count()
+
+    def set_position(self) -> int:
+        return self.storage.set_position()
+
+    def iter_sets_after(self, position: int) -> Iterator[SetRow]:
+        return self.storage.iter_sets_after(position)
+
+    def import_records(self, records: Dict[str, TrainingRecord], sets: Iterable[SetRow] = ()) -> None:
+        sets = list(sets)
+        with self._lock:
+            self.storage.import_records(records, sets)
+            for menu_name in records:
+                self._discard(menu_name)
+            for _, menu_name, _, _ in sets:
+                self._discard(menu_name)
+
+    def refresh(self) -> bool:
+        # 他のプロセスが書き込んでいれば，どのメニューが変わったかは分からないためキャッシュを空にする
+        if not self.storage.refresh():
+            return False
+        with self._lock:
+            self._invalidate()
+        return True
+
+    def flush(self) -> None:
+        self.storage.flush()
+
+    def compact(self) -> None:
+        self.storage.compact()
+
+    def close(self) -> None:
+        with self._lock:
+            self._invalidate()
+        self.storage.close()
+
+
+# HistoryWriter.DURABILITYと同様に文字列で選択する
+BACKENDS = {
+    "json": JsonStorage,
+    "sqlite": SqliteStorage,
+    "indexed": IndexedStorage,
+    "memory": MemoryStorage,
+}
+
+
+def check_settings(backend: str, memory_budget: Optional[int] = None) -> None:
+    """保存先とメモリ予算の組み合わせを確認する(使えない組み合わせの場合はValueError)
+
+    メモリ予算モードは記録をメニュー単位で読み込める保存先(LAZY_LOAD)でしか使えない。
+    jsonは1つのスナップショットに全記録を持つため，予算を指定しても全記録を読み込むことになる。
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"不正な保存先です: {backend}")
+    if memory_budget is not None and not BACKENDS[backend].LAZY_LOAD:
+        lazy = " / ".join(f'"{name}"' for name, storage_class in BACKENDS.items() if storage_class.LAZY_LOAD)
+        raise ValueError(
+            f"メモリ予算モード(MEMORY_BUDGET)は保存先 {backend} では使えません．"
+            f"BACKENDを{lazy}にするか，MEMORY_BUDGETをNoneにしてください"
+        )
+
+
+def open_storage(backend: str, memory_budget: Optional[int] = None, directory: Optional[str] = None) -> HistoryStorage:
+    """名前を指定してバックエンドを開く(memory_budgetを指定するとメモリ予算モード)
+
+    directoryを指定すると，既定のファイル名のままそのディレクトリに保存する(プロフィールごとの履歴)。
+    """
+    # 開いてから確認すると全記録を読み込んでしまうため，先に確認する
+    check_settings(backend, memory_budget)
+    storage_class = BACKENDS[backend]
+    storage = storage_class() if directory is None else storage_class.in_directory(directory)
+    if memory_budget is None:
+        return storage
+    return CachedStorage(storage, memory_budget)
@@ -0,0 +1,414 @@
+# 端末間の差分同期(スマートフォンで記録し，タブレットで振り返るなど)
+# 各端末は前回の同期の時点の記録を覚えておき，それ以降に変わった記録だけを送る
+# サーバーは記録ごとに更新番号(version)を振り，端末が前回受け取った番号(cursor)より新しい記録だけを返す
+# 送信と受信は1回のHTTPリクエストで行い，本文はzlibで圧縮したJSONにまとめる
+# 記録の統合規則はstorage.merge_record()と同じ(bestは最大値，lastは記録の更新番号(version)の大きい方．
+# 同じなら新しい時刻の方，それも同じならA・Bの大きい方)．端末の時計がずれていても，受け取った記録より後の更新が残る
+# この規則は統合する順序によらず同じ結果になるため，どの端末から何回同期しても全端末が同じ記録に収束する
+# 1セットごとの記録(セット)も，前回の同期以降に追記したものを送り，サーバーが更新番号を振って他の端末へ返す
+# 送ったセットは保存先の追記順の位置(set_position())で覚えるため，後から過去の日付で記録したセットも送られる
+# セットは時刻とメニューが同じものを同じセットとみなし，サーバーと端末のどちらでも二重には記録しない
+# (削除は同期しない．他の端末に記録が残っていれば次の同期で戻る)
+# 同期の状態はプロフィールごとのフォルダに保存し，サーバーもプロフィールごとに記録を分けて保持する
+#
+# 使い方:
+#   python sync.py serve [--port 8765] [--data sync_server.json]   # 同期サーバーを起動
+#   python sync.py sync http://192.168.0.10:8765 [--profile 名前]   # この端末の履歴を同期(省略時は選択中のプロフィール)
+
+import argparse
+import bisect
+import json
+import os
+import sys
+import threading
+import urllib.request
+import zlib
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from history import TrainingHistory
+from profiles import ProfileManager
+from set_log import SetRow
+from storage import TrainingRecord, merge_record
+
+# 2: セットとプロフィールを同期する
+# 3: 記録に更新番号を付ける
+PROTOCOL_VERSION = 3
+SYNC_PATH = "/sync"
+DEFAULT_PORT = 8765
+CONTENT_TYPE = "application/json"
+# HTTPの"deflate"はzlib形式を指す
+CONTENT_ENCODING = "deflate"
+COMPRESS_LEVEL = 6
+
+
+def encode_records(records: Dict[str, TrainingRecord]) -> Dict[str, List[float]]:
+    """記録を送信用の形式(メニュー名 -> [last_a, last_b, best_a, best_b, last_ts, version])にする"""
+    return {
+        menu_name: [record.last_a, record.last_b, record.best_a, record.best_b, record.last_ts, record.version]
+        for menu_name, record in records.items()
+    }
+
+
+def decode_records(data: Dict[str, List[float]]) -> Dict[str, TrainingRecord]:
+    """送信用の形式から記録に戻す"""
+    return {
+        menu_name: TrainingRecord(*map(float, values[:5]), version=int(values[5]))
+        for menu_name, values in data.items()
+    }
+
+
+def encode_sets(rows: Iterable[SetRow]) -> List[List[Any]]:
+    """セットを送信用の形式([時刻, メニュー名, A, B]のリスト)にする"""
+    return [[timestamp, menu_name, a, b] for timestamp, menu_name, a, b in rows]
+
+
+def decode_sets(data: List[List[Any]]) -> List[SetRow]:
+    """送信用の形式からセットに戻す"""
+    return [(float(timestamp), str(menu_name), float(a), float(b)) for timestamp, menu_name, a, b in data]
+
+
+def pack(payload: Dict[str, Any]) -> bytes:
+    """JSONにしてzlibで圧縮する"""
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(data, COMPRESS_LEVEL)
+
+
+def unpack(data: bytes) -> Dict[str, Any]:
+    """pack()の逆"""
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+class SyncStore:
+    """同期サーバーが保持する記録・セットと更新番号"""
+
+    def __init__(self, path: Optional[str] = None):
+        """記録を読み込む(pathがNoneの場合はメモリ上だけに保持する)"""
+        self.path = path
+        self.records: Dict[str, TrainingRecord] = {}
+        # 記録ごとの最後に変わったときの更新番号と，全体の最新の更新番号
+        self.versions: Dict[str, int] = {}
+        self.version = 0
+        # 届いた順のセットと，それぞれを受け取ったときの更新番号(昇順)
+        self.sets: List[SetRow] = []
+        self.set_versions: List[int] = []
+        self._set_keys = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.version = data["version"]
+            for menu_name, (*values, version) in data["records"].items():
+                self.records[menu_name] = TrainingRecord(*values)
+                self.versions[menu_name] = version
+            # セットを同期する前のファイルには"sets"が無い
+            for *row, version in data.get("sets", []):
+                self._add_set(tuple(row), version)
+
+    def _add_set(self, row: SetRow, version: int) -> bool:
+        """記録済みでなければセットを追加する(追加した場合はTrue)"""
+        key = (row[0], row[1])
+        if key in self._set_keys:
+            return False
+        self._set_keys.add(key)
+        self.sets.append(row)
+        self.set_versions.append(version)
+        return True
+
+    def apply(self, records: Dict[str, TrainingRecord], since: int,
+              sets: Iterable[SetRow] = ()) -> Tuple[Dict[str, TrainingRecord], List[SetRow], int]:
+        """端末から届いた記録とセットを統合し，(端末へ返す記録, 端末へ返すセット, 最新の更新番号)を返す
+
+        返すのは更新番号がsinceより新しい記録のうち届いた記録と異なるものと，
+        更新番号がsinceより新しいセットのうち届いていないもの(端末が既に持っているものは返さない)。
+        """
+        with self._lock:
+            changed_any = False
+            for menu_name, record in records.items():
+                current = self.records.get(menu_name)
+                merged = merge_record(current, record)
+                if merged != current:
+                    self.version += 1
+                    self.records[menu_name] = merged
+                    self.versions[menu_name] = self.version
+                    changed_any = True
+            sent = set()
+            added = False
+            for row in sets:
+                sent.add((row[0], row[1]))
+                if not added and (row[0], row[1]) not in self._set_keys:
+                    # 1回の同期で届いたセットには同じ更新番号を振る
+                    self.version += 1
+                    added = True
+                if self._add_set(row, self.version):
+                    changed_any = True
+
+            changed = {
+                menu_name: self.records[menu_name]
+                for menu_name, version in self.versions.items()
+                if version > since and self.records[menu_name] != records.get(menu_name)
+            }
+            # 更新番号は昇順に並んでいるため，sinceより新しいセットは二分探索で求める
+            start = bisect.bisect_right(self.set_versions, since)
+            new_sets = [row for row in self.sets[start:] if (row[0], row[1]) not in sent]
+            if changed_any:
+                self._save()
+            return changed, new_sets, self.version
+
+    def _save(self) -> None:
+        """記録をファイルへ書き込む(_lockを保持して呼ぶ)"""
+        if not self.path:
+            return
+        data = {
+            "version": self.version,
+            "records": {
+                menu_name: values + [self.versions[menu_name]]
+                for menu_name, values in encode_records(self.records).items()
+            },
+            "sets": [
+                row + [version] for row, version in zip(encode_sets(self.sets), self.set_versions)
+            ]
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class SyncRequestHandler(BaseHTTPRequestHandler):
+    """同期リクエストを処理するハンドラー"""
+
+    def do_POST(self) -> None:
+        if self.path != SYNC_PATH:
+            self.send_error(404)
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = unpack(self.rfile.read(length))
+            if request.get("protocol") != PROTOCOL_VERSION:
+                raise ValueError(f"未対応のプロトコルです: {request.get('protocol')}")
+            records = decode_records(request["records"])
+            sets = decode_sets(request.get("sets", []))
+            since = int(request.get("since", 0))
+            store = self.server.store_of(request.get("profile", ProfileManager.DEFAULT_PROFILE))
+        except (ValueError, KeyError, TypeError, zlib.error) as e:
+            self.send_error(400, explain=str(e))
+            return
+
+        changed, new_sets, version = store.apply(records, since, sets)
+        body = pack({
+            "protocol": PROTOCOL_VERSION,
+            "cursor": version,
+            "records": encode_records(changed),
+            "sets": encode_sets(new_sets)
+        })
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Encoding", CONTENT_ENCODING)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        print(f"[同期サーバー] {self.address_string()} {format % args}")
+
+
+class SyncServer(ThreadingHTTPServer):
+    """同期サーバー(動作確認やLAN内での利用を想定した参照実装)"""
+
+    def __init__(self, address: Tuple[str, int], store: Optional[SyncStore] = None):
+        """待ち受けるアドレスと記録の保存先(既定のプロフィールの分)を指定して作成"""
+        super().__init__(address, SyncRequestHandler)
+        self.store = store or SyncStore()
+        # 既定以外のプロフィールの記録は，保存先のファイル名にプロフィール名を付けて別に保持する
+        self.stores: Dict[str, SyncStore] = {ProfileManager.DEFAULT_PROFILE: self.store}
+        self._stores_lock = threading.Lock()
+
+    def store_of(self, profile: str) -> SyncStore:
+        """プロフィールの記録の保存先(初めての場合は読み込む)"""
+        if not isinstance(profile, str) or not profile or profile.startswith(".") or "/" in profile or os.sep in profile:
+            raise ValueError(f"不正なプロフィール名です: {profile}")
+        with self._stores_lock:
+            store = self.stores.get(profile)
+            if store is None:
+                path = None
+                if self.store.path:
+                    base, ext = os.path.splitext(self.store.path)
+                    path = f"{base}.{profile}{ext}"
+                store = self.stores[profile] = SyncStore(path)
+            return store
+
+
+@dataclass
+class SyncResult:
+    """同期の結果を保持するデータクラス"""
+    sent: int = 0
+    received: int = 0
+    # 送ったセット数と，受け取って記録したセット数(記録済みのものを除く)
+    sent_sets: int = 0
+    received_sets: int = 0
+    cursor: int = 0
+
+
+class SyncClient:
+    """端末の履歴をサーバーと同期するクラス"""
+    # 前回の同期の状態(サーバーのURL・受け取った更新番号・同期した時点の記録・送ったセットの追記順の位置)
+    # プロフィールごとのフォルダに保存する(ProfileManager.path_of())
+    STATE_PATH = "sync_state.json"
+    TIMEOUT = 10.0
+
+    def __init__(self, history: TrainingHistory, url: str, state_path: Optional[str] = None,
+                 profile: str = ProfileManager.DEFAULT_PROFILE):
+        """同期先のサーバーと状態ファイル，サーバー上で記録を分けるプロフィールを指定して作成"""
+        self.history = history
+        self.url = url.rstrip("/") + SYNC_PATH
+        self.state_path = state_path or self.STATE_PATH
+        self.profile = profile
+        self.cursor = 0
+        self.synced: Dict[str, TrainingRecord] = {}
+        # 前回までに送ったセットの追記順の位置(保存先のset_position()．0の場合は全セットを送る)
+        self.set_position = 0
+        self._load_state()
+
+    def _load_state(self) -> None:
+        """前回の同期の状態を読み込む(別のサーバーと同期していた場合は最初から同期し直す)"""
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[警告] 同期の状態を読み込めないため，全記録を同期し直します: {e}")
+            return
+        if state.get("url") != self.url or state.get("protocol") != PROTOCOL_VERSION:
+            # セットを同期する前の状態も，セットを送り直すため最初から同期し直す
+            return
+        self.cursor = state.get("cursor", 0)
+        self.synced = decode_records(state.get("synced", {}))
+        self.set_position = state.get("set_position", 0)
+
+    def _save_state(self) -> None:
+        """同期の状態を書き込む"""
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "protocol": PROTOCOL_VERSION,
+                "url": self.url,
+                "cursor": self.cursor,
+                "synced": encode_records(self.synced),
+                "set_position": self.set_position
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def changed_records(self) -> Dict[str, TrainingRecord]:
+        """前回の同期以降に変わった記録"""
+        self.history.refresh()
+        return {
+            menu_name: record
+            for menu_name, record in self.history.storage.records().items()
+            if self.synced.get(menu_name) != record
+        }
+
+    def changed_sets(self) -> Tuple[List[SetRow], int]:
+        """前回の同期以降に追記したセットと，送り終えた後に覚える追記順の位置"""
+        # 未書き込みのセットは他のプロセスの追記で位置がずれるため，書き込んでから位置を求める
+        self.history.flush()
+        self.history.refresh()
+        storage = self.history.storage
+        # 先に位置を求めておき，その後に記録されたセットは次の同期でもう一度送る(サーバーが記録済みとして除く)
+        position = storage.set_position()
+        return list(storage.iter_sets_after(self.set_position)), position
+
+    def _post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """サーバーへ送信し，応答を返す"""
+        request = urllib.request.Request(
+            self.url,
+            data=pack(payload),
+            headers={"Content-Type": CONTENT_TYPE, "Content-Encoding": CONTENT_ENCODING},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.TIMEOUT) as response:
+            return unpack(response.read())
+
+    def sync(self) -> SyncResult:
+        """変わった記録とセットを送り，他の端末の記録とセットを受け取って統合する(1回のリクエストで行う)"""
+        outgoing = self.changed_records()
+        outgoing_sets, position = self.changed_sets()
+        response = self._post({
+            "protocol": PROTOCOL_VERSION,
+            "profile": self.profile,
+            "since": self.cursor,
+            "records": encode_records(outgoing),
+            "sets": encode_sets(outgoing_sets)
+        })
+        incoming = decode_records(response["records"])
+        incoming_sets = decode_sets(response.get("sets", []))
+        # 記録済みのセットはadd_sets()が除く．セットから導いた記録は，続けて統合する記録で全端末と同じになる
+        received_sets = self.history.add_sets(incoming_sets)
+        self.history.merge_records(incoming)
+
+        # サーバーが持つ記録(送った記録と受け取った記録を統合したもの)を同期済みとして覚える
+        # (同期中に記録されたセットは次の同期で送られるよう，履歴を読み直さずに求める)
+        for menu_name in outgoing.keys() | incoming.keys():
+            synced = merge_record(outgoing.get(menu_name), incoming[menu_name]) if menu_name in incoming else outgoing[menu_name]
+            self.synced[menu_name] = synced
+        # 受け取ったセットは送る前に求めた位置より後ろに追記されるため，次の同期で一度送り返すが，
+        # サーバーが記録済みのセットとして除く
+        self.set_position = position
+        self.cursor = response["cursor"]
+        self._save_state()
+        return SyncResult(
+            sent=len(outgoing),
+            received=len(incoming),
+            sent_sets=len(outgoing_sets),
+            received_sets=received_sets,
+            cursor=self.cursor
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="端末間の履歴の同期")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="同期サーバーを起動")
+    serve.add_argument("--host", default="0.0.0.0", help="待ち受けるアドレス")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT, help="待ち受けるポート")
+    serve.add_argument("--data", default="sync_server.json", help="サーバーの記録の保存先")
+    client = subparsers.add_parser("sync", help="この端末の履歴を同期")
+    client.add_argument("url", help="同期サーバーのURL(例: http://192.168.0.10:8765)")
+    client.add_argument("--profile", help="同期するプロフィール(省略時は選択中のプロフィール)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = SyncServer((args.host, args.port), SyncStore(args.data))
+        print(f"[同期サーバー] {args.host}:{args.port} で待ち受けています(Ctrl+Cで終了)。")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return 0
+
+    profiles = ProfileManager()
+    profile = args.profile or profiles.active
+    try:
+        history = profiles.open(profile)
+        result = SyncClient(history, args.url, profiles.path_of(profile, SyncClient.STATE_PATH), profile).sync()
+    except ValueError as e:
+        print(f"[エラー] {e}")
+        return 1
+    except OSError as e:
+        print(f"[エラー] 同期に失敗しました: {e}")
+        return 1
+    finally:
+        profiles.close()
+    print(f"[同期] {profile}: 記録を{result.sent}件送信し，{result.received}件受信しました"
+          f"(セット: 送信{result.sent_sets}件，受信{result.received_sets}件)。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
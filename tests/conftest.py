@@ -0,0 +1,30 @@
+# テストの共通設定
+# Pythonistaのモジュール(ui・keyboard・console)はベンチマーク用の代替を使い，
+# 履歴などのファイルはテストごとの一時ディレクトリに作る(保存先は作業ディレクトリからの相対パスのため)
+
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "benchmarks", "stubs"), ROOT]
+
+from menu_manager import MenuManager  # noqa: E402
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """menu.txtを置いた一時ディレクトリを作業ディレクトリにする"""
+    shutil.copy(os.path.join(ROOT, "menu.txt"), tmp_path / MenuManager.FILE_PATH)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(MenuManager, "_shared", None)
+    yield tmp_path
+    MenuManager._shared = None
+
+
+@pytest.fixture
+def menu_name(workspace):
+    """menu.txtの先頭のメニュー名"""
+    return next(iter(MenuManager.shared().menus))
@@ -0,0 +1,101 @@
+import random
+import time
+
+from aggregates import PERIOD_ALL, PERIOD_DAY, PERIOD_MONTH, PERIOD_WEEK, SCOPE_MENU, SCOPE_TARGET, HistoryAggregates, bucket_keys
+from controller import TrainingController
+from history import TrainingHistory
+from menu_manager import MenuManager
+from storage import MemoryStorage
+
+
+def recomputed(history):
+    """全セットから作り直した集計値"""
+    aggregates = HistoryAggregates(history.menu_manager)
+    aggregates.rebuild(history.iter_sets())
+    return aggregates
+
+
+def scan(rows, menu_manager, scope, key, period, when):
+    """線形走査で求めた，時刻whenを含む期間のセット数とボリューム"""
+    index = {PERIOD_DAY: 0, PERIOD_WEEK: 1, PERIOD_MONTH: 2}.get(period)
+    count, volume = 0, 0.0
+    for timestamp, menu_name, a, b in rows:
+        menu = menu_manager.get_menu(menu_name)
+        if (menu_name if scope == SCOPE_MENU else (menu.target if menu else "")) != key:
+            continue
+        if index is not None and bucket_keys(timestamp)[index] != bucket_keys(when)[index]:
+            continue
+        count += 1
+        volume += a * b
+    return count, volume
+
+
+def test_incremental_aggregates_match_recompute(workspace):
+    """記録のたびに更新した集計値は，全セットから作り直した集計値と一致する"""
+    rng = random.Random(0)
+    history = TrainingHistory(storage=MemoryStorage())
+    menu_names = list(history.menu_manager.menus)[:4]
+    now = time.time()
+    # 集計値を作った後に，過去の日付の取り込みと記録を混ぜて追加する
+    history.add_sets([(now - rng.uniform(0, 90 * 86400), rng.choice(menu_names), 50.0, 10.0) for _ in range(50)])
+    assert history.aggregates.rows == 50
+    history.add_sets([
+        (now - rng.uniform(0, 90 * 86400), rng.choice(menu_names), float(rng.randrange(10, 100)), float(rng.randrange(1, 15)))
+        for _ in range(200)
+    ])
+    for _ in range(20):
+        history.update_history(rng.choice(menu_names), float(rng.randrange(10, 100)), float(rng.randrange(1, 15)))
+
+    aggregates = history.aggregates
+    expected = recomputed(history)
+    assert aggregates.rows == expected.rows == 270
+    assert aggregates.buckets.keys() == expected.buckets.keys()
+    for key, series in expected.buckets.items():
+        assert aggregates.buckets[key].keys() == series.keys()
+        for bucket, aggregate in series.items():
+            actual = aggregates.buckets[key][bucket]
+            assert (actual.count, actual.max_a, actual.max_b) == (aggregate.count, aggregate.max_a, aggregate.max_b)
+            assert abs(actual.volume - aggregate.volume) < 1e-6
+
+    # 期間ごとの問い合わせも線形走査と一致する
+    rows = list(history.iter_sets())
+    for when in [now] + [rng.choice(rows)[0] for _ in range(10)]:
+        for period in (PERIOD_DAY, PERIOD_WEEK, PERIOD_MONTH, PERIOD_ALL):
+            for menu_name in menu_names:
+                aggregate = aggregates.menu(menu_name, period, when)
+                count, volume = scan(rows, history.menu_manager, SCOPE_MENU, menu_name, period, when)
+                assert aggregate.count == count and abs(aggregate.volume - volume) < 1e-6
+            target = history.menu_manager.get_menu(menu_names[0]).target
+            aggregate = aggregates.target(target, period, when)
+            count, volume = scan(rows, history.menu_manager, SCOPE_TARGET, target, period, when)
+            assert aggregate.count == count and abs(aggregate.volume - volume) < 1e-6
+    history.close()
+
+
+def test_target_change_invalidates_aggregates(workspace, menu_name):
+    """menu.txtでメニューの部位を変更すると，部位別の集計値を新しい部位で作り直す"""
+    history = TrainingHistory(storage=MemoryStorage())
+    controller = TrainingController(history=history)
+    old_target = history.menu_manager.get_menu(menu_name).target
+    new_target = old_target + "・変更後"
+    history.update_history(menu_name, 50, 10)
+    history.update_history(menu_name, 55, 10)
+    assert history.aggregates.target(old_target).count == 2
+
+    path = workspace / MenuManager.FILE_PATH
+    lines = path.read_text(encoding="utf-8").splitlines()
+    lines = [
+        line.replace(f"{menu_name},{old_target},", f"{menu_name},{new_target},", 1) if line.startswith(f"{menu_name},") else line
+        for line in lines
+    ]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    changes = history.menu_manager.reload()
+    assert any(change.name == menu_name and change.target_changed for change in changes)
+    controller.apply_menu_changes(changes)
+
+    aggregates = history.aggregates
+    assert aggregates.target(old_target).count == 0
+    assert aggregates.target(new_target).count == 2
+    assert aggregates.menu(menu_name).count == 2
+    assert not aggregates.targets_changed()
+    history.close()
@@ -0,0 +1,43 @@
+import os
+import time
+
+from archive import SegmentArchive, month_of
+from storage import JsonStorage
+
+MONTHS = [(2024, 1), (2024, 2), (2024, 3)]
+
+
+def month_rows(menu_name, round_number):
+    """過去の各月に1セットずつ(回ごとに別の時刻)"""
+    return [
+        (time.mktime((year, month, 10, 12, round_number, 0, 0, 0, -1)), menu_name, 50.0 + round_number, 10.0)
+        for year, month in MONTHS
+    ]
+
+
+def test_repeated_compactions_keep_one_segment_per_month(workspace, menu_name):
+    """封印済みの月へ何回封印しても，セグメントは1か月につき1つで，古いファイルは残らない"""
+    storage = JsonStorage.in_directory(str(workspace))
+    expected = []
+    for round_number in range(5):
+        rows = month_rows(menu_name, round_number)
+        storage.add_sets(rows)
+        expected.extend(rows)
+        storage.compact()
+
+        segments = storage.archive.segments
+        assert sorted(segment.name for segment in segments) == sorted({month_of(row[0]) for row in expected})
+        assert storage.archive.row_count() == len(expected)
+        files = {entry for entry in os.listdir(storage.archive.directory) if entry != SegmentArchive.MANIFEST_NAME}
+        assert files == {segment.file for segment in segments}
+    assert sorted(storage.iter_sets()) == sorted(expected)
+    # 書き直したセグメントも各セットの追記順の位置を引き継ぐ
+    assert sorted(storage.iter_sets_after(0)) == sorted(expected)
+    assert list(storage.iter_sets_after(storage.set_position())) == []
+    storage.close()
+
+    # 開き直しても同じ
+    storage = JsonStorage.in_directory(str(workspace))
+    assert sorted(storage.iter_sets()) == sorted(expected)
+    storage.close()
+
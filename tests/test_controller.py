@@ -0,0 +1,38 @@
+from concurrent.futures import Future
+
+from controller import TrainingController
+from history import TrainingHistory
+from storage import MemoryStorage
+
+
+def loading_controller(menu_name):
+    """履歴の読み込み中にメニューを選択した状態のコントローラーと，読み込みのFuture"""
+    future = Future()
+    controller = TrainingController(history=future)
+    assert controller.select_menu(menu_name)
+    history = TrainingHistory(storage=MemoryStorage())
+    history.update_history(menu_name, 60, 8)
+    history.update_history(menu_name, 40, 10)
+    return controller, future, history
+
+
+def test_loaded_history_keeps_adjusted_values(workspace, menu_name):
+    """読み込み中にスライダーで変更した値は，履歴の読み込みが終わっても上書きしない"""
+    controller, future, history = loading_controller(menu_name)
+    controller.set_fraction('a', 0.5)
+    controller.increase('b')
+    adjusted = (controller.param_a_scale.value, controller.param_b_scale.value)
+
+    future.set_result(history)
+    assert controller.apply_loaded_history()
+    assert (controller.param_a_scale.value, controller.param_b_scale.value) == adjusted
+    assert (controller.best_a, controller.best_b) == (60, 10)
+
+
+def test_loaded_history_sets_untouched_values(workspace, menu_name):
+    """変更していなければ，履歴の読み込みが終わったときに前回の値を反映する"""
+    controller, future, history = loading_controller(menu_name)
+    future.set_result(history)
+    assert controller.apply_loaded_history()
+    assert (controller.param_a_scale.value, controller.param_b_scale.value) == (40, 10)
+    assert (controller.best_a, controller.best_b) == (60, 10)
@@ -0,0 +1,55 @@
+import gui
+from menu_manager import MenuManager
+from startup import StartupPipeline
+
+
+def test_tap_is_kept_when_menu_file_changed(workspace):
+    """menu.txtの変更を反映する場合も，タップしたメニューを選択する"""
+    app = gui.TrainingApp()
+    rows = [(section, row) for section, (_, positions) in enumerate(app.menu_data.sections)
+            for row in range(len(positions))]
+    first, tapped = rows[0], rows[-1]
+    app.tableview_did_select(app.menu_table, *first)
+    menu_name = app.menu_data.menu_name(*tapped)
+
+    # 先頭に別のメニューを追加して，タップした行の位置をずらす
+    path = workspace / MenuManager.FILE_PATH
+    path.write_text("追加メニュー,胸,kg,5,回,1,150,50\n" + path.read_text(encoding="utf-8"), encoding="utf-8")
+    app.tableview_did_select(app.menu_table, *tapped)
+
+    assert "追加メニュー" in app.menu_manager.menus
+    assert app.controller.menu_name == menu_name
+    assert app.menu_table.selected_row == app.menu_data.find(menu_name)
+    app.history.close()
+
+
+def wait_for_startup_thread():
+    """起動用のスレッドに投入済みの処理(履歴の読み込みと，届いたときの反映)が終わるまで待つ"""
+    StartupPipeline.executor().submit(lambda: None).result(5)
+
+
+def test_history_is_applied_after_first_frame(workspace):
+    """履歴は画面を作り終えてから読み込み，届いたら選択中のメニューの前回の記録と最高記録を反映する"""
+    app = gui.TrainingApp()
+    menu_name = app.controller.menu_name
+    app.history.update_history(menu_name, 50, 10)
+    app.history.close()
+
+    MenuManager._shared = None
+    app = gui.TrainingApp()
+    wait_for_startup_thread()
+    assert app.controller.menu_name == menu_name
+    assert (app.controller.param_a_scale.value, app.controller.param_b_scale.value) == (50, 10)
+    assert (app.controller.best_a, app.controller.best_b) == (50, 10)
+    app.history.close()
+
+
+def test_search_index_is_built_when_search_field_is_selected(workspace):
+    """検索インデックスは起動時には作らず，検索欄を選択したときに作り始める"""
+    app = gui.TrainingApp()
+    wait_for_startup_thread()
+    assert app.menu_manager.index._grams is None
+    app.textfield_did_begin_editing(app.search_field)
+    wait_for_startup_thread()
+    assert app.menu_manager.index._grams is not None
+    app.history.close()
@@ -0,0 +1,36 @@
+import gc
+import weakref
+
+from profiles import ProfileManager
+
+
+def test_evicted_profile_is_released(workspace, menu_name):
+    """上限を超えて閉じたプロフィールの履歴と保存先は解放される"""
+    profiles = ProfileManager()
+    profiles.CACHE_SIZE = 3
+    storages = []
+    for number in range(8):
+        name = profiles.create(f"user{number}")
+        history = profiles.activate(name)
+        history.update_history(menu_name, 10 + number, 1)
+        storages.append(weakref.ref(history.storage))
+    del history
+    gc.collect()
+
+    alive = [ref for ref in storages if ref() is not None]
+    assert len(alive) == profiles.CACHE_SIZE
+    assert all(ref() is not None for ref in storages[-profiles.CACHE_SIZE:])
+    profiles.close()
+    gc.collect()
+    assert all(ref() is None for ref in storages)
+
+
+def test_recent_profile_is_reused(workspace, menu_name):
+    """最近使ったプロフィールへは開き直さずに切り替わる"""
+    profiles = ProfileManager()
+    profiles.create("a")
+    first = profiles.activate("a")
+    profiles.activate(ProfileManager.DEFAULT_PROFILE)
+    assert profiles.activate("a") is first
+    assert profiles.active == "a"
+    profiles.close()
@@ -0,0 +1,80 @@
+import pytest
+
+from controller import TrainingController
+from history import TrainingHistory
+from profiles import ProfileManager
+from session import TrainingSession
+from storage import JsonStorage
+
+
+def record_sets(controller, menu_name, count):
+    """セッション中にcount セットを記録する"""
+    controller.select_menu(menu_name)
+    for step in range(count):
+        controller.set_fraction('a', 0.1 * (step + 1))
+        controller.set_fraction('b', 0.5)
+        assert controller.record() is not None
+
+
+def test_commit_crash_does_not_duplicate_sets(workspace, menu_name, monkeypatch):
+    """履歴へ書き込んだ後，書き込み済みの印を付ける前に落ちても，再開後に同じセットを二重に記録しない"""
+    history = TrainingHistory(storage=JsonStorage())
+    controller = TrainingController(history=history)
+    controller.start_session()
+    record_sets(controller, menu_name, 3)
+
+    def crash(self):
+        raise RuntimeError("クラッシュ")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(TrainingSession, "mark_committed", crash)
+        with pytest.raises(RuntimeError):
+            controller.commit_session()
+    history.close()
+
+    # 再開したセッションは同じセットを再度書き込もうとする
+    history = TrainingHistory(storage=JsonStorage())
+    controller = TrainingController(history=history)
+    assert controller.session is not None
+    assert controller.end_session()
+    assert history.storage.set_count() == 3
+    assert history.aggregates.menu(menu_name).count == 3
+    assert history.range_stats(menu_name).count == 3
+    history.close()
+
+
+def test_commit_does_not_scan_history(workspace, menu_name):
+    """中断されていない書き込みでは，記録済みかどうかを調べない(インデックスを作らない)"""
+    history = TrainingHistory(storage=JsonStorage())
+    controller = TrainingController(history=history)
+    controller.start_session()
+    record_sets(controller, menu_name, 2)
+    assert controller.commit_session() == 2
+    assert history._index is None
+    assert history.storage.set_count() == 2
+    history.close()
+
+
+def test_session_follows_profile(workspace, menu_name):
+    """セッションのステージングファイルはプロフィールごとに持つ"""
+    profiles = ProfileManager()
+    profiles.create("a")
+    default_path = profiles.path_of(ProfileManager.DEFAULT_PROFILE, TrainingSession.STAGING_PATH)
+    controller = TrainingController(history=profiles.open(ProfileManager.DEFAULT_PROFILE), staging_path=default_path)
+    controller.start_session()
+    record_sets(controller, menu_name, 2)
+    # セッション中は切り替えない
+    assert not controller.switch_history(profiles.open("a"), profiles.path_of("a", TrainingSession.STAGING_PATH))
+    controller.commit_session()
+    profiles.close()
+
+    # 別のプロフィールで開いた場合は，既定のプロフィールのセッションを再開しない
+    profiles = ProfileManager()
+    controller = TrainingController(history=profiles.open("a"), staging_path=profiles.path_of("a", TrainingSession.STAGING_PATH))
+    assert controller.session is None
+    assert controller.switch_history(profiles.open(ProfileManager.DEFAULT_PROFILE), default_path)
+    assert controller.session is not None and len(controller.session) == 2
+    controller.end_session()
+    assert profiles.open(ProfileManager.DEFAULT_PROFILE).storage.set_count() == 2
+    assert profiles.open("a").storage.set_count() == 0
+    profiles.close()
@@ -0,0 +1,105 @@
+import random
+from array import array
+
+import pytest
+
+from aggregates import Aggregate
+from set_index import MaxTree, SetIndex
+
+MENUS = ["チェストプレス", "レッグプレス", "ラットプルダウン"]
+SEEDS = range(5)
+
+
+def scan_stats(rows, menu_name, since=None, until=None):
+    """線形走査で求めた期間[since, until)のメニューの集計値"""
+    aggregate = Aggregate()
+    for timestamp, name, a, b in rows:
+        if name == menu_name and (since is None or timestamp >= since) and (until is None or timestamp < until):
+            aggregate.add(a, b)
+    return aggregate
+
+
+def scan_best_as_of(rows, menu_name, when):
+    """線形走査で求めた時刻when(を含む)までの最高記録"""
+    matched = [(a, b) for timestamp, name, a, b in rows if name == menu_name and timestamp <= when]
+    if not matched:
+        return None
+    return max(a for a, _ in matched), max(b for _, b in matched)
+
+
+def assert_same(actual, expected):
+    assert actual.count == expected.count
+    assert (actual.max_a, actual.max_b) == (expected.max_a, expected.max_b)
+    assert (actual.sum_a, actual.sum_b, actual.volume) == pytest.approx((expected.sum_a, expected.sum_b, expected.volume))
+
+
+def random_rows(rng, count, start=0.0, ordered=True):
+    """ランダムなセット(orderedがFalseの場合は時刻が前後する．同じ時刻も含む)"""
+    timestamps = [start + rng.randrange(0, count * 10) for _ in range(count)]
+    if ordered:
+        timestamps.sort()
+    return [(timestamp, rng.choice(MENUS), float(rng.randrange(0, 200)), float(rng.randrange(1, 20))) for timestamp in timestamps]
+
+
+def check_index(rng, index, rows):
+    """ランダムな期間・時点の問い合わせが線形走査と一致するか"""
+    span = max(row[0] for row in rows) + 10
+    for menu_name in MENUS + ["未登録"]:
+        assert_same(index.stats(menu_name), scan_stats(rows, menu_name))
+        for _ in range(20):
+            since, until = sorted(rng.uniform(-5, span) for _ in range(2))
+            assert_same(index.stats(menu_name, since, until), scan_stats(rows, menu_name, since, until))
+            assert_same(index.stats(menu_name, since=since), scan_stats(rows, menu_name, since=since))
+            assert_same(index.stats(menu_name, until=until), scan_stats(rows, menu_name, until=until))
+            when = rng.choice([rng.uniform(-5, span), rng.choice(rows)[0]])
+            assert index.best_as_of(menu_name, when) == scan_best_as_of(rows, menu_name, when)
+        boundaries = sorted(rng.uniform(-5, span) for _ in range(6))
+        for aggregate, since, until in zip(index.period_stats(menu_name, boundaries), boundaries, boundaries[1:]):
+            assert_same(aggregate, scan_stats(rows, menu_name, since, until))
+    keys = {(row[0], row[1]) for row in rows}
+    for timestamp, menu_name, _, _ in random_rows(rng, 20, ordered=False) + rows[:20]:
+        assert index.contains(timestamp, menu_name) == ((timestamp, menu_name) in keys)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_max_tree_matches_scan(seed):
+    """区間の最大値は，作成後に追加した値を含めてスライスの最大値と一致する"""
+    rng = random.Random(seed)
+    # ブロックの境目の前後の長さを含める
+    for length in [0, 1, MaxTree.BLOCK - 1, MaxTree.BLOCK, MaxTree.BLOCK + 1, rng.randrange(2, 500)]:
+        values = [rng.uniform(0, 100) for _ in range(length)]
+        tree = MaxTree(array("d", values))
+        for _ in range(rng.randrange(0, 3 * MaxTree.BLOCK)):
+            value = rng.uniform(0, 100)
+            tree.append(value)
+            values.append(value)
+        assert list(tree.levels[0]) == values
+        for _ in range(200):
+            start = rng.randrange(0, len(values) + 1)
+            stop = rng.randrange(start, len(values) + 1)
+            assert tree.query(start, stop) == max(values[start:stop], default=0.0)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_set_index_matches_scan(seed):
+    """期間の合計・最大値と時点の最高記録は，作成後の追加(時刻順・時刻が前後するもの)を含めて線形走査と一致する"""
+    rng = random.Random(seed)
+    rows = random_rows(rng, 300, ordered=bool(seed % 2))
+    index = SetIndex()
+    index.rebuild(rows)
+    check_index(rng, index, rows)
+
+    # 問い合わせでセグメント木と累積和を作った後に，時刻順に追加する
+    appended = random_rows(rng, 100, start=max(row[0] for row in rows) + 1)
+    for row in appended:
+        index.add(*row)
+    rows += appended
+    assert index.rows == len(rows)
+    check_index(rng, index, rows)
+
+    # 時刻が前後するセット(他の端末からの取り込みなど)を追加すると，そのメニューは並べ直して作り直す
+    inserted = random_rows(rng, 50, ordered=False)
+    for row in inserted:
+        index.add(*row)
+    rows += inserted
+    check_index(rng, index, rows)
@@ -0,0 +1,190 @@
+import itertools
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from history import TrainingHistory
+from storage import BACKENDS, IndexedStorage, JsonStorage, MemoryStorage, SqliteStorage, TrainingRecord, merge_record, open_storage
+
+# メモリ予算モードは記録をメニュー単位で読み込めるバックエンドだけ
+STORAGES = [(backend, None) for backend in BACKENDS] + [
+    (backend, 1 << 20) for backend, storage_class in BACKENDS.items() if storage_class.LAZY_LOAD
+]
+
+MENU = "チェストプレス"
+RECORDS = [
+    TrainingRecord(50, 10, 50, 10, last_ts=100.0),
+    TrainingRecord(40, 12, 45, 12, last_ts=100.0),
+    TrainingRecord(60, 5, 60, 5, last_ts=90.0),
+]
+
+
+@pytest.fixture(params=STORAGES, ids=lambda param: f"{param[0]}{'-cached' if param[1] else ''}")
+def open_backend(request, workspace):
+    """バックエンドを開く関数(開いた保存先はテストの終了時に閉じる)"""
+    backend, budget = request.param
+    opened = []
+
+    def open_backend(directory):
+        storage = open_storage(backend, budget, str(workspace / directory))
+        opened.append(storage)
+        return storage
+
+    yield open_backend
+    for storage in opened:
+        storage.close()
+
+
+def expected_record(records):
+    """merge_record()で統合した結果"""
+    result = None
+    for record in records:
+        result = merge_record(result, record)
+    return result
+
+
+@pytest.mark.parametrize("order", list(itertools.permutations(range(len(RECORDS)))))
+def test_merge_order_does_not_matter(open_backend, order):
+    """同じ時刻を含む記録を，どの順序で統合しても全バックエンドで同じ結果になる"""
+    storage = open_backend("store")
+    for index in order:
+        storage.import_records({MENU: RECORDS[index]})
+    record = storage.get(MENU)
+    expected = expected_record(RECORDS)
+    assert (record.last_a, record.last_b, record.best_a, record.best_b, record.last_ts) == (
+        expected.last_a, expected.last_b, expected.best_a, expected.best_b, expected.last_ts
+    )
+    # 書き込んで開き直しても同じ(ファイルを持たないバックエンドを除く)
+    if not isinstance(storage, MemoryStorage):
+        storage.flush()
+        assert open_backend("store").get(MENU) == record
+
+
+def test_newer_version_wins_over_newer_time(open_backend):
+    """更新番号の大きい記録は，時刻が古くても(時計のずれた端末の記録でも)lastとして残る"""
+    storage = open_backend("store")
+    storage.import_records({MENU: TrainingRecord(50, 10, 50, 10, last_ts=200.0, version=1)})
+    storage.import_records({MENU: TrainingRecord(40, 12, 45, 12, last_ts=100.0, version=2)})
+    storage.flush()
+    assert storage.get(MENU) == TrainingRecord(40, 12, 50, 12, last_ts=100.0, version=2)
+    # セットを反映すると更新番号が進む
+    assert storage.add_set(50.0, MENU, 30, 5).version == 3
+
+
+def test_sets_after_position_include_backfilled_sets(open_backend):
+    """追記順の位置より後のセットは，過去の日付のセットや整理(封印)の後でも漏れなく返す"""
+    storage = open_backend("store")
+    old = time.mktime((2024, 1, 1, 12, 0, 0, 0, 0, -1))
+    storage.add_sets([(time.time(), MENU, 50, 10)])
+    storage.flush()
+    position = storage.set_position()
+    backfilled = [(old, MENU, 40, 12), (old + 60, "レッグプレス", 80, 10)]
+    storage.add_sets(backfilled)
+    storage.compact()
+    # 封印で新しい世代へ移したセットは再び返すことがある
+    assert set(backfilled) <= set(storage.iter_sets_after(position))
+    assert storage.set_position() >= position + len(backfilled)
+    assert list(storage.iter_sets_after(storage.set_position())) == []
+
+
+def test_sqlite_writes_sets_on_flush(workspace):
+    """SQLiteはflush()まで書き込まず，それまでの読み込みには未書き込みのセットを含める"""
+    storage = SqliteStorage.in_directory(str(workspace / "store"))
+    storage.add_set(100.0, MENU, 50, 10)
+    storage.add_sets([(110.0, MENU, 55, 8), (120.0, "レッグプレス", 80, 10)])
+    assert storage.set_count() == 3
+    assert list(storage.iter_sets(MENU, since=105.0)) == [(110.0, MENU, 55, 8)]
+    assert storage.get(MENU) == TrainingRecord(55, 8, 55, 10, last_ts=110.0, version=2)
+
+    other = SqliteStorage.in_directory(str(workspace / "store"))
+    assert other.set_count() == 0 and other.get(MENU) is None
+    storage.flush()
+    assert other.refresh()
+    assert other.set_count() == 3
+    assert other.get(MENU) == storage.get(MENU)
+    # 書き込んだ後も二重には見えない
+    assert storage.set_count() == 3
+    assert len(list(storage.iter_sets())) == 3
+    other.close()
+    storage.close()
+
+
+def test_indexed_applies_updates_on_flush(workspace):
+    """インデックス付きファイルはflush()まで記録を書き換えず，それまでの読み込みには未反映の更新を重ねる"""
+    storage = IndexedStorage.in_directory(str(workspace / "store"))
+    storage.add_set(100.0, MENU, 50, 10)
+    storage.add_sets([(110.0, MENU, 55, 8), (120.0, "レッグプレス", 80, 10)])
+    assert storage.get(MENU) == TrainingRecord(55, 8, 55, 10, last_ts=110.0, version=2)
+    assert set(storage.records()) == {MENU, "レッグプレス"}
+
+    other = IndexedStorage.in_directory(str(workspace / "store"))
+    assert other.get(MENU) is None
+    storage.flush()
+    other.refresh()
+    assert other.get(MENU) == storage.get(MENU)
+    assert other.records() == storage.records()
+    other.close()
+    storage.close()
+
+
+def test_indexed_reader_waits_for_record_being_written(workspace):
+    """他のプロセスが書き換え中の記録(書き込み番号が奇数)は読まず，書き換え終わった値を返す"""
+    writer = IndexedStorage.in_directory(str(workspace / "store"))
+    writer.add_set(100.0, MENU, 50, 10)
+    writer.flush()
+    reader = IndexedStorage.in_directory(str(workspace / "store"))
+    key = MENU.encode("utf-8")
+    position = writer._find(key)[1] + IndexedStorage.NAME_LENGTH.size + len(key)
+
+    # 別のスレッドで書き込み途中の状態を作り，ロックを保持したまま少し後に書き終える
+    started = threading.Event()
+
+    def write_slowly():
+        with writer.file_lock:
+            sequence = IndexedStorage.SEQUENCE.unpack_from(writer._map, position)[0]
+            IndexedStorage.SEQUENCE.pack_into(writer._map, position, sequence + 1)
+            IndexedStorage.VALUES.pack_into(writer._map, position + IndexedStorage.SEQUENCE.size, -1, -1, -1, -1, -1, -1)
+            started.set()
+            threading.Event().wait(0.1)
+            writer._write_record(position, TrainingRecord(60, 12, 60, 12, last_ts=200.0))
+
+    thread = threading.Thread(target=write_slowly)
+    thread.start()
+    started.wait(5)
+    assert reader.get(MENU) == TrainingRecord(60, 12, 60, 12, last_ts=200.0)
+    thread.join()
+    reader.close()
+    writer.close()
+
+
+def test_sqlite_upgrades_schema(workspace):
+    """更新番号の無い(バージョン1の)データベースは，開いたときに列を追加する"""
+    path = str(workspace / SqliteStorage.FILE_PATH)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE records (menu TEXT PRIMARY KEY, last_a REAL NOT NULL, last_b REAL NOT NULL, "
+        "best_a REAL NOT NULL, best_b REAL NOT NULL, last_ts REAL NOT NULL) WITHOUT ROWID"
+    )
+    conn.execute("INSERT INTO records VALUES (?, 50, 10, 60, 12, 100.0)", (MENU,))
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+
+    storage = SqliteStorage(path)
+    assert storage.get(MENU) == TrainingRecord(50, 10, 60, 12, last_ts=100.0)
+    storage.add_set(200.0, MENU, 55, 10)
+    storage.flush()
+    storage.close()
+    storage = SqliteStorage(path)
+    assert storage.get(MENU) == TrainingRecord(55, 10, 60, 12, last_ts=200.0, version=1)
+    storage.close()
+
+
+def test_memory_budget_rejects_json(workspace, monkeypatch):
+    """メモリ予算モードとjsonの組み合わせは，ファイルを読み込む前に分かるメッセージで拒否する"""
+    monkeypatch.setattr(TrainingHistory, "MEMORY_BUDGET", 1 << 20)
+    with pytest.raises(ValueError, match="メモリ予算モード.*json.*BACKENDを\"sqlite\" / \"indexed\"にする"):
+        TrainingHistory()
+    assert not (workspace / JsonStorage.LOCK_PATH).exists()
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from history import TrainingHistory
+from profiles import ProfileManager
+from storage import open_storage
+from sync import SyncClient, SyncServer, SyncStore
+
+
+@pytest.fixture
+def server_url(workspace):
+    """一時ディレクトリに記録を保存する同期サーバーを起動し，そのURLを返す"""
+    server = SyncServer(("127.0.0.1", 0), SyncStore(str(workspace / "sync_server.json")))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def open_device(workspace):
+    """端末ごとのフォルダに履歴を開く関数(開いた履歴はテストの終了時に閉じる)"""
+    opened = []
+
+    def open_device(name):
+        directory = workspace / name
+        directory.mkdir(exist_ok=True)
+        history = TrainingHistory(storage=open_storage("json", directory=str(directory)))
+        opened.append(history)
+        return history, str(directory / SyncClient.STATE_PATH)
+
+    yield open_device
+    for history in opened:
+        history.close()
+
+
+def set_keys(history):
+    return sorted((timestamp, menu_name) for timestamp, menu_name, _, _ in history.iter_sets())
+
+
+def test_sets_are_exchanged_once(server_url, open_device, workspace, menu_name):
+    """記録したセットは他の端末へ届き，何回同期しても二重には記録されない"""
+    phone, phone_state = open_device("phone")
+    tablet, tablet_state = open_device("tablet")
+    phone.add_sets([(1000.0 + step, menu_name, 50.0 + step, 10.0) for step in range(3)])
+    tablet.add_sets([(2000.0, menu_name, 40.0, 12.0)])
+
+    result = SyncClient(phone, server_url, phone_state).sync()
+    assert (result.sent_sets, result.received_sets) == (3, 0)
+    result = SyncClient(tablet, server_url, tablet_state).sync()
+    assert (result.sent_sets, result.received_sets) == (1, 3)
+    result = SyncClient(phone, server_url, phone_state).sync()
+    assert result.received_sets == 1
+
+    # 同期後に記録したセットだけが次の同期で届く
+    tablet.add_sets([(3000.0, menu_name, 45.0, 12.0)])
+    for _ in range(2):
+        SyncClient(tablet, server_url, tablet_state).sync()
+        SyncClient(phone, server_url, phone_state).sync()
+    assert set_keys(phone) == set_keys(tablet)
+    assert phone.storage.set_count() == 5
+    assert phone.aggregates.menu(menu_name).count == 5
+    assert phone.get_record(menu_name) == tablet.get_record(menu_name)
+    # サーバーを起動し直してもセットを保持している
+    assert len(SyncStore(str(workspace / "sync_server.json")).sets) == 5
+
+
+def test_backfilled_sets_are_sent(server_url, open_device, menu_name):
+    """同期した後に過去の日付で記録したセットも，次の同期で他の端末へ届く(封印された後でも)"""
+    phone, phone_state = open_device("phone")
+    tablet, tablet_state = open_device("tablet")
+    phone.add_sets([(time.time(), menu_name, 50.0, 10.0)])
+    SyncClient(phone, server_url, phone_state).sync()
+    SyncClient(tablet, server_url, tablet_state).sync()
+
+    backfilled = (time.mktime((2024, 1, 1, 12, 0, 0, 0, 0, -1)), menu_name, 40.0, 12.0)
+    phone.add_sets([backfilled])
+    # 前月以前のセットは月ごとのセグメントへ封印される
+    phone.compact()
+    SyncClient(phone, server_url, phone_state).sync()
+    assert SyncClient(tablet, server_url, tablet_state).sync().received_sets == 1
+    assert backfilled in list(tablet.iter_sets())
+    assert set_keys(phone) == set_keys(tablet)
+
+
+def test_sync_state_is_kept_per_profile(server_url, workspace, menu_name):
+    """同期の状態はプロフィールごとのフォルダに保存し，サーバーでもプロフィールの記録は混ざらない"""
+    profiles = ProfileManager()
+    profiles.create("a")
+    profiles.open("a").add_sets([(1000.0, menu_name, 50.0, 10.0)])
+    for name in (ProfileManager.DEFAULT_PROFILE, "a"):
+        SyncClient(profiles.open(name), server_url, profiles.path_of(name, SyncClient.STATE_PATH), name).sync()
+    assert (workspace / SyncClient.STATE_PATH).exists()
+    assert (workspace / ProfileManager.PROFILE_DIR / "a" / SyncClient.STATE_PATH).exists()
+    assert profiles.open(ProfileManager.DEFAULT_PROFILE).storage.set_count() == 0
+    profiles.close()
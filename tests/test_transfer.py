@@ -0,0 +1,47 @@
+import io
+import random
+import time
+
+import pytest
+
+from history import TrainingHistory
+from storage import MemoryStorage
+from transfer import FORMATS, export_sets, import_sets
+
+
+@pytest.fixture
+def history(workspace):
+    """端末の時計で記録した(小数の時刻の)セットを持つ履歴"""
+    rng = random.Random(0)
+    history = TrainingHistory(storage=MemoryStorage())
+    menu_names = list(history.menu_manager.menus)[:3]
+    now = time.time()
+    history.add_sets([
+        (now - rng.uniform(0, 400 * 86400), rng.choice(menu_names), rng.randrange(10, 100) + 0.5, float(rng.randrange(1, 15)))
+        for _ in range(100)
+    ])
+    yield history
+    history.close()
+
+
+def exported(history, file_format):
+    f = io.StringIO()
+    export_sets(history, f, file_format)
+    return f.getvalue()
+
+
+@pytest.mark.parametrize("file_format", FORMATS)
+def test_import_of_export_is_idempotent(history, file_format):
+    """書き出したファイルを取り込んでも記録は増えず，別の履歴へ取り込むと同じセットになる"""
+    data = exported(history, file_format)
+    result = import_sets(history, io.StringIO(data), file_format)
+    assert (result.imported, result.duplicates, result.skipped) == (0, 100, 0)
+    assert history.storage.set_count() == 100
+
+    other = TrainingHistory(storage=MemoryStorage())
+    assert import_sets(other, io.StringIO(data), file_format, batch_size=30).imported == 100
+    assert sorted(other.iter_sets()) == sorted(history.iter_sets())
+    # 取り込み直しても変わらない
+    assert import_sets(other, io.StringIO(data), file_format).imported == 0
+    assert exported(other, file_format) == data
+    other.close()
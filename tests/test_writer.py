@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from history import TrainingHistory
+from storage import JsonStorage
+from writer import HistoryWriter
+
+
+def persisted_sets():
+    """ファイルに書き込まれたセット数(別のインスタンスで読み込む)"""
+    storage = JsonStorage()
+    try:
+        return storage.set_count()
+    finally:
+        storage.close()
+
+
+@pytest.fixture
+def open_history(workspace, monkeypatch):
+    """書き込みのタイミングを指定して履歴を開く関数"""
+    def open_history(durability, interval_ms=TrainingHistory.FLUSH_INTERVAL_MS):
+        monkeypatch.setattr(TrainingHistory, "DURABILITY", durability)
+        monkeypatch.setattr(TrainingHistory, "FLUSH_INTERVAL_MS", interval_ms)
+        return TrainingHistory(storage=JsonStorage())
+    return open_history
+
+
+def test_set_durability_writes_each_set(open_history, menu_name):
+    """1セットごとのモードでは，記録した時点でファイルに書き込まれている"""
+    history = open_history(HistoryWriter.DURABILITY_SET)
+    history.update_history(menu_name, 50, 10)
+    assert persisted_sets() == 1
+    history.close()
+
+
+def test_interval_durability_writes_after_interval(open_history, menu_name):
+    """間隔モードでは，記録してから間隔が過ぎると書き込まれる"""
+    history = open_history(HistoryWriter.DURABILITY_INTERVAL, interval_ms=10)
+    history.update_history(menu_name, 50, 10)
+    deadline = time.monotonic() + 5
+    while persisted_sets() == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert persisted_sets() == 1
+    history.close()
+
+
+def test_interval_durability_writes_on_close(open_history, menu_name):
+    """間隔モードでは，間隔が過ぎる前に閉じても待たずに残りを書き込む"""
+    history = open_history(HistoryWriter.DURABILITY_INTERVAL, interval_ms=60_000)
+    history.update_history(menu_name, 50, 10)
+    assert persisted_sets() == 0
+    start = time.monotonic()
+    history.close()
+    assert time.monotonic() - start < 5
+    assert persisted_sets() == 1
+
+
+def test_exit_durability_writes_only_on_close(open_history, menu_name):
+    """終了時モードでは，閉じるまで書き込まない"""
+    history = open_history(HistoryWriter.DURABILITY_EXIT)
+    history.update_history(menu_name, 50, 10)
+    history.update_history(menu_name, 55, 10)
+    assert persisted_sets() == 0
+    history.close()
+    assert persisted_sets() == 2
+
+
+def test_close_with_full_queue_does_not_block():
+    """キューが満杯でも，close()は書き込み中の処理が終われば戻る"""
+    release = threading.Event()
+    flushed = []
+
+    def flush():
+        release.wait(5)
+        flushed.append(time.monotonic())
+
+    writer = HistoryWriter(flush, HistoryWriter.DURABILITY_INTERVAL, interval_ms=0, max_pending=1)
+    writer.submit()
+    # 書き込みスレッドが要求を取り出して書き込み中になってから，キューを満杯にする
+    deadline = time.monotonic() + 5
+    while not writer.queue.empty() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    writer.submit()
+    assert writer.queue.full()
+
+    threading.Timer(0.1, release.set).start()
+    closer = threading.Thread(target=writer.close)
+    closer.start()
+    closer.join(5)
+    assert not closer.is_alive()
+    # 書き込み中だった分と，close()で書き込んだ残りの分
+    assert len(flushed) == 2
@@ -0,0 +1,183 @@
+# 起動処理・ユーザー操作の計測(トレース)
+# 名前付きの区間(span)の開始時刻と所要時間をリングバッファに記録し，
+# Chromeのトレースイベント形式(chrome://tracing や Perfetto で表示可能)で書き出す
+# 環境変数 TMENU_TRACE=1 または enable() で有効化する(無効時はほぼ何もしない)
+# メモリ使用量はtracemallocで計測する(環境変数 TMENU_TRACE_MEMORY=1 または enable_memory() で有効化．
+# 計測中はメモリの確保が遅くなるため既定では無効．tracemallocは起動を遅くしないよう有効化したときに読み込む)
+
+import os
+import json
+import threading
+import sys
+import time
+from collections import deque
+from functools import wraps
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+ENV_VAR = "TMENU_TRACE"
+MEMORY_ENV_VAR = "TMENU_TRACE_MEMORY"
+# 書き出し先(環境変数 TMENU_TRACE_PATH で変更可能)
+TRACE_PATH = os.environ.get("TMENU_TRACE_PATH", "trace.json")
+# リングバッファに保持するイベント数(古いものから捨てる)
+BUFFER_SIZE = 4096
+
+# (名前, 開始時刻ns, 所要時間ns, スレッドID, 引数)
+Event = Tuple[str, int, int, int, Optional[Dict[str, Any]]]
+
+_enabled = os.environ.get(ENV_VAR, "") not in ("", "0")
+_events: Deque[Event] = deque(maxlen=BUFFER_SIZE)
+_origin = time.perf_counter_ns()
+
+
+class _Span:
+    """計測区間(withで使う)"""
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name: str, args: Optional[Dict[str, Any]]):
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        end = time.perf_counter_ns()
+        _events.append((self.name, self.start, end - self.start, threading.get_ident(), self.args))
+
+
+class _NullSpan:
+    """無効時に使う何もしない計測区間"""
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enable(buffer_size: Optional[int] = None) -> None:
+    """トレースを有効にする"""
+    global _enabled, _events
+    if buffer_size is not None and buffer_size != _events.maxlen:
+        _events = deque(_events, maxlen=buffer_size)
+    _enabled = True
+
+
+def disable() -> None:
+    """トレースを無効にする"""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    """トレースが有効か"""
+    return _enabled
+
+
+def span(name: str, **args: Any):
+    """名前付きの計測区間を返す(with tracing.span("名前"): ...)"""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args or None)
+
+
+def traced(name: str) -> Callable:
+    """関数全体を計測区間にするデコレーター"""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instant(name: str, **args: Any) -> None:
+    """所要時間を持たない出来事を記録"""
+    if _enabled:
+        _events.append((name, time.perf_counter_ns(), 0, threading.get_ident(), args or None))
+
+
+def events() -> List[Event]:
+    """記録済みのイベントを返す"""
+    return list(_events)
+
+
+def clear() -> None:
+    """記録済みのイベントを破棄"""
+    _events.clear()
+
+
+def to_chrome_trace() -> Dict[str, Any]:
+    """記録済みのイベントをChromeのトレースイベント形式に変換"""
+    pid = os.getpid()
+    trace_events = []
+    for name, start, duration, tid, args in list(_events):
+        event = {
+            "name": name,
+            "ph": "X" if duration else "i",
+            "ts": (start - _origin) / 1000,
+            "pid": pid,
+            "tid": tid
+        }
+        if duration:
+            event["dur"] = duration / 1000
+        else:
+            event["s"] = "t"
+        if args:
+            event["args"] = args
+        trace_events.append(event)
+    return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+def enable_memory() -> None:
+    """tracemallocによるメモリ使用量の計測を開始する"""
+    import tracemalloc
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def is_memory_enabled() -> bool:
+    """メモリ使用量を計測中か(tracemallocが読み込まれていなければ計測していない)"""
+    tracemalloc = sys.modules.get("tracemalloc")
+    return tracemalloc is not None and tracemalloc.is_tracing()
+
+
+def memory_usage() -> Tuple[int, int]:
+    """計測開始以降に確保されているメモリの現在値と最大値(バイト)．計測していなければ(0, 0)"""
+    if not is_memory_enabled():
+        return 0, 0
+    return sys.modules["tracemalloc"].get_traced_memory()
+
+
+def memory_sample(name: str = "memory") -> None:
+    """現在のメモリ使用量をイベントとして記録(トレースとメモリ計測の両方が有効な場合のみ)"""
+    if _enabled and is_memory_enabled():
+        current, peak = memory_usage()
+        instant(name, current_kb=current // 1024, peak_kb=peak // 1024)
+
+
+def memory_report() -> str:
+    """メモリ使用量の現在値と最大値を表す文字列"""
+    current, peak = memory_usage()
+    return f"現在 {current / 1024:.1f} KB / 最大 {peak / 1024:.1f} KB"
+
+
+def export_chrome_trace(path: Optional[str] = None) -> str:
+    """Chromeのトレースイベント形式でファイルに書き出し，そのパスを返す"""
+    path = path or TRACE_PATH
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(to_chrome_trace(), f, ensure_ascii=False)
+    return path
+
+
+if os.environ.get(MEMORY_ENV_VAR, "") not in ("", "0"):
+    enable_memory()
@@ -0,0 +1,186 @@
+# トレーニング記録の一括取り込み・書き出し(CSV / JSONL)
+# 行の読み込み・メニュー名の変換・確認・バッチへの分割をジェネレーターでつなぎ，
+# バッチごとにまとめて記録して1回だけ書き込む
+# 書き出しも1セットずつ書き出すため，ファイルの大きさに関係なくメモリ使用量は一定
+#
+# ファイルの形式(1行1セット):
+#   CSV  : timestamp,menu,a,b のヘッダー付き(timestampはISO 8601形式かエポック秒)
+#          書き出しではtimestampをエポック秒で書き(取り込み直しても同じ時刻になり，記録済みとして除かれる)，
+#          確認用に時差付きのISO 8601形式の日時をdatetime列に添える(取り込みでは使わない)
+#   JSONL: {"timestamp": エポック秒, "menu": "メニュー名", "a": 50, "b": 10}
+#
+# 使い方:
+#   python transfer.py import 記録.csv
+#   python transfer.py export 記録.jsonl [--menu チェストプレス]
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+from menu_manager import MenuManager
+from history import TrainingHistory
+from set_log import SetRow
+
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+FORMATS = (FORMAT_CSV, FORMAT_JSONL)
+CSV_FIELDS = ("timestamp", "menu", "a", "b")
+CSV_EXPORT_FIELDS = CSV_FIELDS + ("datetime",)
+# 1回の書き込みでまとめて記録するセット数
+BATCH_SIZE = 1000
+
+# (行番号, 読み込んだ値)
+RawRow = Tuple[int, Dict[str, Any]]
+
+
+@dataclass
+class ImportResult:
+    """取り込みの結果を保持するデータクラス"""
+    imported: int = 0
+    skipped: int = 0
+    # 記録済みのセット(時刻とメニューが同じもの)のため取り込まなかった件数
+    duplicates: int = 0
+    batches: int = 0
+
+
+def format_of(path: str) -> str:
+    """拡張子からファイルの形式を判定"""
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in ("json", "jsonl", "ndjson"):
+        return FORMAT_JSONL
+    return FORMAT_CSV
+
+
+def read_csv(f: IO[str]) -> Iterator[RawRow]:
+    """CSVを1行ずつ読み込む"""
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(f: IO[str]) -> Iterator[RawRow]:
+    """JSONLを1行ずつ読み込む"""
+    for line_num, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except json.JSONDecodeError:
+            print(f"[警告] {line_num}行目: JSONとして読み込めないため読み飛ばしました。")
+
+
+def parse_timestamp(value: Any) -> float:
+    """エポック秒かISO 8601形式の日時を時刻にする(タイムゾーンが無ければ現地時間)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def validate(rows: Iterable[RawRow], menu_manager: MenuManager, result: ImportResult) -> Iterator[SetRow]:
+    """メニュー名を正式名に変換し，値を確認したセットだけを返す"""
+    # 同じメニュー名が何度も現れるため，変換結果を覚えておく
+    names: Dict[str, Optional[str]] = {}
+    for line_num, row in rows:
+        try:
+            raw_name = str(row["menu"]).strip()
+            timestamp = parse_timestamp(row["timestamp"])
+            a = float(row["a"])
+            b = float(row["b"])
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"[警告] {line_num}行目: 読み込めないため読み飛ばしました({e})。")
+            result.skipped += 1
+            continue
+
+        if raw_name not in names:
+            names[raw_name] = menu_manager.find_menu_by_tag_or_name(raw_name)
+            if names[raw_name] is None:
+                print(f"[警告] {line_num}行目: {raw_name} は存在しないメニューのため読み飛ばしました。")
+        menu_name = names[raw_name]
+        if menu_name is None or not all(map(math.isfinite, (timestamp, a, b))) or a < 0 or b < 0:
+            result.skipped += 1
+            continue
+        yield timestamp, menu_name, a, b
+
+
+def batched(rows: Iterable[SetRow], size: int) -> Iterator[List[SetRow]]:
+    """size件ずつのリストに分ける"""
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_sets(history: TrainingHistory, f: IO[str], file_format: str = FORMAT_CSV, batch_size: int = BATCH_SIZE) -> ImportResult:
+    """ファイルのセットを取り込む(バッチごとに1回書き込む)"""
+    if file_format not in FORMATS:
+        raise ValueError(f"不正な形式です: {file_format}")
+    result = ImportResult()
+    rows = read_csv(f) if file_format == FORMAT_CSV else read_jsonl(f)
+    for batch in batched(validate(rows, history.menu_manager, result), batch_size):
+        added = history.add_sets(batch)
+        result.imported += added
+        result.duplicates += len(batch) - added
+        result.batches += 1
+    return result
+
+
+def export_sets(history: TrainingHistory, f: IO[str], file_format: str = FORMAT_CSV, menu_name: Optional[str] = None) -> int:
+    """記録されたセットを書き出し，書き出した件数を返す"""
+    if file_format not in FORMATS:
+        raise ValueError(f"不正な形式です: {file_format}")
+    history.refresh()
+    count = 0
+    if file_format == FORMAT_CSV:
+        writer = csv.writer(f)
+        writer.writerow(CSV_EXPORT_FIELDS)
+        for timestamp, name, a, b in history.iter_sets(menu_name):
+            # ISO 8601形式はマイクロ秒までのため，時刻はエポック秒(repr)で書いて取り込み直したときに一致させる
+            writer.writerow((repr(timestamp), name, a, b, datetime.fromtimestamp(timestamp).astimezone().isoformat()))
+            count += 1
+    else:
+        for timestamp, name, a, b in history.iter_sets(menu_name):
+            f.write(json.dumps({"timestamp": timestamp, "menu": name, "a": a, "b": b}, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="トレーニング記録の一括取り込み・書き出し")
+    parser.add_argument("command", choices=("import", "export"), help="取り込み(import)か書き出し(export)か")
+    parser.add_argument("path", help="CSV / JSONLファイルのパス")
+    parser.add_argument("--format", choices=FORMATS, help="ファイルの形式(省略時は拡張子から判定)")
+    parser.add_argument("--menu", help="書き出すメニュー(省略時は全メニュー)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="1回の書き込みでまとめるセット数")
+    args = parser.parse_args()
+
+    file_format = args.format or format_of(args.path)
+    history = TrainingHistory()
+    try:
+        if args.command == "import":
+            with open(args.path, "r", encoding="utf-8", newline="") as f:
+                result = import_sets(history, f, file_format, args.batch_size)
+            print(f"[取り込み] {result.imported}セットを取り込みました(読み飛ばし: {result.skipped}件，記録済み: {result.duplicates}件)。")
+        else:
+            with open(args.path, "w", encoding="utf-8", newline="") as f:
+                count = export_sets(history, f, file_format, args.menu)
+            print(f"[書き出し] {count}セットを {args.path} へ書き出しました。")
+    finally:
+        history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# 履歴の書き込みをバックグラウンドで行うライター
+# 記録ボタンの処理ではキューへ通知するだけにし，ファイルへの書き込みは別スレッドでまとめて行う
+
+import atexit
+import queue
+import threading
+from typing import Callable
+
+
+class HistoryWriter:
+    """書き込み要求をまとめてバックグラウンドで反映するクラス"""
+    # 書き込みのタイミング
+    DURABILITY_SET = "set"            # 1セットごとに即座に書き込む(呼び出し元で待つ)
+    DURABILITY_INTERVAL = "interval"  # 要求からinterval_msミリ秒分まとめて書き込む
+    DURABILITY_EXIT = "exit"          # flush()/close()/終了時にだけ書き込む
+    DURABILITIES = (DURABILITY_SET, DURABILITY_INTERVAL, DURABILITY_EXIT)
+
+    def __init__(
+        self,
+        flush_func: Callable[[], None],
+        durability: str = DURABILITY_INTERVAL,
+        interval_ms: int = 500,
+        max_pending: int = 64
+    ):
+        """ライターを初期化し，必要であれば書き込みスレッドを開始"""
+        if durability not in self.DURABILITIES:
+            raise ValueError(f"不正な書き込みモードです: {durability}")
+
+        self.flush_func = flush_func
+        self.durability = durability
+        self.interval = interval_ms / 1000
+        # 未書き込みの要求数の上限(超えた場合は書き込みが追いつくまで待つ)
+        self.queue: "queue.Queue[bool]" = queue.Queue(maxsize=max_pending)
+        self._flush_lock = threading.Lock()
+        # 書き込みスレッドの停止の合図(キューは要求と，スレッドを起こすためだけに使う)
+        self._stop = threading.Event()
+        self._closed = False
+        self._thread = None
+
+        if durability == self.DURABILITY_INTERVAL:
+            self._thread = threading.Thread(target=self._run, name="HistoryWriter", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self) -> None:
+        """書き込み要求を登録"""
+        if self._closed or self.durability == self.DURABILITY_SET:
+            self.flush()
+            return
+
+        if self.durability == self.DURABILITY_INTERVAL:
+            self.queue.put(True)
+            return
+
+        # 終了時書き込みモードでは上限に達したときだけその場で書き込む
+        try:
+            self.queue.put_nowait(True)
+        except queue.Full:
+            self.flush()
+
+    def flush(self) -> None:
+        """未書き込みの内容をその場で書き込む"""
+        with self._flush_lock:
+            self._drain()
+            self.flush_func()
+
+    def close(self) -> None:
+        """書き込みスレッドを停止し，残りを書き込む"""
+        if self._closed:
+            return
+        self._closed = True
+        # 終了時の登録を外し，閉じたライター(と書き込み先の保存先)が解放されるようにする
+        atexit.unregister(self.close)
+        if self._thread is not None:
+            # 停止の合図はキューの上限に関係なく届ける(キューが満杯の場合はスレッドは待っていないため起こさなくてよい)
+            self._stop.set()
+            try:
+                self.queue.put_nowait(False)
+            except queue.Full:
+                pass
+            self._thread.join()
+        self.flush()
+
+    def _drain(self) -> None:
+        """キューに溜まった要求をすべて取り出す"""
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _run(self) -> None:
+        """書き込みスレッドの本体"""
+        # close()は停止の合図を立ててからキューで起こすため，起こす要求を書き込み中に取り出しても次の確認で止まる
+        while not self._stop.is_set():
+            self.queue.get()
+            # 短時間に続いた要求を1回の書き込みにまとめる(停止する場合の残りはclose()が書き込む)
+            if self._stop.wait(self.interval):
+                return
+            with self._flush_lock:
+                self._drain()
+                try:
+                    self.flush_func()
+                except Exception as e:
+                    print(f"[エラー] 履歴データの書き込みに失敗しました: {e}")